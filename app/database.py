@@ -1,11 +1,26 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from contextvars import ContextVar
+from typing import Callable, Optional
+import logging
 import os
+import time
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
 
 DB_PATH = os.getenv("CLEANING_DB_PATH", os.path.join(os.path.dirname(__file__), "..", "airbnb_cleaning.db"))
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.abspath(DB_PATH)}"
 
+# Queries at or above this many milliseconds are logged to "app.slow_query"; <= 0 disables
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+slow_query_log = logging.getLogger("app.slow_query")
+
+# Request scope of the HTTP request issuing queries (set by middleware in main.py)
+request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+# Per-request statement observer, e.g. the on-demand profiler: (statement, parameters, elapsed_ms)
+query_observer: ContextVar[Optional[Callable[[str, object, float], None]]] = ContextVar("query_observer", default=None)
+
 
 class Base(DeclarativeBase):
     pass
@@ -17,15 +32,71 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def route_label() -> str:
+    scope = request_scope.get()
+    if scope is None:
+        return "-"
+    route = scope.get("route")
+    return f"{scope.get('method', '')} {getattr(route, 'path', None) or scope.get('path', '')}"
+
+
+def params_shape(parameters) -> str:
+    """Parameter types and count only; values may be personal data."""
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f"{len(parameters)} x {params_shape(parameters[0])}"
+        return "(" + ", ".join(type(v).__name__ for v in parameters) + ")"
+    return type(parameters).__name__
+
+
+def _query_start(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _query_end(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+    observer = query_observer.get()
+    if observer is not None:
+        observer(statement, parameters, elapsed_ms)
+    if 0 < SLOW_QUERY_MS <= elapsed_ms:
+        slow_query_log.warning(
+            "slow query %.1fms route=%s params=%s sql=%s",
+            elapsed_ms, route_label(), params_shape(parameters), " ".join(statement.split()),
+        )
+
+
+def _query_failed(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def instrument(eng) -> None:
+    """Slow-query log and per-request observer hooks (also used for shard engines)."""
+    event.listen(eng, "before_cursor_execute", _query_start)
+    event.listen(eng, "after_cursor_execute", _query_end)
+    event.listen(eng, "handle_error", _query_failed)
+
+
+instrument(engine)
+
+
 def init_db():
-    from . import models  # ensure models are imported
-    Base.metadata.create_all(bind=engine)
+    """Bring the schema up to date; a single version check when already current."""
+    from .migrations import run_migrations
+    from .sharding import init_shards
+    applied = run_migrations(engine)
+    init_shards()
+    return applied
 
 
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    # Sharded: the session of the shard this request's principal or row lives on
+    from .sharding import SHARDS, request_session
+    db = request_session(request) if SHARDS else SessionLocal()
     try:
         yield db
     finally:
         db.close()
-
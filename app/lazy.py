@@ -0,0 +1,20 @@
+"""Deferred imports for heavy modules that most requests never touch."""
+from __future__ import annotations
+import importlib
+from types import ModuleType
+
+
+class LazyModule:
+    """Module proxy that imports ``name`` on first attribute access."""
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module: ModuleType | None = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
@@ -1,13 +1,26 @@
 from __future__ import annotations
 import os
+from datetime import timedelta
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import RedirectResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
-from .database import init_db
+from .database import init_db, request_scope, query_observer, route_label
 from .services.scheduler import SCHEDULER
+from .services.admission import ADMISSION, READ_METHODS, retry_after_header
+from .services.static_assets import CachedStaticFiles
+from .services.media_store import MEDIA_STORE, MediaFiles, collect_garbage
+from .services.profiling import RequestProfile
+from .services.dispatch import DISPATCH_INTERVAL, run_dispatch, shutdown_solver_pool
+from .services.notifications import OUTBOX_INTERVAL, drain as drain_outbox
+from .services.photos import PHOTO_SWEEP_INTERVAL, PHOTOS
 from .routers import auth as auth_router
+from .routers.auth import principal_key, is_admin_request
+from .routers import admin as admin_router
+from .routers import batch as batch_router
+from .routers import cleaners as cleaners_router
+from .routers import exports as exports_router
 from .routers import jobs as jobs_router
 from .routers import properties as properties_router
 from .database import SessionLocal
@@ -15,14 +28,121 @@ from . import models
 
 
 def ensure_media_dir() -> str:
-    root = os.path.dirname(os.path.dirname(__file__))
-    media_dir = os.path.join(root, "media")
-    os.makedirs(media_dir, exist_ok=True)
-    return media_dir
+    return MEDIA_STORE.ensure_root()
+
+
+MEDIA_GC_INTERVAL = int(os.getenv("MEDIA_GC_INTERVAL_SECONDS", "3600"))
+
+
+async def media_gc_tick() -> None:
+    """Incremental media GC; reschedules itself every MEDIA_GC_INTERVAL seconds."""
+    def _run() -> None:
+        db = SessionLocal()
+        try:
+            collect_garbage(db)
+        finally:
+            db.close()
+
+    try:
+        await run_in_threadpool(_run)
+    finally:
+        # A failed pass (e.g. database is locked) must not stop GC for good
+        SCHEDULER.schedule(timedelta(seconds=MEDIA_GC_INTERVAL), media_gc_tick)
+
+
+async def dispatch_tick() -> None:
+    """Batch dispatch pass; reschedules itself every DISPATCH_INTERVAL seconds."""
+    try:
+        await run_dispatch()
+    finally:
+        SCHEDULER.schedule(timedelta(seconds=DISPATCH_INTERVAL), dispatch_tick)
+
+
+async def outbox_tick() -> None:
+    """Deliver due notifications; reschedules itself every OUTBOX_INTERVAL seconds."""
+    try:
+        await drain_outbox()
+    finally:
+        SCHEDULER.schedule(timedelta(seconds=OUTBOX_INTERVAL), outbox_tick)
+
+
+async def photo_sweep_tick() -> None:
+    """Queue photos still waiting for variants (after a restart or a full queue);
+    reschedules itself every PHOTO_SWEEP_INTERVAL seconds."""
+    try:
+        await PHOTOS.sweep()
+    finally:
+        if PHOTO_SWEEP_INTERVAL > 0:
+            SCHEDULER.schedule(timedelta(seconds=PHOTO_SWEEP_INTERVAL), photo_sweep_tick)
 
 
 app = FastAPI(title="Airbnb Cleaning & Maintenance Micro-SaaS (MVP)")
 
+# Static mounts and probes are cheap and never touch the DB writer
+ADMISSION_EXEMPT_PREFIXES = ("/health", "/app", "/ui", "/media", "/docs", "/redoc", "/openapi.json")
+# POSTs that only read, and so count against the read limit
+READ_ONLY_POSTS = frozenset({"/batch"})
+
+
+def _error_response(status_code: int, message: str, headers: dict | None = None) -> JSONResponse:
+    return JSONResponse(status_code=status_code, headers=headers, content={
+        "error": {"code": status_code, "message": message}
+    })
+
+
+def _wants_profile(request: Request) -> bool:
+    return request.headers.get("x-profile") == "1" or request.query_params.get("profile") == "1"
+
+
+# Innermost middleware: exposes the request to the DB layer (slow-query log
+# route labels) and runs on-demand profiling for admins.
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    scope_token = request_scope.set(request.scope)
+    try:
+        if not _wants_profile(request):
+            return await call_next(request)
+        allowed = await run_in_threadpool(
+            is_admin_request, request.headers.get("authorization"), request.headers.get("x-demo-role"),
+        )
+        if not allowed:
+            return await call_next(request)
+        profile = RequestProfile(route=f"{request.method} {request.url.path}")
+        observer_token = query_observer.set(profile.on_query)
+        profile.start()
+        try:
+            response = await call_next(request)
+        finally:
+            profile.stop()
+            query_observer.reset(observer_token)
+        profile.route = route_label()
+        await run_in_threadpool(profile.save)
+        response.headers["X-Profile-Id"] = profile.id
+        response.headers["X-Profile-Url"] = f"/admin/profiles/{profile.id}"
+        return response
+    finally:
+        request_scope.reset(scope_token)
+
+
+# Registered before CORS so rejections still carry CORS headers
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    path = request.url.path
+    if not ADMISSION.enabled or path == "/" or path.startswith(ADMISSION_EXEMPT_PREFIXES):
+        return await call_next(request)
+    key = principal_key(request.headers.get("authorization"), request.client.host if request.client else None)
+    wait = ADMISSION.check(key)
+    if wait:
+        return _error_response(429, "Rate limit exceeded", retry_after_header(wait))
+    is_write = request.method not in READ_METHODS and path not in READ_ONLY_POSTS
+    if not ADMISSION.concurrency.try_enter(is_write):
+        return _error_response(503, "Server busy, retry later", retry_after_header(ADMISSION.shed_retry_after))
+    try:
+        return await call_next(request)
+    finally:
+        ADMISSION.concurrency.leave(is_write)
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -32,37 +152,58 @@ app.add_middleware(
 )
 
 
+DEMO_USERS = {
+    'demo_host@local': models.UserRole.host,
+    'demo_cleaner@local': models.UserRole.cleaner,
+    'demo_admin@local': models.UserRole.admin,
+}
+
+
+def ensure_demo_users() -> None:
+    """Demo users to bypass login when DEMO_MODE=true; one lookup when they exist."""
+    db = SessionLocal()
+    try:
+        existing = {e for (e,) in db.query(models.User.email).filter(models.User.email.in_(DEMO_USERS))}
+        for email, role in DEMO_USERS.items():
+            if email in existing:
+                continue
+            u = models.User(email=email, password_hash='x', role=role)
+            db.add(u); db.flush()
+            if role == models.UserRole.host:
+                db.add(models.Host(user_id=u.id, name='Demo Host'))
+            if role == models.UserRole.cleaner:
+                db.add(models.Cleaner(user_id=u.id, name='Demo Cleaner'))
+        db.commit()
+    finally:
+        db.close()
+
+
 @app.on_event("startup")
 async def on_startup() -> None:
     init_db()
     SCHEDULER.start()
     ensure_media_dir()
-    # Demo users to bypass login when DEMO_MODE=true
-    import os as _os
-    if _os.getenv('DEMO_MODE', 'false').lower() == 'true':
-        db = SessionLocal()
-        try:
-            def ensure_user(email: str, role: models.UserRole):
-                u = db.query(models.User).filter(models.User.email == email).first()
-                if not u:
-                    u = models.User(email=email, password_hash='x', role=role)
-                    db.add(u); db.flush()
-                    if role == models.UserRole.host:
-                        db.add(models.Host(user_id=u.id, name='Demo Host'))
-                    if role == models.UserRole.cleaner:
-                        db.add(models.Cleaner(user_id=u.id, name='Demo Cleaner'))
-                return u
-            ensure_user('demo_host@local', models.UserRole.host)
-            ensure_user('demo_cleaner@local', models.UserRole.cleaner)
-            ensure_user('demo_admin@local', models.UserRole.admin)
-            db.commit()
-        finally:
-            db.close()
+    for route in app.routes:
+        if isinstance(getattr(route, "app", None), CachedStaticFiles):
+            await run_in_threadpool(route.app.write_siblings)
+    if MEDIA_GC_INTERVAL > 0:
+        SCHEDULER.schedule(timedelta(seconds=MEDIA_GC_INTERVAL), media_gc_tick)
+    if DISPATCH_INTERVAL > 0:
+        SCHEDULER.schedule(timedelta(seconds=DISPATCH_INTERVAL), dispatch_tick)
+    if OUTBOX_INTERVAL > 0:
+        SCHEDULER.schedule(timedelta(seconds=OUTBOX_INTERVAL), outbox_tick)
+    if PHOTOS.enabled:
+        PHOTOS.start()
+        SCHEDULER.schedule(timedelta(0), photo_sweep_tick)
+    if os.getenv('DEMO_MODE', 'false').lower() == 'true':
+        ensure_demo_users()
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
     SCHEDULER.stop()
+    shutdown_solver_pool()
+    PHOTOS.stop()
 
 
 # Consistent error envelope for HTTPExceptions
@@ -70,34 +211,36 @@ async def on_shutdown() -> None:
 async def generic_exception_handler(request: Request, exc: Exception):
     from fastapi import HTTPException
     if isinstance(exc, HTTPException):
-        return JSONResponse(status_code=exc.status_code, content={
-            "error": {
-                "code": exc.status_code,
-                "message": exc.detail if isinstance(exc.detail, str) else "HTTP error",
-            }
-        })
+        return _error_response(
+            exc.status_code,
+            exc.detail if isinstance(exc.detail, str) else "HTTP error",
+            getattr(exc, "headers", None),
+        )
     # Unhandled
-    return JSONResponse(status_code=500, content={
-        "error": {"code": 500, "message": "Internal Server Error"}
-    })
+    return _error_response(500, "Internal Server Error")
 
 
 app.include_router(auth_router.router, prefix="/auth", tags=["auth"])
 app.include_router(properties_router.router, prefix="/properties", tags=["properties"])
 app.include_router(jobs_router.router, prefix="/jobs", tags=["jobs"])
+app.include_router(cleaners_router.router, prefix="/cleaners", tags=["cleaners"])
+app.include_router(admin_router.router, prefix="/admin", tags=["admin"])
+app.include_router(exports_router.router, prefix="/exports", tags=["exports"])
+app.include_router(batch_router.router, tags=["batch"])
+batch_router.batch_routes(app)  # checks the batch whitelist at startup
 
 # Serve uploaded media
 media_path = ensure_media_dir()
-app.mount("/media", StaticFiles(directory=media_path), name="media")
+app.mount("/media", MediaFiles(directory=media_path), name="media")
 
 # Serve minimal UI for demo at /ui and redirect root to it
 root_dir = os.path.dirname(os.path.dirname(__file__))
 ui_dir = os.path.join(root_dir, "ui")
 frontend_dist = os.path.join(root_dir, "frontend", "dist")
 os.makedirs(ui_dir, exist_ok=True)
-app.mount("/ui", StaticFiles(directory=ui_dir, html=True), name="ui")
+app.mount("/ui", CachedStaticFiles(directory=ui_dir, html=True), name="ui")
 if os.path.isdir(frontend_dist):
-    app.mount("/app", StaticFiles(directory=frontend_dist, html=True), name="app")
+    app.mount("/app", CachedStaticFiles(directory=frontend_dist, html=True), name="app")
 
 
 @app.get("/")
@@ -0,0 +1,334 @@
+"""
+Ordered, versioned schema migrations.
+
+`schema_version` records applied versions. On boot, `run_migrations` does a
+single `SELECT MAX(version)`; if it matches the latest migration nothing else
+runs, so warm replicas skip `create_all` and its per-table reflection.
+
+Add new migrations to the end of MIGRATIONS and never edit applied ones. The
+baseline is frozen DDL, so every later migration really runs on a fresh
+database as well. Replicas that boot together take turns on a lock file next to
+the database (`_migration_lock`) and re-check the version once they hold it.
+Statements should still be idempotent (`IF NOT EXISTS`, check before `ALTER`):
+a crash between a migration and its version row re-runs it.
+
+Migrations run on the catalog. Shard files (app/sharding.py) are created from
+the models' shard tables, so a migration that changes one of those tables must
+also be applied to each existing shard file (`on_shard_files`).
+"""
+from __future__ import annotations
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterator, NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+try:  # POSIX
+    import fcntl
+except ImportError:  # pragma: no cover – depends on platform
+    fcntl = None
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Engine], None]
+
+
+# The schema before versioning existed, frozen: later migrations then run for
+# real on a fresh database too, the same as on an old one. Never edit.
+BASELINE_DDL = [
+    """CREATE TABLE IF NOT EXISTS users (
+        id INTEGER NOT NULL, email VARCHAR(255) NOT NULL, password_hash VARCHAR(255) NOT NULL,
+        role VARCHAR(7) NOT NULL, api_token VARCHAR(255), created_at DATETIME NOT NULL,
+        PRIMARY KEY (id), UNIQUE (api_token))""",
+    "CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)",
+    """CREATE TABLE IF NOT EXISTS media_blobs (
+        id INTEGER NOT NULL, digest VARCHAR(64) NOT NULL, path VARCHAR(512) NOT NULL, size INTEGER NOT NULL,
+        ref_count INTEGER NOT NULL, created_at DATETIME NOT NULL, orphaned_at DATETIME,
+        PRIMARY KEY (id), UNIQUE (digest), UNIQUE (path))""",
+    "CREATE INDEX IF NOT EXISTS ix_media_blobs_orphaned_at ON media_blobs (orphaned_at)",
+    """CREATE TABLE IF NOT EXISTS hosts (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL, name VARCHAR(255), phone VARCHAR(50),
+        PRIMARY KEY (id), UNIQUE (user_id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    """CREATE TABLE IF NOT EXISTS cleaners (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL, name VARCHAR(255), phone VARCHAR(50),
+        avg_rating FLOAT, ratings_count INTEGER NOT NULL,
+        PRIMARY KEY (id), UNIQUE (user_id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    """CREATE TABLE IF NOT EXISTS properties (
+        id INTEGER NOT NULL, host_id INTEGER NOT NULL, name VARCHAR(255) NOT NULL, address TEXT NOT NULL,
+        PRIMARY KEY (id), FOREIGN KEY(host_id) REFERENCES hosts (id))""",
+    "CREATE INDEX IF NOT EXISTS ix_properties_host_id ON properties (host_id)",
+    """CREATE TABLE IF NOT EXISTS cleaning_jobs (
+        id INTEGER NOT NULL, property_id INTEGER NOT NULL, booking_start DATETIME NOT NULL,
+        booking_end DATETIME NOT NULL, status VARCHAR(11) NOT NULL, cleaner_id INTEGER,
+        created_at DATETIME NOT NULL, completed_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(property_id) REFERENCES properties (id),
+        FOREIGN KEY(cleaner_id) REFERENCES cleaners (id))""",
+    "CREATE INDEX IF NOT EXISTS ix_cleaning_jobs_property_id ON cleaning_jobs (property_id)",
+    """CREATE TABLE IF NOT EXISTS checklist_items (
+        id INTEGER NOT NULL, job_id INTEGER NOT NULL, text VARCHAR(255) NOT NULL, checked BOOLEAN NOT NULL,
+        checked_at DATETIME, photo_path VARCHAR(512),
+        PRIMARY KEY (id), FOREIGN KEY(job_id) REFERENCES cleaning_jobs (id))""",
+    "CREATE INDEX IF NOT EXISTS ix_checklist_items_photo_path ON checklist_items (photo_path)",
+    "CREATE INDEX IF NOT EXISTS ix_checklist_items_job_id ON checklist_items (job_id)",
+    """CREATE TABLE IF NOT EXISTS ratings (
+        id INTEGER NOT NULL, job_id INTEGER NOT NULL, host_id INTEGER NOT NULL, cleaner_id INTEGER NOT NULL,
+        stars INTEGER NOT NULL, feedback TEXT, created_at DATETIME NOT NULL,
+        PRIMARY KEY (id), UNIQUE (job_id), FOREIGN KEY(job_id) REFERENCES cleaning_jobs (id),
+        FOREIGN KEY(host_id) REFERENCES hosts (id), FOREIGN KEY(cleaner_id) REFERENCES cleaners (id))""",
+]
+
+
+def run_ddl(engine: Engine, statements: list[str]) -> None:
+    with engine.begin() as conn:
+        for ddl in statements:
+            conn.exec_driver_sql(ddl)
+
+
+def _baseline(engine: Engine) -> None:
+    run_ddl(engine, BASELINE_DDL)
+
+
+def _wal_journal(engine: Engine) -> None:
+    # Readers no longer block on the writer (or on index builds below)
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+
+JOB_INDEXES = [
+    ("ix_checklist_items_photo_path", "checklist_items", "photo_path"),
+    ("ix_cleaning_jobs_status_booking_start", "cleaning_jobs", "status, booking_start"),
+    ("ix_cleaning_jobs_cleaner_id_created_at", "cleaning_jobs", "cleaner_id, created_at"),
+    ("ix_cleaning_jobs_property_id_created_at", "cleaning_jobs", "property_id, created_at"),
+    ("ix_cleaning_jobs_created_at", "cleaning_jobs", "created_at"),
+]
+
+
+def create_indexes(engine: Engine, indexes: list[tuple[str, str, str]]) -> None:
+    """Build indexes one short transaction at a time so writers queue behind
+    each build briefly instead of behind the whole batch; WAL keeps readers
+    unblocked throughout."""
+    for name, table, columns in indexes:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def _job_host_id(engine: Engine) -> None:
+    with engine.begin() as conn:
+        columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(cleaning_jobs)")}
+        if "host_id" not in columns:
+            conn.exec_driver_sql("ALTER TABLE cleaning_jobs ADD COLUMN host_id INTEGER REFERENCES hosts(id)")
+    backfill_job_host_ids(engine)
+    create_indexes(engine, [("ix_cleaning_jobs_host_id_created_at", "cleaning_jobs", "host_id, created_at")])
+
+
+def backfill_job_host_ids(engine: Engine, batch_size: int = 5000) -> None:
+    """Copy properties.host_id onto jobs in id-ranged batches to keep write locks short."""
+    with engine.connect() as conn:
+        max_id = conn.exec_driver_sql("SELECT COALESCE(MAX(id), 0) FROM cleaning_jobs").scalar()
+    for lo in range(0, max_id, batch_size):
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "UPDATE cleaning_jobs SET host_id = (SELECT host_id FROM properties WHERE properties.id = cleaning_jobs.property_id) "
+                "WHERE id > ? AND id <= ? AND host_id IS NULL",
+                (lo, lo + batch_size),
+            )
+
+
+def add_columns(engine: Engine, table: str, columns: list[tuple[str, str]]) -> None:
+    with engine.begin() as conn:
+        existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+        for name, ddl in columns:
+            if name not in existing:
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+
+
+def _locations(engine: Engine) -> None:
+    # Optional coordinates used by the dispatch engine's distance scoring
+    for table in ("properties", "cleaners"):
+        add_columns(engine, table, [("latitude", "FLOAT"), ("longitude", "FLOAT")])
+
+
+def _active_schedule_index(engine: Engine) -> None:
+    # Partial: only claimed/in-progress windows, so overlap checks never wade
+    # through a cleaner's completed history
+    from .services.claims import ACTIVE_SCHEDULE_WHERE
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_cleaning_jobs_active_schedule "
+            f"ON cleaning_jobs (cleaner_id, booking_end) WHERE {ACTIVE_SCHEDULE_WHERE}"
+        )
+
+
+# Frozen like the baseline: the tables as these migrations first created them,
+# whatever the models say later
+OUTBOX_DDL = [
+    """CREATE TABLE IF NOT EXISTS notification_outbox (
+        id INTEGER NOT NULL, recipient_id INTEGER NOT NULL, kind VARCHAR(32) NOT NULL, job_id INTEGER,
+        payload TEXT NOT NULL, status VARCHAR(7) NOT NULL, attempts INTEGER NOT NULL,
+        created_at DATETIME NOT NULL, next_attempt_at DATETIME NOT NULL, sent_at DATETIME, last_error TEXT,
+        PRIMARY KEY (id), FOREIGN KEY(recipient_id) REFERENCES users (id),
+        FOREIGN KEY(job_id) REFERENCES cleaning_jobs (id))""",
+    "CREATE INDEX IF NOT EXISTS ix_notification_outbox_due ON notification_outbox (next_attempt_at) WHERE status = 'pending'",
+    "CREATE INDEX IF NOT EXISTS ix_notification_outbox_recipient_due "
+    "ON notification_outbox (recipient_id, next_attempt_at) WHERE status = 'pending'",
+]
+
+PAYOUTS_DDL = [
+    """CREATE TABLE IF NOT EXISTS payout_runs (
+        id INTEGER NOT NULL, period_start DATETIME NOT NULL, period_end DATETIME NOT NULL,
+        cleaners INTEGER NOT NULL, jobs INTEGER NOT NULL, amount_cents INTEGER NOT NULL,
+        created_at DATETIME NOT NULL, finished_at DATETIME,
+        PRIMARY KEY (id), CONSTRAINT uq_payout_runs_period UNIQUE (period_start, period_end))""",
+    """CREATE TABLE IF NOT EXISTS payouts (
+        id INTEGER NOT NULL, run_id INTEGER NOT NULL, cleaner_id INTEGER NOT NULL, jobs INTEGER NOT NULL,
+        base_cents INTEGER NOT NULL, bonus_cents INTEGER NOT NULL, amount_cents INTEGER NOT NULL,
+        status VARCHAR(7) NOT NULL, attempts INTEGER NOT NULL, payment_ref VARCHAR(255), last_error TEXT,
+        paid_at DATETIME,
+        PRIMARY KEY (id), CONSTRAINT uq_payouts_run_cleaner UNIQUE (run_id, cleaner_id),
+        FOREIGN KEY(run_id) REFERENCES payout_runs (id), FOREIGN KEY(cleaner_id) REFERENCES cleaners (id))""",
+    "CREATE INDEX IF NOT EXISTS ix_payouts_cleaner_id ON payouts (cleaner_id)",
+    "CREATE INDEX IF NOT EXISTS ix_payouts_pending ON payouts (run_id, id) WHERE status = 'pending'",
+]
+
+
+def _payouts(engine: Engine) -> None:
+    add_columns(engine, "properties", [("payout_rate_cents", "INTEGER")])
+    # Pay periods select completed jobs by completed_at
+    create_indexes(engine, [("ix_cleaning_jobs_completed_at", "cleaning_jobs", "completed_at")])
+    run_ddl(engine, PAYOUTS_DDL)
+
+
+def on_shard_files(apply: Callable[[Engine], None]) -> None:
+    """Run ``apply`` on every shard file that already exists; new ones are
+    created from the models."""
+    from sqlalchemy import create_engine
+    from .sharding import SHARDS, shard_path
+    for shard in range(1, SHARDS + 1):
+        if not os.path.exists(shard_path(shard)):
+            continue
+        # Bare engine: with the catalog attached, PRAGMA table_info would see its tables
+        bare = create_engine(f"sqlite:///{shard_path(shard)}")
+        try:
+            apply(bare)
+        finally:
+            bare.dispose()
+
+
+PHOTO_COLUMNS = [
+    ("photo_status", "VARCHAR(7)"),
+    ("photo_size", "INTEGER"),
+    ("photo_width", "INTEGER"),
+    ("photo_height", "INTEGER"),
+    ("photo_thumb_path", "VARCHAR(512)"),
+    ("photo_web_path", "VARCHAR(512)"),
+]
+
+
+def _add_photo_columns(engine: Engine) -> None:
+    # Existing photos queue for variants like new uploads
+    add_columns(engine, "checklist_items", PHOTO_COLUMNS)
+    with engine.connect() as conn:
+        max_id = conn.exec_driver_sql("SELECT COALESCE(MAX(id), 0) FROM checklist_items").scalar()
+    for lo in range(0, max_id, 50_000):
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "UPDATE checklist_items SET photo_status = 'pending' "
+                "WHERE id > ? AND id <= ? AND photo_path LIKE '/media/%' AND photo_status IS NULL",
+                (lo, lo + 50_000),
+            )
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_checklist_items_photo_pending "
+            "ON checklist_items (photo_path) WHERE photo_status = 'pending'"
+        )
+
+
+def _photo_variants(engine: Engine) -> None:
+    _add_photo_columns(engine)
+    on_shard_files(_add_photo_columns)
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "baseline", _baseline),
+    Migration(2, "wal_journal", _wal_journal),
+    Migration(3, "job_indexes", lambda engine: create_indexes(engine, JOB_INDEXES)),
+    Migration(4, "job_host_id", _job_host_id),
+    Migration(5, "locations", _locations),
+    Migration(6, "active_schedule_index", _active_schedule_index),
+    # Host exports walk one host's jobs in id order (resume by last-seen id)
+    Migration(7, "job_host_id_index", lambda engine: create_indexes(engine, [("ix_cleaning_jobs_host_id", "cleaning_jobs", "host_id")])),
+    Migration(8, "notification_outbox", lambda engine: run_ddl(engine, OUTBOX_DDL)),
+    Migration(9, "payouts", _payouts),
+    # Optional per-host sharding (app/sharding.py); 0 keeps the host in this file
+    Migration(10, "host_shard", lambda engine: add_columns(engine, "hosts", [("shard", "INTEGER NOT NULL DEFAULT 0")])),
+    Migration(11, "photo_variants", _photo_variants),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(conn: Connection) -> int:
+    try:
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    except OperationalError:  # table does not exist yet
+        return 0
+
+
+@contextmanager
+def _migration_lock(engine: Engine) -> Iterator[None]:
+    """Hold an exclusive lock on ``<database>.migrate-lock`` while migrating.
+
+    A file lock rather than a SQLite write transaction: migrations commit in
+    many short transactions (index builds, batched backfills) on their own
+    connections. Without fcntl (Windows) replicas are not serialised.
+    """
+    path = engine.url.database
+    if fcntl is None or not path or path == ":memory:":
+        yield
+        return
+    with open(f"{path}.migrate-lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def run_migrations(engine: Engine) -> list[int]:
+    """Apply pending migrations in order; returns the versions applied."""
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version >= LATEST_VERSION:
+        return []
+    with _migration_lock(engine):
+        return _migrate(engine)
+
+
+def _migrate(engine: Engine) -> list[int]:
+    # Another replica may have migrated while we waited for the lock
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version >= LATEST_VERSION:
+        return []
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, applied_at DATETIME NOT NULL)"
+        )
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        migration.apply(engine)
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": migration.version, "n": migration.name, "t": datetime.utcnow()},
+            )
+        applied.append(migration.version)
+    return applied
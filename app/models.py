@@ -13,6 +13,9 @@ from sqlalchemy import (
     Boolean,
     Text,
     Float,
+    Index,
+    UniqueConstraint,
+    text,
 )
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
@@ -44,6 +47,8 @@ class Host(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), unique=True)
     name: Mapped[Optional[str]] = mapped_column(String(255))
     phone: Mapped[Optional[str]] = mapped_column(String(50))
+    # Shard holding this host's properties and jobs; 0 is the catalog (migration 10)
+    shard: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
 
     user: Mapped[User] = relationship("User", back_populates="host_profile")
     properties: Mapped[list[Property]] = relationship("Property", back_populates="host")
@@ -57,6 +62,9 @@ class Cleaner(Base):
     phone: Mapped[Optional[str]] = mapped_column(String(50))
     avg_rating: Mapped[Optional[float]] = mapped_column(Float, default=0)
     ratings_count: Mapped[int] = mapped_column(Integer, default=0)
+    # Home base for dispatch distance scoring; unknown when NULL (migration 5)
+    latitude: Mapped[Optional[float]] = mapped_column(Float)
+    longitude: Mapped[Optional[float]] = mapped_column(Float)
 
     user: Mapped[User] = relationship("User", back_populates="cleaner_profile")
     jobs: Mapped[list[CleaningJob]] = relationship("CleaningJob", back_populates="cleaner")
@@ -68,6 +76,10 @@ class Property(Base):
     host_id: Mapped[int] = mapped_column(ForeignKey("hosts.id"), index=True)
     name: Mapped[str] = mapped_column(String(255))
     address: Mapped[str] = mapped_column(Text)
+    latitude: Mapped[Optional[float]] = mapped_column(Float)
+    longitude: Mapped[Optional[float]] = mapped_column(Float)
+    # Paid to the cleaner per completed job; PAYOUT_DEFAULT_RATE_CENTS when NULL (migration 9)
+    payout_rate_cents: Mapped[Optional[int]] = mapped_column(Integer)
 
     host: Mapped[Host] = relationship("Host", back_populates="properties")
     jobs: Mapped[list[CleaningJob]] = relationship("CleaningJob", back_populates="property")
@@ -84,6 +96,8 @@ class CleaningJob(Base):
     __tablename__ = "cleaning_jobs"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     property_id: Mapped[int] = mapped_column(ForeignKey("properties.id"), index=True)
+    # Copy of property.host_id so a host's job list is one index range (migration 4)
+    host_id: Mapped[Optional[int]] = mapped_column(ForeignKey("hosts.id"))
     booking_start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     booking_end: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     status: Mapped[JobStatus] = mapped_column(SAEnum(JobStatus), default=JobStatus.open)
@@ -96,6 +110,31 @@ class CleaningJob(Base):
     checklist_items: Mapped[list[ChecklistItem]] = relationship("ChecklistItem", back_populates="job", cascade="all, delete-orphan")
     rating: Mapped[Optional[Rating]] = relationship("Rating", back_populates="job", uselist=False)
 
+    # Mirrors migrations 3, 4, 6, 7 and 9 (app/migrations.py) so fresh databases match migrated ones
+    __table_args__ = (
+        Index("ix_cleaning_jobs_host_id_created_at", "host_id", "created_at"),
+        Index("ix_cleaning_jobs_status_booking_start", "status", "booking_start"),
+        Index("ix_cleaning_jobs_cleaner_id_created_at", "cleaner_id", "created_at"),
+        Index("ix_cleaning_jobs_property_id_created_at", "property_id", "created_at"),
+        Index("ix_cleaning_jobs_created_at", "created_at"),
+        Index("ix_cleaning_jobs_host_id", "host_id"),
+        Index("ix_cleaning_jobs_completed_at", "completed_at"),
+        Index(
+            "ix_cleaning_jobs_active_schedule", "cleaner_id", "booking_end",
+            sqlite_where=text("status IN ('claimed', 'in_progress')"),
+        ),
+    )
+
+
+class PhotoStatus(str, Enum):
+    pending = "pending"  # variants not rendered yet; clients fall back to the original
+    ready = "ready"
+    failed = "failed"  # not a decodable image; only the original is served
+
+
+# Module level: inside ChecklistItem, ``text`` is the column
+PHOTO_PENDING_WHERE = text("photo_status = 'pending'")
+
 
 class ChecklistItem(Base):
     __tablename__ = "checklist_items"
@@ -104,10 +143,22 @@ class ChecklistItem(Base):
     text: Mapped[str] = mapped_column(String(255), nullable=False)
     checked: Mapped[bool] = mapped_column(Boolean, default=False)
     checked_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
-    photo_path: Mapped[Optional[str]] = mapped_column(String(512))
+    photo_path: Mapped[Optional[str]] = mapped_column(String(512), index=True)
+    # Derived images (app/services/photos.py); migration 11
+    photo_status: Mapped[Optional[PhotoStatus]] = mapped_column(SAEnum(PhotoStatus))
+    photo_size: Mapped[Optional[int]] = mapped_column(Integer)  # bytes of the original
+    photo_width: Mapped[Optional[int]] = mapped_column(Integer)
+    photo_height: Mapped[Optional[int]] = mapped_column(Integer)
+    photo_thumb_path: Mapped[Optional[str]] = mapped_column(String(512))
+    photo_web_path: Mapped[Optional[str]] = mapped_column(String(512))
 
     job: Mapped[CleaningJob] = relationship("CleaningJob", back_populates="checklist_items")
 
+    __table_args__ = (
+        # Photos still waiting for variants, re-queued at startup
+        Index("ix_checklist_items_photo_pending", "photo_path", sqlite_where=PHOTO_PENDING_WHERE),
+    )
+
 
 class Rating(Base):
     __tablename__ = "ratings"
@@ -121,3 +172,92 @@ class Rating(Base):
 
     job: Mapped[CleaningJob] = relationship("CleaningJob", back_populates="rating")
 
+
+class MediaBlob(Base):
+    """Content-addressed media file; ref_count mirrors ChecklistItem.photo_path references."""
+    __tablename__ = "media_blobs"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    digest: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    path: Mapped[str] = mapped_column(String(512), unique=True, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    ref_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # Set when ref_count drops to 0; GC reclaims after a grace period
+    orphaned_at: Mapped[Optional[datetime]] = mapped_column(DateTime, index=True)
+
+
+class OutboxStatus(str, Enum):
+    pending = "pending"
+    sent = "sent"
+    skipped = "skipped"  # e.g. a reminder for a job completed before it was due
+    dead = "dead"  # gave up after OUTBOX_MAX_ATTEMPTS
+
+
+class OutboxMessage(Base):
+    """Notification written in the same transaction as the change it reports;
+    delivered later, coalesced per recipient (app/services/notifications.py)."""
+    __tablename__ = "notification_outbox"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    recipient_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    job_id: Mapped[Optional[int]] = mapped_column(ForeignKey("cleaning_jobs.id"))
+    payload: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    status: Mapped[OutboxStatus] = mapped_column(SAEnum(OutboxStatus), default=OutboxStatus.pending, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+
+    # Partial: delivered history never slows down finding what is due (migration 8)
+    __table_args__ = (
+        Index("ix_notification_outbox_due", "next_attempt_at", sqlite_where=text("status = 'pending'")),
+        Index(
+            "ix_notification_outbox_recipient_due", "recipient_id", "next_attempt_at",
+            sqlite_where=text("status = 'pending'"),
+        ),
+    )
+
+
+class PayoutRun(Base):
+    """One pay period's computed ledger; at most one run per period (app/services/payouts.py)."""
+    __tablename__ = "payout_runs"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    period_start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    period_end: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    cleaners: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    jobs: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    amount_cents: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime)  # every payout paid or failed
+
+    __table_args__ = (UniqueConstraint("period_start", "period_end", name="uq_payout_runs_period"),)
+
+
+class PayoutStatus(str, Enum):
+    pending = "pending"
+    paid = "paid"
+    failed = "failed"  # gave up after PAYOUT_MAX_ATTEMPTS
+
+
+class Payout(Base):
+    """A cleaner's total for one run; its id is the payment idempotency key."""
+    __tablename__ = "payouts"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    run_id: Mapped[int] = mapped_column(ForeignKey("payout_runs.id"), nullable=False)
+    cleaner_id: Mapped[int] = mapped_column(ForeignKey("cleaners.id"), nullable=False, index=True)
+    jobs: Mapped[int] = mapped_column(Integer, nullable=False)
+    base_cents: Mapped[int] = mapped_column(Integer, nullable=False)
+    bonus_cents: Mapped[int] = mapped_column(Integer, nullable=False)
+    amount_cents: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[PayoutStatus] = mapped_column(SAEnum(PayoutStatus), default=PayoutStatus.pending, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    payment_ref: Mapped[Optional[str]] = mapped_column(String(255))
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+    paid_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+    # (run_id, cleaner_id) unique: recomputing a period can never pay a cleaner twice
+    __table_args__ = (
+        UniqueConstraint("run_id", "cleaner_id", name="uq_payouts_run_cleaner"),
+        Index("ix_payouts_pending", "run_id", "id", sqlite_where=text("status = 'pending'")),
+    )
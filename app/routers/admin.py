@@ -0,0 +1,100 @@
+from __future__ import annotations
+import os
+import re
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import get_db
+from ..schemas import naive_utc
+from .auth import require_role
+from ..services.profiling import list_profiles, profile_path
+from ..services.dispatch import run_dispatch
+from ..services.notifications import drain, outbox_stats
+from ..services.payouts import compute, last_week, pay, run_status
+from ..services.photos import photo_stats
+
+
+router = APIRouter()
+
+
+@router.get("/profiles")
+def profiles(user: models.User = Depends(require_role(models.UserRole.admin))):
+    return list_profiles()
+
+
+@router.get("/profiles/{profile_id}")
+def download_profile(profile_id: str, user: models.User = Depends(require_role(models.UserRole.admin))):
+    if not re.fullmatch(r"[0-9a-f]{16}", profile_id):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = profile_path(profile_id)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    return FileResponse(path, media_type="application/json", filename=f"profile-{profile_id}.json")
+
+
+@router.post("/dispatch")
+async def dispatch(dry_run: bool = False, user: models.User = Depends(require_role(models.UserRole.admin))):
+    """Run a batch dispatch pass now; ``dry_run`` solves without claiming."""
+    result = await run_dispatch(dry_run=dry_run)
+    out = {k: v for k, v in vars(result).items() if k != "assignments"}
+    if dry_run:
+        out["assignments"] = [{"job_id": j, "cleaner_id": c} for j, c in result.assignments]
+    return out
+
+
+@router.get("/outbox")
+def outbox(db: Session = Depends(get_db), user: models.User = Depends(require_role(models.UserRole.admin))):
+    """Delivery throughput and lag since startup, plus the pending backlog."""
+    return outbox_stats(db)
+
+
+@router.get("/photos")
+def photos(db: Session = Depends(get_db), user: models.User = Depends(require_role(models.UserRole.admin))):
+    """Photo variant pipeline: rendered/failed since startup, queue and pending backlog."""
+    return photo_stats(db)
+
+
+@router.post("/outbox/drain")
+async def drain_outbox(user: models.User = Depends(require_role(models.UserRole.admin))):
+    """Deliver everything due now instead of waiting for the next tick."""
+    return await drain()
+
+
+@router.post("/payouts")
+def compute_payouts(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    dry_run: bool = False,
+    db: Session = Depends(get_db),
+    user: models.User = Depends(require_role(models.UserRole.admin)),
+):
+    """Build the payout ledger for a pay period (default: last complete week).
+    Repeating a period returns its existing ledger."""
+    if start is None or end is None:
+        start, end = last_week()
+    start, end = naive_utc(start), naive_utc(end)
+    try:
+        return compute(db, start, end, dry_run=dry_run)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@router.get("/payouts/{run_id}")
+def payout_run(run_id: int, db: Session = Depends(get_db), user: models.User = Depends(require_role(models.UserRole.admin))):
+    status = run_status(db, run_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Payout run not found")
+    return status
+
+
+@router.post("/payouts/{run_id}/pay")
+async def pay_run(run_id: int, db: Session = Depends(get_db), user: models.User = Depends(require_role(models.UserRole.admin))):
+    """Submit the run's pending payouts in batches; resumes where a previous call stopped."""
+    if db.get(models.PayoutRun, run_id) is None:
+        raise HTTPException(status_code=404, detail="Payout run not found")
+    return await pay(run_id)
@@ -4,29 +4,40 @@ import secrets
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-import jwt
 from fastapi import APIRouter, Depends, HTTPException, Header
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from ..database import get_db, SessionLocal
+from ..lazy import LazyModule
 from .. import models
 from ..schemas import UserCreate, TokenResponse
+from ..sharding import placement
 
 
+# Imported on first use so workers boot (and answer /health) without paying for them
+jwt = LazyModule("jwt")
+
 router = APIRouter()
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing; passlib + bcrypt are only needed by register/login
+_pwd_context = None
+
+
+def pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 
 def verify_password(plain: str, hashed: str) -> bool:
     try:
-        return pwd_context.verify(plain, hashed)
+        return pwd_context().verify(plain, hashed)
     except Exception:
         return False
 
@@ -59,7 +70,10 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     db.flush()
 
     if u.role == models.UserRole.host:
-        db.add(models.Host(user_id=u.id, name=user.name, phone=user.phone))
+        host = models.Host(user_id=u.id, name=user.name, phone=user.phone)
+        db.add(host)
+        db.flush()
+        host.shard = placement(host.id)
     elif u.role == models.UserRole.cleaner:
         db.add(models.Cleaner(user_id=u.id, name=user.name, phone=user.phone))
     db.commit()
@@ -96,16 +110,42 @@ def refresh(token: Optional[str] = None, Authorization: Optional[str] = Header(N
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
+def token_subject(Authorization: Optional[str]) -> Optional[int]:
+    """User id of a valid bearer JWT, without touching the DB."""
+    if Authorization and Authorization.startswith("Bearer "):
+        try:
+            payload = jwt.decode(Authorization.split(" ", 1)[1], SECRET_KEY, algorithms=[ALGORITHM])
+            return int(payload.get("sub"))
+        except (jwt.PyJWTError, TypeError, ValueError):
+            pass
+    return None
+
+
+def principal_key(Authorization: Optional[str], client_host: Optional[str]) -> str:
+    """
+    Cheap principal key for admission control: the JWT subject that get_current_user
+    would resolve, without touching the DB. Legacy/demo callers fall back to client IP.
+    """
+    uid = token_subject(Authorization)
+    return f"user:{uid}" if uid is not None else f"ip:{client_host or 'unknown'}"
+
+
+def demo_email(Authorization: Optional[str], X_Demo_Role: Optional[str]) -> Optional[str]:
+    """Demo user the request acts as (DEMO_MODE without a token), else None."""
+    if os.getenv('DEMO_MODE', 'false').lower() != 'true' or Authorization:
+        return None
+    email_map = {
+        'host': 'demo_host@local',
+        'cleaner': 'demo_cleaner@local',
+        'admin': 'demo_admin@local',
+    }
+    return email_map.get((X_Demo_Role or 'host').lower(), 'demo_host@local')
+
+
 def get_current_user(Authorization: Optional[str] = Header(None), X_Demo_Role: Optional[str] = Header(None), db: Session = Depends(get_db)) -> models.User:
     # Demo mode: allow bypass with X-Demo-Role
-    if os.getenv('DEMO_MODE', 'false').lower() == 'true' and (not Authorization):
-        role = (X_Demo_Role or 'host').lower()
-        email_map = {
-            'host': 'demo_host@local',
-            'cleaner': 'demo_cleaner@local',
-            'admin': 'demo_admin@local',
-        }
-        email = email_map.get(role, 'demo_host@local')
+    email = demo_email(Authorization, X_Demo_Role)
+    if email:
         user = db.query(models.User).filter(models.User.email == email).first()
         if not user:
             raise HTTPException(status_code=500, detail="Demo user not initialized")
@@ -129,6 +169,25 @@ def get_current_user(Authorization: Optional[str] = Header(None), X_Demo_Role: O
         return user
 
 
+def current_host(db: Session, user: models.User) -> Optional[models.Host]:
+    """The caller's host profile, queried once per session (a batch reuses it)."""
+    hosts = db.info.setdefault("host_by_user", {})
+    if user.id not in hosts:
+        hosts[user.id] = db.query(models.Host).filter(models.Host.user_id == user.id).first()
+    return hosts[user.id]
+
+
+def is_admin_request(Authorization: Optional[str], X_Demo_Role: Optional[str]) -> bool:
+    """Resolve the caller outside of dependency injection (middleware use)."""
+    db = SessionLocal()
+    try:
+        return get_current_user(Authorization, X_Demo_Role, db).role == models.UserRole.admin
+    except HTTPException:
+        return False
+    finally:
+        db.close()
+
+
 def require_role(required: models.UserRole):
     def _dep(user: models.User = Depends(get_current_user)) -> models.User:
         if user.role != required:
@@ -0,0 +1,200 @@
+from __future__ import annotations
+import asyncio
+import inspect
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.params import Depends as DependsParam
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from .. import models
+from ..schemas import BatchRequest, BatchResponse, SubResponse
+from .auth import get_current_user, principal_key
+from ..services.admission import ADMISSION, retry_after_header
+from ..sharding import ROUTED_PARAMS, SHARDS, locate, session
+
+
+router = APIRouter()
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "50"))
+
+log = logging.getLogger("app.batch")
+
+# Read-only routes a batch may contain
+BATCH_ROUTES = frozenset({
+    "/properties/mine",
+    "/properties/{property_id}",
+    "/properties/{property_id}/bookings",
+    "/jobs/open",
+    "/jobs/me",
+    "/jobs/{job_id}",
+    "/cleaners/me/availability",
+})
+
+
+@dataclass
+class _Route:
+    route: APIRoute
+    params: dict[str, TypeAdapter]  # path and query parameters
+    defaults: dict[str, Any]
+    deps: frozenset[str]  # of "db", "user"
+    out: Optional[TypeAdapter]
+
+
+_routes: Optional[list[_Route]] = None
+
+
+def batch_routes(app) -> list[_Route]:
+    """Whitelisted GET routes in app order (so /properties/mine wins over /{property_id}).
+    Called once when the app is built (main.py), so a bad whitelist fails at startup."""
+    global _routes
+    if _routes is None:
+        found = []
+        for r in app.routes:
+            if not isinstance(r, APIRoute) or r.path not in BATCH_ROUTES or "GET" not in r.methods:
+                continue
+            sig = inspect.signature(r.endpoint, eval_str=True)
+            deps = {n for n, p in sig.parameters.items() if isinstance(p.default, DependsParam)}
+            if not deps <= {"db", "user"}:
+                raise RuntimeError(f"{r.path}: unsupported dependencies {deps} for a batch route")
+            params = {n: TypeAdapter(p.annotation) for n, p in sig.parameters.items() if n not in deps}
+            defaults = {n: p.default for n, p in sig.parameters.items() if n in params and p.default is not p.empty}
+            out = TypeAdapter(r.response_model) if r.response_model else None
+            found.append(_Route(r, params, defaults, frozenset(deps), out))
+        missing = BATCH_ROUTES - {br.route.path for br in found}
+        if missing:
+            raise RuntimeError(f"Batch routes not found: {sorted(missing)}")
+        _routes = found
+    return _routes
+
+
+def _error(status_code: int, message: str) -> dict:
+    return {"error": {"code": status_code, "message": message}}
+
+
+@dataclass
+class _Call:
+    route: _Route
+    kwargs: dict[str, Any]
+
+
+def _resolve(routes: list[_Route], method: str, path: str) -> _Call:
+    if method.upper() != "GET":
+        raise HTTPException(status_code=405, detail="Only GET sub-requests can be batched")
+    parts = urlsplit(path)
+    for br in routes:
+        m = br.route.path_regex.match(parts.path)
+        if not m:
+            continue
+        raw = dict(parse_qsl(parts.query))
+        raw.update(m.groupdict())
+        kwargs = {}
+        for name, adapter in br.params.items():
+            if name in raw:
+                try:
+                    kwargs[name] = adapter.validate_python(raw[name])
+                except ValidationError:
+                    raise HTTPException(status_code=422, detail=f"Invalid value for {name}")
+            elif name in br.defaults:
+                kwargs[name] = br.defaults[name]
+            else:
+                raise HTTPException(status_code=422, detail=f"Missing parameter {name}")
+        return _Call(br, kwargs)
+    raise HTTPException(status_code=404, detail="Route not available in a batch")
+
+
+def _invoke(call: _Call, **deps) -> SubResponse:
+    """Run one sub-request like the route would and serialize its response."""
+    try:
+        result = call.route.route.endpoint(**call.kwargs, **{k: v for k, v in deps.items() if k in call.route.deps})
+        if call.route.out is not None:
+            body = call.route.out.dump_python(call.route.out.validate_python(result, from_attributes=True), mode="json")
+        else:
+            body = jsonable_encoder(result)
+        return SubResponse(status=200, body=body)
+    except HTTPException as exc:
+        detail = exc.detail if isinstance(exc.detail, str) else "HTTP error"
+        return SubResponse(status=exc.status_code, body=_error(exc.status_code, detail))
+    except Exception:
+        log.exception("batch sub-request %s failed", call.route.route.path)
+        # The session is shared with the next sub-request: leave it clean
+        if "db" in deps:
+            deps["db"].rollback()
+        return SubResponse(status=500, body=_error(500, "Internal Server Error"))
+
+
+def _run_db_calls(calls: dict[int, _Call], db: Session, user: models.User) -> dict[int, SubResponse]:
+    """DB sub-requests in order on one session (sessions are not thread-safe),
+    so rows loaded by one are served from the identity map to the next."""
+    sessions: dict[int, Session] = {}
+    out = {}
+    try:
+        for i, call in calls.items():
+            s = db
+            if SHARDS:
+                # A job or property on another shard reads from that shard
+                for param, table in ROUTED_PARAMS.items():
+                    if param in call.kwargs:
+                        found = locate(table, call.kwargs[param])
+                        if found and found[0] != db.info.get("shard", 0):
+                            s = sessions.get(found[0]) or sessions.setdefault(found[0], session(found[0]))
+                        break
+            out[i] = _invoke(call, db=s, user=user)
+    finally:
+        for s in sessions.values():
+            s.close()
+    return out
+
+
+@router.post("/batch", response_model=BatchResponse)
+async def batch(
+    payload: BatchRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    user: models.User = Depends(get_current_user),
+):
+    """Several GET sub-requests in one round trip, authenticated once and
+    answered in order, each with its own status and body (errors use the
+    usual envelope). Sub-requests that read the DB share this request's
+    session; the rest (PMS booking lookups) run concurrently with them."""
+    if len(payload.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} sub-requests per batch")
+    if len(payload.requests) > 1:
+        # Admission charged the batch one token; each further sub-request costs
+        # one more, so batching never raises a client's rate limit
+        key = principal_key(request.headers.get("authorization"), request.client.host if request.client else None)
+        wait = ADMISSION.check(key, cost=len(payload.requests) - 1)
+        if wait:
+            raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=retry_after_header(wait))
+    routes = batch_routes(request.app)
+    responses: list[Optional[SubResponse]] = [None] * len(payload.requests)
+    db_calls: dict[int, _Call] = {}
+    io_calls: dict[int, _Call] = {}
+    for i, sub in enumerate(payload.requests):
+        try:
+            call = _resolve(routes, sub.method, sub.path)
+        except HTTPException as exc:
+            responses[i] = SubResponse(status=exc.status_code, body=_error(exc.status_code, exc.detail))
+            continue
+        (db_calls if "db" in call.route.deps else io_calls)[i] = call
+    io_indexes = list(io_calls)
+    db_results, *io_results = await asyncio.gather(
+        run_in_threadpool(_run_db_calls, db_calls, db, user),
+        *(run_in_threadpool(_invoke, io_calls[i], user=user) for i in io_indexes),
+    )
+    for i, resp in db_results.items():
+        responses[i] = resp
+    for i, resp in zip(io_indexes, io_results):
+        responses[i] = resp
+    for sub, resp in zip(payload.requests, responses):
+        resp.id = sub.id
+    return BatchResponse(responses=responses)
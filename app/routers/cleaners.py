@@ -0,0 +1,45 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from .. import models
+from ..schemas import FreeSlot, naive_utc
+from .auth import get_current_user
+from ..sharding import fan_out
+from ..services.claims import TRAVEL_BUFFER, busy_windows, free_slots
+
+
+router = APIRouter()
+
+MAX_AVAILABILITY_RANGE = timedelta(days=31)
+
+
+@router.get("/me/availability", response_model=list[FreeSlot])
+def my_availability(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    min_minutes: int = 60,
+    db: Session = Depends(get_db),
+    user: models.User = Depends(get_current_user),
+):
+    """Free slots between start and end (default: the next 7 days), keeping the
+    travel buffer clear around every claimed job."""
+    if user.role != models.UserRole.cleaner:
+        raise HTTPException(status_code=403, detail="Only cleaners have availability")
+    cleaner = db.query(models.Cleaner).filter(models.Cleaner.user_id == user.id).first()
+    if not cleaner:
+        raise HTTPException(status_code=400, detail="Cleaner profile missing")
+    # Stored times are naive UTC
+    start = naive_utc(start) or datetime.utcnow()
+    end = naive_utc(end) or start + timedelta(days=7)
+    if end <= start or end - start > MAX_AVAILABILITY_RANGE:
+        raise HTTPException(status_code=400, detail="Range must be positive and at most 31 days")
+    # Windows reaching into the range once padded by the buffer
+    parts = fan_out(db, lambda s: busy_windows(s, cleaner.id, start - TRAVEL_BUFFER, end + TRAVEL_BUFFER))
+    busy = [w for part in parts for w in part]
+    slots = free_slots(busy, start, end, timedelta(minutes=max(1, min_minutes)))
+    return [FreeSlot(start=s, end=e) for s, e in slots]
@@ -0,0 +1,52 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from .. import models
+from .auth import current_host, get_current_user
+from ..sharding import shard_ids
+from ..services.exports import EXPORT_FORMATS, ExportFilter, stream_export
+
+
+router = APIRouter()
+
+
+@router.get("/jobs")
+def export_jobs(
+    format: str = "csv",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after_id: int = 0,
+    gzip: bool = False,
+    db: Session = Depends(get_db),
+    user: models.User = Depends(get_current_user),
+):
+    """Every job (admin) or the caller's jobs (host) with property, rating and
+    checklist, streamed in job id order. ``start``/``end`` filter on
+    booking_start; resume an interrupted export with ``after_id``."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    if start and end and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    f = ExportFilter(start=start, end=end, after_id=max(0, after_id))
+    if user.role == models.UserRole.host:
+        host = current_host(db, user)
+        if not host:
+            raise HTTPException(status_code=400, detail="Host profile missing")
+        f.host_id = host.id
+        shards = [host.shard]
+    elif user.role == models.UserRole.admin:
+        shards = shard_ids()
+    else:
+        raise HTTPException(status_code=403, detail="Only hosts/admin can export")
+    filename = f"jobs-{datetime.utcnow():%Y%m%d}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream_export(f, format, gzip, shards),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,38 +1,37 @@
 from __future__ import annotations
-import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+from sqlalchemy.orm import Session, selectinload
 
 from ..database import get_db
 from .. import models
 from ..schemas import JobCreate, JobOut, ClaimJobRequest, TickChecklistRequest, RatingCreate, ChecklistItemOut
-from .auth import get_current_user
-from ..services.scheduler import SCHEDULER, remind_job_upcoming
+from .auth import current_host, get_current_user
+from ..sharding import SHARDS, fan_out, fan_out_page, shard_ids
+from ..services.media_store import MEDIA_STORE, attach_photo, safe_ext
+from ..services.claims import find_overlap, try_claim
+from ..services.notifications import enqueue, enqueue_claims, reminder_due
+from ..services.photos import PHOTOS
 
 
 router = APIRouter()
 
 
-def _ensure_media_dir() -> str:
-    root = os.path.dirname(os.path.dirname(__file__))
-    media_dir = os.path.join(root, "media")
-    os.makedirs(media_dir, exist_ok=True)
-    return media_dir
-
-
 @router.post("/", response_model=JobOut)
 def create_job(payload: JobCreate, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
     if user.role != models.UserRole.host:
         raise HTTPException(status_code=403, detail="Only hosts can create jobs")
-    host = db.query(models.Host).filter(models.Host.user_id == user.id).first()
+    host = current_host(db, user)
     prop = db.query(models.Property).filter(models.Property.id == payload.property_id).first()
     if not host or not prop or prop.host_id != host.id:
         raise HTTPException(status_code=400, detail="Invalid property")
     job = models.CleaningJob(
         property_id=prop.id,
+        host_id=prop.host_id,
         booking_start=payload.booking_start,
         booking_end=payload.booking_end,
         status=models.JobStatus.open,
@@ -43,21 +42,26 @@ def create_job(payload: JobCreate, db: Session = Depends(get_db), user: models.U
     for item in payload.checklist:
         db.add(models.ChecklistItem(job_id=job.id, text=item.text))
 
+    # Outbox rows commit (or roll back) with the job; reminder 1 hour before booking_end
+    enqueue(db, user.id, "job_posted", job, prop.name)
+    due = reminder_due(job.booking_end)
+    if due:
+        enqueue(db, user.id, "job_upcoming", job, prop.name, due=due)
     db.commit()
     db.refresh(job)
 
-    # Schedule reminder 1 hour before booking_end (stub)
-    try:
-        delta = job.booking_end - datetime.utcnow() - timedelta(hours=1)
-        if delta.total_seconds() > 0:
-            SCHEDULER.schedule(delta, lambda j_id=job.id: remind_job_upcoming(j_id))
-    except Exception:
-        pass
-
     job.checklist_items  # load
     return job
 
 
+def _job_page(q, key):
+    """Fetcher for `fan_out_page`: one shard's page of ``q(session)`` as (key, JobOut)."""
+    def fetch(s: Session, offset: int, limit: int) -> list[tuple]:
+        jobs = q(s).options(selectinload(models.CleaningJob.checklist_items)).offset(offset).limit(limit)
+        return [(key(j), JobOut.model_validate(j)) for j in jobs]
+    return fetch
+
+
 @router.get("/open", response_model=list[JobOut])
 def list_open_jobs(
     limit: int = 50,
@@ -67,9 +71,12 @@ def list_open_jobs(
 ):
     limit = max(1, min(limit, 100))
     offset = max(0, offset)
-    q = db.query(models.CleaningJob).filter(models.CleaningJob.status == models.JobStatus.open)
-    jobs = q.order_by(models.CleaningJob.booking_start.asc()).offset(offset).limit(limit).all()
-    return jobs
+    J = models.CleaningJob
+    fetch = _job_page(
+        lambda s: s.query(J).filter(J.status == models.JobStatus.open).order_by(J.booking_start.asc()),
+        lambda j: j.booking_start,
+    )
+    return fan_out_page(db, fetch, offset, limit)
 
 
 @router.get("/me", response_model=list[JobOut])
@@ -81,39 +88,31 @@ def my_jobs(
 ):
     limit = max(1, min(limit, 100))
     offset = max(0, offset)
+    J = models.CleaningJob
+    created = lambda j: j.created_at  # noqa: E731
     if user.role == models.UserRole.cleaner:
         cleaner = db.query(models.Cleaner).filter(models.Cleaner.user_id == user.id).first()
         if not cleaner:
             return []
-        return (
-            db.query(models.CleaningJob)
-            .filter(models.CleaningJob.cleaner_id == cleaner.id)
-            .order_by(models.CleaningJob.created_at.desc())
-            .offset(offset)
-            .limit(limit)
-            .all()
-        )
+        # A cleaner works for hosts on every shard
+        fetch = _job_page(lambda s: s.query(J).filter(J.cleaner_id == cleaner.id).order_by(J.created_at.desc()), created)
+        return fan_out_page(db, fetch, offset, limit, reverse=True)
     if user.role == models.UserRole.host:
-        host = db.query(models.Host).filter(models.Host.user_id == user.id).first()
+        host = current_host(db, user)
         if not host:
             return []
-        props = db.query(models.Property.id).filter(models.Property.host_id == host.id).subquery()
         return (
             db.query(models.CleaningJob)
-            .filter(models.CleaningJob.property_id.in_(props))
+            .options(selectinload(models.CleaningJob.checklist_items))
+            .filter(models.CleaningJob.host_id == host.id)
             .order_by(models.CleaningJob.created_at.desc())
             .offset(offset)
             .limit(limit)
             .all()
         )
     # admin
-    return (
-        db.query(models.CleaningJob)
-        .order_by(models.CleaningJob.created_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
+    fetch = _job_page(lambda s: s.query(J).order_by(J.created_at.desc()), created)
+    return fan_out_page(db, fetch, offset, limit, reverse=True)
 
 
 @router.post("/{job_id}/claim", response_model=JobOut)
@@ -121,14 +120,27 @@ def claim_job(job_id: int, db: Session = Depends(get_db), user: models.User = De
     if user.role != models.UserRole.cleaner:
         raise HTTPException(status_code=403, detail="Only cleaners can claim jobs")
     cleaner = db.query(models.Cleaner).filter(models.Cleaner.user_id == user.id).first()
-    job = db.query(models.CleaningJob).filter(models.CleaningJob.id == job_id).first()
-    if not job or job.status != models.JobStatus.open:
+    if not cleaner:
+        raise HTTPException(status_code=400, detail="Cleaner profile missing")
+    if SHARDS:
+        # The conditional claim only sees this shard; check the cleaner's jobs on the others first
+        job = db.query(models.CleaningJob).filter(models.CleaningJob.id == job_id).first()
+        others = [k for k in shard_ids() if k != db.info["shard"]]
+        clash = job and next(filter(None, fan_out(
+            db, lambda s: find_overlap(s, cleaner.id, job.booking_start, job.booking_end), others,
+        )), None)
+        if clash:
+            raise HTTPException(status_code=409, detail=f"Overlaps your job {clash} (including travel buffer)")
+    if not try_claim(db, job_id, cleaner.id):
+        db.rollback()
+        job = db.query(models.CleaningJob).filter(models.CleaningJob.id == job_id).first()
+        if job and job.status == models.JobStatus.open:
+            clash = find_overlap(db, cleaner.id, job.booking_start, job.booking_end)
+            raise HTTPException(status_code=409, detail=f"Overlaps your job {clash} (including travel buffer)" if clash else "Schedule changed, retry")
         raise HTTPException(status_code=400, detail="Job not open or not found")
-    job.status = models.JobStatus.claimed
-    job.cleaner_id = cleaner.id
+    enqueue_claims(db, [(job_id, cleaner.id)])
     db.commit()
-    db.refresh(job)
-    return job
+    return db.query(models.CleaningJob).filter(models.CleaningJob.id == job_id).one()
 
 
 @router.post("/{job_id}/checklist/tick", response_model=list[ChecklistItemOut])
@@ -151,6 +163,14 @@ def tick_checklist(job_id: int, payload: TickChecklistRequest, db: Session = Dep
 
 @router.post("/{job_id}/checklist/{item_id}/photo", response_model=ChecklistItemOut)
 async def upload_photo(job_id: int, item_id: int, file: UploadFile = File(...), db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
+    # Hashing, copying and the DB work all block: keep them off the event loop
+    item = await run_in_threadpool(_store_photo, job_id, item_id, file, db, user)
+    # Thumbnail and web variants render in the background; the original is the fallback
+    PHOTOS.submit(item.photo_path)
+    return item
+
+
+def _store_photo(job_id: int, item_id: int, file: UploadFile, db: Session, user: models.User) -> models.ChecklistItem:
     job = db.query(models.CleaningJob).filter(models.CleaningJob.id == job_id).first()
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -160,13 +180,15 @@ async def upload_photo(job_id: int, item_id: int, file: UploadFile = File(...),
     item = db.query(models.ChecklistItem).filter(models.ChecklistItem.id == item_id, models.ChecklistItem.job_id == job_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
-    media_dir = _ensure_media_dir()
-    ext = os.path.splitext(file.filename or "upload.bin")[1]
-    fname = f"job{job_id}_item{item_id}_{int(datetime.utcnow().timestamp())}{ext}"
-    dest = os.path.join(media_dir, fname)
-    with open(dest, "wb") as f:
-        f.write(await file.read())
-    item.photo_path = f"/media/{fname}"
+    # Content-addressed: hash while streaming to staging, dedup onto an existing blob
+    staged = MEDIA_STORE.stage(file.file)
+    try:
+        rel = attach_photo(db, item, staged, safe_ext(file.filename))
+        MEDIA_STORE.publish(staged, rel)
+    except Exception:
+        MEDIA_STORE.discard(staged)
+        db.rollback()
+        raise
     db.commit()
     db.refresh(item)
     return item
@@ -182,8 +204,20 @@ def mark_complete(job_id: int, db: Session = Depends(get_db), user: models.User
     all_checked = db.query(models.ChecklistItem).filter(models.ChecklistItem.job_id == job_id, models.ChecklistItem.checked == False).count() == 0  # noqa: E712
     if not all_checked:
         raise HTTPException(status_code=400, detail="All checklist items must be checked before completion")
-    job.status = models.JobStatus.completed
-    job.completed_at = datetime.utcnow()
+    if job.status == models.JobStatus.completed:
+        raise HTTPException(status_code=400, detail="Job already completed")
+    # Conditional: completed_at is stamped once, since payout periods key on it
+    J = models.CleaningJob
+    stamped = db.execute(
+        update(J).where(J.id == job_id, J.status != models.JobStatus.completed)
+        .values(status=models.JobStatus.completed, completed_at=datetime.utcnow())
+    ).rowcount
+    if not stamped:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Job already completed")
+    host_user_id = db.query(models.Host.user_id).filter(models.Host.id == job.host_id).scalar()
+    if host_user_id:
+        enqueue(db, host_user_id, "job_completed", job, job.property.name)
     db.commit()
     db.refresh(job)
     return job
@@ -196,7 +230,7 @@ def rate_job(job_id: int, payload: RatingCreate, db: Session = Depends(get_db),
     job = db.query(models.CleaningJob).filter(models.CleaningJob.id == job_id).first()
     if not job or job.status != models.JobStatus.completed:
         raise HTTPException(status_code=400, detail="Job not completed or not found")
-    host = db.query(models.Host).filter(models.Host.user_id == user.id).first()
+    host = current_host(db, user)
     if user.role == models.UserRole.host:
         prop = db.query(models.Property).filter(models.Property.id == job.property_id).first()
         if not host or not prop or prop.host_id != host.id:
@@ -217,13 +251,14 @@ def rate_job(job_id: int, payload: RatingCreate, db: Session = Depends(get_db),
         total = (cleaner.avg_rating or 0) * cleaner.ratings_count + payload.stars
         cleaner.ratings_count += 1
         cleaner.avg_rating = total / cleaner.ratings_count
+        enqueue(db, cleaner.user_id, "job_rated", job, job.property.name, stars=payload.stars)
     db.commit()
     return {"status": "ok"}
 
 
 @router.get("/{job_id}", response_model=JobOut)
 def get_job(job_id: int, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
-    job = db.query(models.CleaningJob).filter(models.CleaningJob.id == job_id).first()
+    job = db.get(models.CleaningJob, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Not found")
     return job
@@ -1,7 +1,14 @@
 from __future__ import annotations
-from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel, EmailStr, Field
+from datetime import datetime, timezone
+from typing import Any, Optional, List
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Aware datetimes (e.g. "...Z" from JS toISOString) as the naive UTC the DB stores."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 
 class UserCreate(BaseModel):
@@ -19,12 +26,18 @@ class TokenResponse(BaseModel):
 class PropertyCreate(BaseModel):
     name: str
     address: str
+    latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    longitude: Optional[float] = Field(default=None, ge=-180, le=180)
+    payout_rate_cents: Optional[int] = Field(default=None, ge=0)
 
 
 class PropertyOut(BaseModel):
     id: int
     name: str
     address: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    payout_rate_cents: Optional[int] = None
     class Config:
         from_attributes = True
 
@@ -37,10 +50,23 @@ class ChecklistItemOut(BaseModel):
     id: int
     text: str
     checked: bool
-    photo_path: Optional[str] = None
+    photo_path: Optional[str] = None  # the original, minus JPEG metadata
+    # pending | ready | failed; variant paths fall back to the original until ready
+    photo_status: Optional[str] = None
+    photo_thumb_path: Optional[str] = None
+    photo_web_path: Optional[str] = None
+    photo_width: Optional[int] = None
+    photo_height: Optional[int] = None
+    photo_size: Optional[int] = None
     class Config:
         from_attributes = True
 
+    @model_validator(mode="after")
+    def _variant_fallback(self) -> "ChecklistItemOut":
+        self.photo_thumb_path = self.photo_thumb_path or self.photo_path
+        self.photo_web_path = self.photo_web_path or self.photo_path
+        return self
+
 
 class JobCreate(BaseModel):
     property_id: int
@@ -48,6 +74,8 @@ class JobCreate(BaseModel):
     booking_end: datetime
     checklist: List[ChecklistItemIn] = []
 
+    _naive_utc = field_validator("booking_start", "booking_end")(naive_utc)
+
 
 class JobOut(BaseModel):
     id: int
@@ -78,3 +106,27 @@ class BookingPeriod(BaseModel):
     start: datetime
     end: datetime
 
+
+class FreeSlot(BaseModel):
+    start: datetime
+    end: datetime
+
+
+class SubRequest(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str  # may carry a query string, e.g. "/jobs/me?limit=20"
+
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest]
+
+
+class SubResponse(BaseModel):
+    id: Optional[str] = None
+    status: int
+    body: Any = None
+
+
+class BatchResponse(BaseModel):
+    responses: List[SubResponse]
@@ -0,0 +1,146 @@
+"""
+In-process admission control: per-principal token buckets, read/write
+concurrency limits and load shedding.
+
+Everything here is O(1) per request and keeps no external state, so it protects
+a single replica (and its single SQLite writer). Put a shared limiter in front
+of the fleet if you run many replicas.
+"""
+from __future__ import annotations
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float) -> None:
+        self.tokens = capacity
+        self.updated = now
+
+
+class RateLimiter:
+    """Token buckets keyed by principal (``user:<id>`` or ``ip:<addr>``).
+
+    Buckets refill lazily on access. The key table is an LRU capped at
+    ``max_keys`` so a flood of distinct IPs cannot grow memory without bound.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 50_000) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens for ``key``. Returns 0 when admitted, otherwise
+        the number of seconds until enough tokens will be available."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.burst, now)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+            # A cost above the burst is admitted from a full bucket and paid
+            # off by the refill (the balance goes negative)
+            need = min(cost, self.burst)
+            if bucket.tokens >= need:
+                bucket.tokens -= cost
+                return 0.0
+            return (need - bucket.tokens) / self.rate
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class ConcurrencyLimiter:
+    """Non-blocking in-flight counters for read and write requests.
+
+    Requests over the limit are rejected immediately instead of queueing, so an
+    abusive client cannot park work on the threadpool ahead of everyone else.
+    """
+
+    def __init__(self, max_reads: int, max_writes: int) -> None:
+        self.max_reads = max_reads
+        self.max_writes = max_writes
+        self.reads = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def try_enter(self, is_write: bool) -> bool:
+        with self._lock:
+            if is_write:
+                if self.max_writes and self.writes >= self.max_writes:
+                    return False
+                self.writes += 1
+            else:
+                if self.max_reads and self.reads >= self.max_reads:
+                    return False
+                self.reads += 1
+            return True
+
+    def leave(self, is_write: bool) -> None:
+        with self._lock:
+            if is_write:
+                self.writes -= 1
+            else:
+                self.reads -= 1
+
+
+class AdmissionController:
+    def __init__(self) -> None:
+        self.enabled = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+        self.user_limiter = RateLimiter(
+            rate=_env_float("RATE_LIMIT_USER_RPS", 10),
+            burst=_env_float("RATE_LIMIT_USER_BURST", 30),
+        )
+        # Anonymous, demo and legacy-token callers share a bucket per client IP
+        self.ip_limiter = RateLimiter(
+            rate=_env_float("RATE_LIMIT_IP_RPS", 30),
+            burst=_env_float("RATE_LIMIT_IP_BURST", 90),
+        )
+        # Reads stay under the default 40-thread pool; writes are shed early
+        # because SQLite serialises them anyway.
+        self.concurrency = ConcurrencyLimiter(
+            max_reads=int(os.getenv("ADMISSION_MAX_READS", "32")),
+            max_writes=int(os.getenv("ADMISSION_MAX_WRITES", "4")),
+        )
+        self.shed_retry_after = int(os.getenv("ADMISSION_SHED_RETRY_AFTER", "1"))
+
+    def check(self, key: str, cost: float = 1.0) -> float:
+        """Charge ``cost`` requests to the bucket for a principal key from ``principal_key``."""
+        if not self.enabled:
+            return 0.0
+        limiter = self.user_limiter if key.startswith("user:") else self.ip_limiter
+        return limiter.acquire(key, cost)
+
+    def reset(self) -> None:
+        self.user_limiter.reset()
+        self.ip_limiter.reset()
+
+
+def retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+ADMISSION = AdmissionController()
@@ -0,0 +1,117 @@
+"""
+The single path by which a job gets a cleaner, and cleaners' schedules.
+
+Manual claims (`POST /jobs/{id}/claim`) and the batch dispatcher both go
+through `try_claim`: one conditional UPDATE that only succeeds while the job is
+still open and the cleaner has no active job within TRAVEL_BUFFER of its
+window, so racing claimants cannot double-book a job or a cleaner.
+
+Overlap checks and availability read `ix_cleaning_jobs_active_schedule`, a
+partial index over (cleaner_id, booking_end) holding only claimed/in-progress
+jobs: a seek to the cleaner's first window ending after the new start, however
+many completed jobs the cleaner has behind them.
+"""
+from __future__ import annotations
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, bindparam, exists, select, text, update
+from sqlalchemy.orm import Session
+
+from .. import models
+
+
+TRAVEL_BUFFER = timedelta(minutes=int(os.getenv("TRAVEL_BUFFER_MINUTES", "30")))
+# Must match the partial index predicate verbatim (and stay literal, not bound)
+# for SQLite to use the index
+ACTIVE_SCHEDULE_WHERE = "status IN ('claimed', 'in_progress')"
+
+
+def _overlapping(cleaner_id: int, lo: datetime, hi: datetime):
+    sched = models.CleaningJob.__table__.alias("sched")
+    return and_(
+        sched.c.cleaner_id == cleaner_id,
+        text(f"sched.{ACTIVE_SCHEDULE_WHERE}"),
+        sched.c.booking_end > lo,
+        sched.c.booking_start < hi,
+    ), sched
+
+
+def _claim_statement():
+    """Conditional claim, bound per job: job_id, cleaner, and the buffered window lo..hi."""
+    jobs = models.CleaningJob.__table__
+    clash, sched = _overlapping(bindparam("cleaner"), bindparam("lo"), bindparam("hi"))
+    # Core statement on the table: skips ORM bulk-update bookkeeping
+    return (
+        update(jobs)
+        .where(
+            jobs.c.id == bindparam("job_id"),
+            jobs.c.status == models.JobStatus.open,
+            ~exists(select(sched.c.id).where(clash)),
+        )
+        .values(status=models.JobStatus.claimed, cleaner_id=bindparam("cleaner"))
+    )
+
+
+CLAIM = _claim_statement()
+
+
+def _claim_params(db: Session, claims: list[tuple[int, int]], buffer: timedelta) -> list[dict]:
+    jobs = models.CleaningJob.__table__
+    windows = {
+        row.id: row for row in db.execute(
+            select(jobs.c.id, jobs.c.booking_start, jobs.c.booking_end).where(jobs.c.id.in_([j for j, _ in claims]))
+        )
+    }
+    return [
+        {"job_id": job_id, "cleaner": cleaner_id, "lo": windows[job_id].booking_start - buffer, "hi": windows[job_id].booking_end + buffer}
+        for job_id, cleaner_id in claims if job_id in windows
+    ]
+
+
+def try_claim(db: Session, job_id: int, cleaner_id: int, buffer: timedelta = TRAVEL_BUFFER) -> bool:
+    """Assign ``job_id`` to ``cleaner_id`` if it is still open and fits the
+    cleaner's schedule. Does not commit."""
+    params = _claim_params(db, [(job_id, cleaner_id)], buffer)
+    return bool(params) and db.execute(CLAIM, params[0]).rowcount == 1
+
+
+def try_claim_many(db: Session, claims: list[tuple[int, int]], buffer: timedelta = TRAVEL_BUFFER) -> int:
+    """`try_claim` for many (job_id, cleaner_id) pairs in one executemany,
+    applied in order; returns how many succeeded. Does not commit."""
+    params = _claim_params(db, claims, buffer)
+    return db.execute(CLAIM, params).rowcount if params else 0
+
+
+def find_overlap(db: Session, cleaner_id: int, start: datetime, end: datetime, buffer: timedelta = TRAVEL_BUFFER) -> Optional[int]:
+    """Id of an active job of ``cleaner_id`` within ``buffer`` of start..end, if any."""
+    clash, sched = _overlapping(cleaner_id, start - buffer, end + buffer)
+    return db.execute(select(sched.c.id).where(clash).limit(1)).scalar()
+
+
+def busy_windows(db: Session, cleaner_id: int, start: datetime, end: datetime) -> list[tuple[datetime, datetime]]:
+    """The cleaner's active job windows that touch start..end, by end time."""
+    clash, sched = _overlapping(cleaner_id, start, end)
+    rows = db.execute(select(sched.c.booking_start, sched.c.booking_end).where(clash).order_by(sched.c.booking_end))
+    return [(s, e) for s, e in rows]
+
+
+def free_slots(
+    busy: list[tuple[datetime, datetime]], start: datetime, end: datetime,
+    min_length: timedelta, buffer: timedelta = TRAVEL_BUFFER,
+) -> list[tuple[datetime, datetime]]:
+    """Gaps of at least ``min_length`` in start..end once every busy window is
+    padded by ``buffer`` on both sides."""
+    slots = []
+    cursor = start
+    for s, e in sorted(busy):
+        gap_end = min(s - buffer, end)
+        if gap_end - cursor >= min_length:
+            slots.append((cursor, gap_end))
+        cursor = max(cursor, e + buffer)
+        if cursor >= end:
+            break
+    if end - cursor >= min_length:
+        slots.append((cursor, end))
+    return slots
@@ -0,0 +1,391 @@
+"""
+Batch dispatch: periodically assign open jobs to cleaners.
+
+Each pass snapshots upcoming open jobs and every cleaner's commitments, solves
+the assignment in a worker process (off the event loop and out of the GIL) and
+commits the result through `claims.try_claim_many`, the same conditional
+UPDATE a manual claim uses, so a cleaner who claims by hand mid-pass simply wins.
+
+The solver sweeps jobs in start order and cuts them into waves of jobs that all
+overlap one instant, so a cleaner can take at most one job per wave. Each wave
+is a bipartite matching between its jobs and the cleaners free for them (no
+overlapping commitment, TRAVEL_BUFFER_MINUTES of travel either side, within
+DISPATCH_MAX_KM when both locations are known). Every job keeps its
+DISPATCH_CANDIDATES best-scoring cleaners (rating, minus distance), and a
+cleaner sits on at most CLEANER_FANOUT lists per wave so the lists spread over
+the workforce instead of all naming the same top-rated few. A greedy
+best-score pass is then grown to a maximum matching with Hopcroft-Karp
+augmenting paths, so coverage comes first and score decides among equals.
+"""
+from __future__ import annotations
+import asyncio
+import heapq
+import math
+import os
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import SessionLocal
+from ..lazy import LazyModule
+from ..sharding import fan_out
+from .claims import TRAVEL_BUFFER, try_claim_many
+from .notifications import enqueue_claims
+
+
+DISPATCH_INTERVAL = int(os.getenv("DISPATCH_INTERVAL_SECONDS", "0"))  # 0 disables the periodic pass
+DISPATCH_HORIZON = timedelta(hours=int(os.getenv("DISPATCH_HORIZON_HOURS", "336")))
+DISPATCH_MAX_KM = float(os.getenv("DISPATCH_MAX_KM", "50"))
+DISPATCH_CANDIDATES = int(os.getenv("DISPATCH_CANDIDATES", "16"))
+CLEANER_FANOUT = 4
+COMPACT_EVERY = 16  # drop fanout-saturated cleaners from the scan every N jobs of a wave
+PREFILTER_WAVE = 16  # waves at least this big drop cleaners busy at the wave's instant up front
+RATING_WEIGHT = 1.0
+KM_WEIGHT = float(os.getenv("DISPATCH_KM_WEIGHT", "0.05"))  # one star is worth 20 km
+UNRATED_RATING = 3.5
+COMMIT_BATCH = 500
+EPOCH = datetime(1970, 1, 1)
+KM_PER_DEGREE = 111.2
+# Imported with the first worker pool, not at app startup
+multiprocessing = LazyModule("multiprocessing")
+futures_process = LazyModule("concurrent.futures.process")
+
+
+class DispatchJob(NamedTuple):
+    id: int
+    start: float
+    end: float
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+
+
+@dataclass
+class DispatchCleaner:
+    id: int
+    rating: float
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    # Committed windows, sorted and merged: busy_starts[i]..busy_ends[i]
+    busy_starts: list[float] = field(default_factory=list)
+    busy_ends: list[float] = field(default_factory=list)
+
+    def add_busy(self, start: float, end: float) -> None:
+        i = bisect_left(self.busy_starts, start)
+        self.busy_starts.insert(i, start)
+        self.busy_ends.insert(i, end)
+
+    def is_free(self, start: float, end: float, buffer: float) -> bool:
+        # Windows are disjoint and sorted, so only the last one starting before
+        # our (buffered) end can overlap
+        i = bisect_left(self.busy_starts, end + buffer)
+        return i == 0 or self.busy_ends[i - 1] + buffer <= start
+
+
+@dataclass
+class DispatchParams:
+    buffer: float = TRAVEL_BUFFER.total_seconds()
+    max_km: float = DISPATCH_MAX_KM
+    candidates: int = DISPATCH_CANDIDATES
+    fanout: int = CLEANER_FANOUT
+    km_weight: float = KM_WEIGHT
+
+
+@dataclass
+class DispatchResult:
+    jobs: int = 0
+    cleaners: int = 0
+    assigned: int = 0
+    claimed: int = 0
+    conflicts: int = 0
+    snapshot_ms: float = 0.0
+    solve_ms: float = 0.0
+    commit_ms: float = 0.0
+    dry_run: bool = False
+    assignments: list[tuple[int, int]] = field(default_factory=list, repr=False)
+
+
+def to_ts(dt: datetime) -> float:
+    return (dt - EPOCH).total_seconds()
+
+
+class Projection:
+    """Equirectangular projection to km around a reference latitude.
+
+    Accurate to well under 1% at metro scale; pairs far enough apart for the
+    error to matter are already past DISPATCH_MAX_KM.
+    """
+
+    def __init__(self, ref_lat: float) -> None:
+        self.kx = KM_PER_DEGREE * math.cos(math.radians(ref_lat))
+
+    def __call__(self, lat: Optional[float], lng: Optional[float]) -> Optional[tuple[float, float]]:
+        if lat is None or lng is None:
+            return None
+        return lng * self.kx, lat * KM_PER_DEGREE
+
+
+def merge_windows(windows: list[tuple[float, float]]) -> tuple[list[float], list[float]]:
+    starts: list[float] = []
+    ends: list[float] = []
+    for s, e in sorted(windows):
+        if starts and s <= ends[-1]:
+            ends[-1] = max(ends[-1], e)
+        else:
+            starts.append(s)
+            ends.append(e)
+    return starts, ends
+
+
+def waves(jobs: list[DispatchJob]) -> list[tuple[float, list[DispatchJob]]]:
+    """Cut start-sorted jobs into runs that all contain one instant (their earliest end)."""
+    order = sorted(jobs, key=lambda j: (j.start, j.end))
+    out, i = [], 0
+    while i < len(order):
+        horizon, k = order[i].end, i + 1
+        while k < len(order) and order[k].start <= horizon:
+            horizon = min(horizon, order[k].end)
+            k += 1
+        out.append((horizon, order[i:k]))
+        i = k
+    return out
+
+
+def _candidates(job: DispatchJob, at: Optional[tuple[float, float]], ranked: list[DispatchCleaner], where: list,
+                pool: list[int], load: dict[int, int], params: DispatchParams) -> list[tuple[float, int]]:
+    """Top-scoring free cleaners for ``job`` as (score, index into ranked).
+
+    ``pool`` is in rating order, which bounds every later score, so the scan
+    stops once the heap is full and no remaining cleaner can beat its minimum.
+    """
+    heap: list[tuple[float, int]] = []
+    size, fanout, buffer = params.candidates, params.fanout, params.buffer
+    max_km2, km_weight = params.max_km ** 2, params.km_weight
+    start, end = job.start, job.end
+    for idx in pool:
+        c = ranked[idx]
+        score = RATING_WEIGHT * c.rating
+        if len(heap) >= size and score <= heap[0][0]:
+            break
+        if load.get(idx, 0) >= fanout or not c.is_free(start, end, buffer):
+            continue
+        home = where[idx]
+        if at is not None and home is not None:
+            dx, dy = at[0] - home[0], at[1] - home[1]
+            d2 = dx * dx + dy * dy
+            if d2 > max_km2:
+                continue
+            score -= km_weight * math.sqrt(d2)
+        if len(heap) < size:
+            heapq.heappush(heap, (score, idx))
+        elif score > heap[0][0]:
+            heapq.heapreplace(heap, (score, idx))
+    for _, idx in heap:
+        load[idx] = load.get(idx, 0) + 1
+    return sorted(heap, reverse=True)
+
+
+def _match_wave(adj: list[list[tuple[float, int]]]) -> list[Optional[int]]:
+    """Maximum matching for one wave, seeded greedily by score."""
+    n = len(adj)
+    match_job: list[Optional[int]] = [None] * n
+    match_cleaner: dict[int, int] = {}
+    for score, j, c in sorted(((s, j, c) for j, edges in enumerate(adj) for s, c in edges), reverse=True):
+        if match_job[j] is None and c not in match_cleaner:
+            match_job[j] = c
+            match_cleaner[c] = j
+    neighbours = [[c for _, c in edges] for edges in adj]
+    reachable = {c for edges in neighbours for c in edges}
+
+    while len(match_cleaner) < len(reachable):
+        # Hopcroft-Karp phase: layer from every free job, stop at free cleaners
+        dist = [-1] * n
+        queue = [j for j in range(n) if match_job[j] is None and neighbours[j]]
+        for j in queue:
+            dist[j] = 0
+        found, head = False, 0
+        while head < len(queue):
+            j = queue[head]
+            head += 1
+            for c in neighbours[j]:
+                m = match_cleaner.get(c)
+                if m is None:
+                    found = True
+                elif dist[m] < 0:
+                    dist[m] = dist[j] + 1
+                    queue.append(m)
+        if not found:
+            break
+        ptr = [0] * n
+        augmented = False
+        for root in range(n):
+            if match_job[root] is not None or dist[root] != 0:
+                continue
+            stack, via = [root], []
+            while stack:
+                j = stack[-1]
+                if ptr[j] == len(neighbours[j]):
+                    dist[j] = -1  # dead end for the rest of this phase
+                    stack.pop()
+                    if via:
+                        via.pop()
+                    continue
+                c = neighbours[j][ptr[j]]
+                ptr[j] += 1
+                m = match_cleaner.get(c)
+                if m is None:
+                    via.append(c)
+                    for jj, cc in zip(stack, via):
+                        match_job[jj] = cc
+                        match_cleaner[cc] = jj
+                    augmented = True
+                    break
+                if dist[m] == dist[j] + 1:
+                    stack.append(m)
+                    via.append(c)
+        if not augmented:
+            break
+    return match_job
+
+
+def solve(jobs: list[DispatchJob], cleaners: list[DispatchCleaner], params: DispatchParams = DispatchParams()) -> list[tuple[int, int]]:
+    """Pure function (runs in the worker process): returns (job_id, cleaner_id) pairs."""
+    ranked = sorted(cleaners, key=lambda c: c.rating, reverse=True)
+    lats = [j.lat for j in jobs if j.lat is not None]
+    project = Projection(sum(lats) / len(lats) if lats else 0.0)
+    where = [project(c.lat, c.lng) for c in ranked]
+    everyone = list(range(len(ranked)))
+    assignments = []
+    for instant, wave in waves(jobs):
+        pool = everyone
+        if len(wave) >= PREFILTER_WAVE:
+            pool = [i for i in everyone if ranked[i].is_free(instant, instant, params.buffer)]
+        load: dict[int, int] = {}
+        adj = []
+        for n, job in enumerate(wave, 1):
+            adj.append(_candidates(job, project(job.lat, job.lng), ranked, where, pool, load, params))
+            if n % COMPACT_EVERY == 0:
+                pool = [i for i in pool if load.get(i, 0) < params.fanout]
+        for job, idx in zip(wave, _match_wave(adj)):
+            if idx is not None:
+                cleaner = ranked[idx]
+                cleaner.add_busy(job.start, job.end)
+                assignments.append((job.id, cleaner.id))
+    return assignments
+
+
+def load_snapshot(db: Session, now: Optional[datetime] = None, horizon: timedelta = DISPATCH_HORIZON) -> tuple[list[DispatchJob], list[DispatchCleaner]]:
+    now = now or datetime.utcnow()
+    J, P = models.CleaningJob, models.Property
+
+    def shard_part(s: Session) -> tuple[list[DispatchJob], list[tuple[int, datetime, datetime]]]:
+        jobs = [
+            DispatchJob(job_id, to_ts(start), to_ts(end), lat, lng)
+            for job_id, start, end, lat, lng in s.query(J.id, J.booking_start, J.booking_end, P.latitude, P.longitude)
+            .join(P, P.id == J.property_id)
+            .filter(J.status == models.JobStatus.open, J.booking_start >= now, J.booking_start < now + horizon)
+        ]
+        # booking_start bound keeps this on the (status, booking_start) index
+        active = s.query(J.cleaner_id, J.booking_start, J.booking_end).filter(
+            J.status.in_([models.JobStatus.claimed, models.JobStatus.in_progress]),
+            J.booking_start >= now - timedelta(days=1),
+            J.booking_start < now + horizon + timedelta(days=1),
+        ).all()
+        return jobs, active
+
+    jobs = []
+    windows: dict[int, list[tuple[float, float]]] = {}
+    for part_jobs, active in fan_out(db, shard_part):
+        jobs.extend(part_jobs)
+        for cleaner_id, start, end in active:
+            if cleaner_id is not None:
+                windows.setdefault(cleaner_id, []).append((to_ts(start), to_ts(end)))
+    cleaners = []
+    for cleaner_id, avg, count, lat, lng in db.query(
+        models.Cleaner.id, models.Cleaner.avg_rating, models.Cleaner.ratings_count,
+        models.Cleaner.latitude, models.Cleaner.longitude,
+    ):
+        starts, ends = merge_windows(windows.get(cleaner_id, []))
+        cleaners.append(DispatchCleaner(cleaner_id, (avg or 0) if count else UNRATED_RATING, lat, lng, starts, ends))
+    return jobs, cleaners
+
+
+def commit_assignments(db: Session, assignments: list[tuple[int, int]]) -> int:
+    """Claim in short batches; jobs claimed elsewhere since the snapshot are skipped.
+    Each batch commits together with its outbox notifications. Sharded, every
+    shard claims the jobs it holds, concurrently."""
+    def commit(s: Session) -> int:
+        claimed = 0
+        for i in range(0, len(assignments), COMMIT_BATCH):
+            batch = assignments[i:i + COMMIT_BATCH]
+            if try_claim_many(s, batch):
+                claimed += enqueue_claims(s, batch)
+            s.commit()
+        return claimed
+
+    return sum(fan_out(db, commit))
+
+
+_pool: Optional[futures_process.ProcessPoolExecutor] = None
+_lock = asyncio.Lock()
+
+
+def solver_pool() -> futures_process.ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: never fork a process that holds threads and DB connections
+        _pool = futures_process.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_solver_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def run_dispatch(dry_run: bool = False, params: Optional[DispatchParams] = None) -> DispatchResult:
+    """One dispatch pass; concurrent callers queue behind the running pass."""
+    params = params or DispatchParams()
+    async with _lock:
+        result = DispatchResult(dry_run=dry_run)
+
+        def _snapshot():
+            db = SessionLocal()
+            try:
+                return load_snapshot(db)
+            finally:
+                db.close()
+
+        t0 = time.perf_counter()
+        jobs, cleaners = await run_in_threadpool(_snapshot)
+        t1 = time.perf_counter()
+        result.jobs, result.cleaners = len(jobs), len(cleaners)
+        if jobs and cleaners:
+            loop = asyncio.get_running_loop()
+            try:
+                result.assignments = await loop.run_in_executor(solver_pool(), solve, jobs, cleaners, params)
+            except futures_process.BrokenProcessPool:
+                shutdown_solver_pool()  # the next pass starts a fresh worker
+                raise
+        t2 = time.perf_counter()
+        result.assigned = len(result.assignments)
+        if not dry_run and result.assignments:
+            def _commit():
+                db = SessionLocal()
+                try:
+                    return commit_assignments(db, result.assignments)
+                finally:
+                    db.close()
+
+            result.claimed = await run_in_threadpool(_commit)
+            result.conflicts = result.assigned - result.claimed
+        t3 = time.perf_counter()
+        result.snapshot_ms, result.solve_ms, result.commit_ms = (t1 - t0) * 1000, (t2 - t1) * 1000, (t3 - t2) * 1000
+        return result
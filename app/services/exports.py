@@ -0,0 +1,167 @@
+"""
+Streaming exports of jobs with their property, rating and checklist.
+
+One Core SELECT (no ORM identity map) joins cleaning_jobs, properties, ratings
+and checklist_items in job id order and is read with ``yield_per``, so only the
+current job's items and one output buffer are ever held in memory. Output is
+flushed in EXPORT_CHUNK pieces, optionally through a streaming gzip
+compressor. Every record carries job_id, so an interrupted download resumes
+with ``after_id=<last complete job_id>``.
+"""
+from __future__ import annotations
+import csv
+import heapq
+import io
+import json
+import os
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import Integer, String, select, type_coerce
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..sharding import session
+
+
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "2000"))
+EXPORT_CHUNK = 64 * 1024
+CSV_COLUMNS = [
+    "job_id", "property_id", "property_name", "property_address", "host_id", "cleaner_id", "status",
+    "booking_start", "booking_end", "created_at", "completed_at", "rating_stars", "rating_feedback",
+    "checklist_total", "checklist_checked", "checklist_photos",
+]
+
+
+@dataclass
+class ExportFilter:
+    host_id: Optional[int] = None
+    start: Optional[datetime] = None  # booking_start >= start
+    end: Optional[datetime] = None  # booking_start < end
+    after_id: int = 0
+
+
+def export_query(f: ExportFilter):
+    J = models.CleaningJob.__table__
+    P = models.Property.__table__
+    R = models.Rating.__table__
+    I = models.ChecklistItem.__table__  # noqa: E741
+
+    def raw(col):
+        # Stored text as-is: skips parsing every datetime/enum only to format it again
+        return type_coerce(col, String)
+
+    stmt = (
+        select(
+            J.c.id, J.c.property_id, P.c.name, P.c.address, J.c.host_id, J.c.cleaner_id, raw(J.c.status),
+            raw(J.c.booking_start), raw(J.c.booking_end), raw(J.c.created_at), raw(J.c.completed_at),
+            R.c.stars, R.c.feedback,
+            I.c.id, I.c.text, type_coerce(I.c.checked, Integer), raw(I.c.checked_at), I.c.photo_path,
+        )
+        .select_from(
+            J.join(P, P.c.id == J.c.property_id)
+            .outerjoin(R, R.c.job_id == J.c.id)
+            .outerjoin(I, I.c.job_id == J.c.id)
+        )
+        .where(J.c.id > f.after_id)
+        .order_by(J.c.id)
+    )
+    if f.host_id is not None:
+        stmt = stmt.where(J.c.host_id == f.host_id)
+    if f.start is not None:
+        stmt = stmt.where(J.c.booking_start >= f.start)
+    if f.end is not None:
+        stmt = stmt.where(J.c.booking_start < f.end)
+    return stmt
+
+
+def _iso(value: Optional[str]) -> Optional[str]:
+    # "2026-01-02 10:00:00.000000" as stored -> ISO 8601 like the JSON API
+    return value.replace(" ", "T", 1) if value else value
+
+
+JOB_FIELDS = len(CSV_COLUMNS) - 3  # the rest are checklist aggregates
+
+
+def iter_jobs(db: Session, f: ExportFilter) -> Iterator[dict]:
+    """One dict per job, checklist nested, grouped from the joined row stream."""
+    current: Optional[dict] = None
+    current_id = None
+    rows = db.execute(export_query(f).execution_options(yield_per=EXPORT_YIELD_PER)).tuples()
+    for row in rows:
+        if row[0] != current_id:
+            if current is not None:
+                yield current
+            current_id = row[0]
+            current = dict(zip(CSV_COLUMNS[:JOB_FIELDS], row[:JOB_FIELDS]))
+            for key in ("booking_start", "booking_end", "created_at", "completed_at"):
+                current[key] = _iso(current[key])
+            current["checklist"] = []
+        if row[13] is not None:
+            current["checklist"].append({
+                "id": row[13], "text": row[14], "checked": bool(row[15]),
+                "checked_at": _iso(row[16]), "photo_path": row[17],
+            })
+    if current is not None:
+        yield current
+
+
+def render_csv(records: Iterable[dict]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_COLUMNS)
+    for rec in records:
+        items = rec["checklist"]
+        writer.writerow([rec[k] for k in CSV_COLUMNS[:JOB_FIELDS]] + [
+            len(items), sum(1 for i in items if i["checked"]), sum(1 for i in items if i["photo_path"]),
+        ])
+        if buf.tell() >= EXPORT_CHUNK:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def render_ndjson(records: Iterable[dict]) -> Iterator[str]:
+    lines = []
+    size = 0
+    for rec in records:
+        line = json.dumps(rec, separators=(",", ":")) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK:
+            yield "".join(lines)
+            lines, size = [], 0
+    yield "".join(lines)
+
+
+def encode(chunks: Iterable[str], gzip: bool) -> Iterator[bytes]:
+    if not gzip:
+        for chunk in chunks:
+            if chunk:
+                yield chunk.encode()
+        return
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        out = z.compress(chunk.encode())
+        if out:
+            yield out
+    yield z.flush()
+
+
+def stream_export(f: ExportFilter, fmt: str, gzip: bool = False, shards: Optional[list[int]] = None) -> Iterator[bytes]:
+    """Owns its sessions: the response body is produced after the endpoint
+    (and its request-scoped session) has returned. With several ``shards``
+    their streams are merged, so records stay in job id order."""
+    sessions = [session(k) for k in shards or [0]]
+    try:
+        streams = [iter_jobs(db, f) for db in sessions]
+        records = streams[0] if len(streams) == 1 else heapq.merge(*streams, key=lambda rec: rec["job_id"])
+        chunks = render_csv(records) if fmt == "csv" else render_ndjson(records)
+        yield from encode(chunks, gzip)
+    finally:
+        for db in sessions:
+            db.close()
@@ -0,0 +1,367 @@
+"""
+Content-addressed media store for checklist evidence photos.
+
+Files are named by SHA-256 and sharded two levels deep
+(`media/ab/cd/abcd…ef.jpg`), so identical uploads (client retries) share one
+file and no directory grows past a few thousand entries. `media_blobs` keeps a
+reference count mirroring `ChecklistItem.photo_path`; blobs that drop to zero
+references are reclaimed by `collect_garbage` after a grace period, together
+with their resized variants (`<digest>-<edge>.jpg`, see photos.py).
+
+JPEG metadata (EXIF, XMP, IPTC, comments) is dropped while staging, before
+hashing, so `/media` never serves a photo's GPS position or camera details.
+Only the EXIF orientation survives; the compressed pixels are copied as is.
+"""
+from __future__ import annotations
+import glob
+import hashlib
+import os
+import re
+import struct
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import BinaryIO, Optional
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..sharding import fan_out
+from .static_assets import IMMUTABLE_CACHE, REVALIDATE_CACHE, CachedStaticFiles
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MEDIA_DIR = os.path.abspath(os.getenv("MEDIA_DIR", os.path.join(ROOT_DIR, "media")))
+MEDIA_URL_PREFIX = "/media/"
+STAGING_DIR = ".staging"
+GC_GRACE = timedelta(seconds=int(os.getenv("MEDIA_GC_GRACE_SECONDS", "3600")))
+SHARDED_PATH = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]{1,8})?$")
+# Resized variants of a sharded blob, named by the blob's digest and longest edge
+VARIANT_PATH = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}-[0-9]{2,5}\.jpg$")
+_SAFE_EXT = re.compile(r"^\.[a-z0-9]{1,8}$")
+CHUNK = 1024 * 1024
+# JPEG segments holding metadata rather than pixels: APP1 (EXIF, XMP), APP13 (IPTC), COM
+JPEG_METADATA_MARKERS = {0xE1, 0xED, 0xFE}
+EXIF_HEADER = b"Exif\x00\x00"
+
+
+@dataclass
+class StagedBlob:
+    digest: str
+    tmp_path: str
+    size: int
+
+
+def safe_ext(filename: Optional[str]) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if _SAFE_EXT.match(ext) else ".bin"
+
+
+class _Prefixed:
+    """``head`` followed by the rest of ``fileobj``, for ``read(n)`` callers."""
+
+    def __init__(self, head: bytes, fileobj: BinaryIO) -> None:
+        self.head = head
+        self.fileobj = fileobj
+
+    def read(self, n: int = -1) -> bytes:
+        if not self.head:
+            return self.fileobj.read(n)
+        if n < 0:
+            chunk, self.head = self.head + self.fileobj.read(), b""
+        else:
+            chunk, self.head = self.head[:n], self.head[n:]
+        return chunk
+
+
+def _exif_orientation(tiff: bytes) -> Optional[int]:
+    """Orientation tag of IFD0 in a TIFF-structured EXIF block."""
+    order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if order is None or len(tiff) < 8:
+        return None
+    ifd = struct.unpack(order + "I", tiff[4:8])[0]
+    if ifd + 2 > len(tiff):
+        return None
+    for i in range(struct.unpack(order + "H", tiff[ifd:ifd + 2])[0]):
+        entry = tiff[ifd + 2 + 12 * i:ifd + 14 + 12 * i]
+        if len(entry) < 12:
+            return None
+        tag, kind = struct.unpack(order + "HH", entry[:4])
+        if tag == 0x0112 and kind == 3:
+            return struct.unpack(order + "H", entry[8:10])[0]
+    return None
+
+
+def _orientation_segment(orientation: int) -> bytes:
+    """APP1 segment with an EXIF block holding only the orientation."""
+    tiff = b"MM\x00\x2a" + struct.pack(">IHHHIHHI", 8, 1, 0x0112, 3, 1, orientation, 0, 0)
+    payload = EXIF_HEADER + tiff
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def strip_jpeg_metadata(fileobj: BinaryIO) -> BinaryIO:
+    """Stream of ``fileobj`` with JPEG metadata segments removed, orientation kept.
+
+    Only the segments before the image data are rewritten; anything that is
+    not a well-formed JPEG header passes through unchanged.
+    """
+    head = fileobj.read(2)
+    if head != b"\xff\xd8":
+        return _Prefixed(head, fileobj)
+    out = [head]
+    while True:
+        marker = fileobj.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF or marker[1] in (0xD8, 0xD9, 0xFF):
+            return _Prefixed(b"".join(out) + marker, fileobj)
+        if marker[1] == 0xDA:  # start of scan: image data follows
+            return _Prefixed(b"".join(out) + marker, fileobj)
+        size = fileobj.read(2)
+        length = struct.unpack(">H", size)[0] if len(size) == 2 else 0
+        payload = fileobj.read(length - 2) if length >= 2 else b""
+        if length < 2 or len(payload) < length - 2:
+            return _Prefixed(b"".join(out) + marker + size + payload, fileobj)
+        if marker[1] not in JPEG_METADATA_MARKERS:
+            out.append(marker + size + payload)
+        elif payload.startswith(EXIF_HEADER):
+            orientation = _exif_orientation(payload[len(EXIF_HEADER):])
+            if orientation is not None:
+                out.append(_orientation_segment(orientation))
+
+
+class MediaStore:
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def ensure_root(self) -> str:
+        os.makedirs(os.path.join(self.root, STAGING_DIR), exist_ok=True)
+        return self.root
+
+    @staticmethod
+    def relpath(digest: str, ext: str) -> str:
+        return f"{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+    @staticmethod
+    def variant_relpath(rel: str, edge: int) -> str:
+        return f"{os.path.splitext(rel)[0]}-{edge}.jpg"
+
+    def abspath(self, rel: str) -> str:
+        return os.path.join(self.root, *rel.split("/"))
+
+    @staticmethod
+    def url(rel: str) -> str:
+        return MEDIA_URL_PREFIX + rel
+
+    @staticmethod
+    def rel_from_url(url: Optional[str]) -> Optional[str]:
+        if url and url.startswith(MEDIA_URL_PREFIX):
+            return url[len(MEDIA_URL_PREFIX):]
+        return None
+
+    def stage(self, fileobj: BinaryIO) -> StagedBlob:
+        """Stream ``fileobj``, minus JPEG metadata, to a temp file while hashing it."""
+        self.ensure_root()
+        fileobj = strip_jpeg_metadata(fileobj)
+        h = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.root, STAGING_DIR))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = fileobj.read(CHUNK)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return StagedBlob(digest=h.hexdigest(), tmp_path=tmp, size=size)
+
+    def publish(self, staged: StagedBlob, rel: str) -> None:
+        dest = self.abspath(rel)
+        if os.path.exists(dest):
+            # Duplicate upload: content is identical by construction
+            os.unlink(staged.tmp_path)
+            return
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(staged.tmp_path, dest)
+
+    def discard(self, staged: StagedBlob) -> None:
+        try:
+            os.unlink(staged.tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, rel: str) -> None:
+        """Remove a blob and any variants rendered from it."""
+        path = self.abspath(rel)
+        for p in [path, *glob.glob(glob.escape(os.path.splitext(path)[0]) + "-*.jpg")]:
+            try:
+                os.unlink(p)
+            except FileNotFoundError:
+                pass
+
+    def sweep_staging(self, older_than: timedelta) -> int:
+        """Remove temp files left behind by crashed uploads."""
+        staging = os.path.join(self.root, STAGING_DIR)
+        cutoff = time.time() - older_than.total_seconds()
+        removed = 0
+        try:
+            entries = list(os.scandir(staging))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+
+MEDIA_STORE = MediaStore(MEDIA_DIR)
+
+
+def add_ref(db: Session, staged: StagedBlob, ext: str) -> models.MediaBlob:
+    """Register (or dedup onto) the blob for ``staged`` and take a reference."""
+    rel = MediaStore.relpath(staged.digest, ext)
+    db.execute(
+        sqlite_insert(models.MediaBlob)
+        .values(digest=staged.digest, path=rel, size=staged.size, ref_count=0, created_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=["digest"])
+    )
+    db.execute(
+        update(models.MediaBlob)
+        .where(models.MediaBlob.digest == staged.digest)
+        .values(ref_count=models.MediaBlob.ref_count + 1, orphaned_at=None)
+    )
+    return db.query(models.MediaBlob).filter(models.MediaBlob.digest == staged.digest).one()
+
+
+def release_ref(db: Session, url: Optional[str]) -> None:
+    rel = MediaStore.rel_from_url(url)
+    if not rel or not SHARDED_PATH.match(rel):
+        return
+    db.execute(
+        update(models.MediaBlob)
+        .where(models.MediaBlob.path == rel, models.MediaBlob.ref_count > 0)
+        .values(ref_count=models.MediaBlob.ref_count - 1)
+    )
+    db.execute(
+        update(models.MediaBlob)
+        .where(models.MediaBlob.path == rel, models.MediaBlob.ref_count <= 0, models.MediaBlob.orphaned_at.is_(None))
+        .values(orphaned_at=datetime.utcnow())
+    )
+
+
+def attach_photo(db: Session, item: models.ChecklistItem, staged: StagedBlob, ext: str) -> str:
+    """Point ``item`` at the staged blob, releasing whatever it referenced before.
+
+    Flushes but does not commit; publish the staged file before committing so a
+    committed photo_path always has a file behind it.
+    """
+    blob = add_ref(db, staged, ext)
+    # Also correct when re-uploading the same photo: +1 then -1 on one blob
+    release_ref(db, item.photo_path)
+    item.photo_path = MediaStore.url(blob.path)
+    # Variants are rendered in the background (photos.py)
+    item.photo_status = models.PhotoStatus.pending
+    item.photo_size = blob.size
+    item.photo_width = item.photo_height = item.photo_thumb_path = item.photo_web_path = None
+    db.flush()
+    return blob.path
+
+
+def photo_refs(db: Session, urls: Optional[list[str]] = None) -> Counter:
+    """Checklist items per photo url (all media urls when ``urls`` is None), on every shard."""
+    I = models.ChecklistItem
+
+    def count(s: Session) -> list[tuple[str, int]]:
+        q = s.query(I.photo_path, func.count(I.id))
+        q = q.filter(I.photo_path.like(MEDIA_URL_PREFIX + "%")) if urls is None else q.filter(I.photo_path.in_(urls))
+        return q.group_by(I.photo_path).all()
+
+    refs: Counter = Counter()
+    for part in fan_out(db, count):
+        refs.update(dict(part))
+    return refs
+
+
+def collect_garbage(db: Session, store: MediaStore = MEDIA_STORE, batch_size: int = 500, grace: timedelta = GC_GRACE) -> int:
+    """One incremental GC pass: reclaim up to ``batch_size`` unreferenced blobs.
+
+    Call repeatedly until it returns 0 to drain the backlog.
+    """
+    cutoff = datetime.utcnow() - grace
+    candidates = (
+        db.query(models.MediaBlob)
+        .filter(models.MediaBlob.ref_count <= 0, models.MediaBlob.orphaned_at <= cutoff)
+        .order_by(models.MediaBlob.orphaned_at.asc())
+        .limit(batch_size)
+        .all()
+    )
+    reclaimed = 0
+    refs_by_url = photo_refs(db, [MediaStore.url(blob.path) for blob in candidates])
+    for blob in candidates:
+        refs = refs_by_url.get(MediaStore.url(blob.path), 0)
+        if refs:
+            # Count drifted (e.g. direct SQL edits); trust the items
+            blob.ref_count = refs
+            blob.orphaned_at = None
+            continue
+        # Conditional delete so a concurrent upload that re-referenced the blob wins.
+        # The file goes before the delete commits: until then this transaction
+        # holds SQLite's write lock, so an upload of the same bytes cannot insert
+        # the blob again (and publish its file) only for us to remove it.
+        res = db.execute(
+            delete(models.MediaBlob).where(models.MediaBlob.id == blob.id, models.MediaBlob.ref_count <= 0)
+        )
+        try:
+            if res.rowcount:
+                store.remove(blob.path)
+                reclaimed += 1
+        except BaseException:
+            db.rollback()
+            raise
+        db.commit()
+    db.commit()
+    store.sweep_staging(grace)
+    return reclaimed
+
+
+def rebuild_refcounts(db: Session) -> None:
+    """Recompute every blob's ref_count from checklist_items.photo_path."""
+    counts = photo_refs(db)
+    now = datetime.utcnow()
+    for blob in db.query(models.MediaBlob).yield_per(1000):
+        refs = counts.get(MediaStore.url(blob.path), 0)
+        blob.ref_count = refs
+        if refs:
+            blob.orphaned_at = None
+        elif blob.orphaned_at is None:
+            blob.orphaned_at = now
+    db.commit()
+
+
+class MediaFiles(CachedStaticFiles):
+    """Serves the media store: content-addressed files are immutable forever."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        kwargs.setdefault("precompress", False)
+        super().__init__(*args, **kwargs)
+
+    def lookup_path(self, path: str):
+        # Never expose staging/temp files
+        if any(part.startswith(".") for part in path.replace("\\", "/").split("/")):
+            return "", None
+        return super().lookup_path(path)
+
+    def cache_control(self, full_path: str) -> str:
+        rel = os.path.relpath(full_path, os.path.realpath(self.directory)).replace(os.sep, "/")
+        return IMMUTABLE_CACHE if SHARDED_PATH.match(rel) or VARIANT_PATH.match(rel) else REVALIDATE_CACHE
@@ -0,0 +1,425 @@
+"""
+Transactional notification outbox.
+
+Endpoints that change a job add `OutboxMessage` rows in the same transaction
+as the change (`enqueue`, `enqueue_claims`), so a notification exists exactly
+when its change committed and a crash can lose neither. A message becomes due
+OUTBOX_COALESCE_SECONDS after it is written; reminders are due
+REMINDER_LEAD_MINUTES before the job's booking_end.
+
+`drain` delivers in passes. Each pass takes the OUTBOX_BATCH oldest due
+messages, pulls everything else due for the same recipients and renders one
+digest per recipient, so a cleaner handed 30 jobs by a dispatch pass gets one
+email, not 30. Digests go out through the transport with at most
+OUTBOX_CONCURRENCY in flight. A failed digest is retried with jittered
+exponential backoff and is marked dead after OUTBOX_MAX_ATTEMPTS.
+
+A pass leases the messages it claims (`claim_due`) by pushing their
+next_attempt_at OUTBOX_LEASE_SECONDS ahead in one conditional UPDATE, and sends
+only the rows that UPDATE returned, so several workers or replicas can drain
+the same outbox without duplicates. Delivery is at-least-once: a crash between
+sending and recording resends those messages once the lease runs out.
+
+Transports are pluggable (`TRANSPORTS`, `set_transport`). "log" (the default)
+logs to ``app.notifications``, "file" appends one JSON line per digest and
+"smtp" sends mail through OUTBOX_SMTP_HOST.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional, Protocol
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..lazy import LazyModule
+from ..sharding import fan_out, session, shard_ids
+
+
+OUTBOX_INTERVAL = int(os.getenv("OUTBOX_INTERVAL_SECONDS", "5"))  # 0 disables the periodic drain
+OUTBOX_COALESCE = timedelta(seconds=int(os.getenv("OUTBOX_COALESCE_SECONDS", "30")))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "200"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "8"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "30"))
+OUTBOX_BACKOFF_MAX = 3600.0
+# How long a claimed message is hidden from other drains; must outlast a send
+OUTBOX_LEASE = timedelta(seconds=int(os.getenv("OUTBOX_LEASE_SECONDS", "300")))
+OUTBOX_TRANSPORT = os.getenv("OUTBOX_TRANSPORT", "log")
+REMINDER_LEAD = timedelta(minutes=int(os.getenv("REMINDER_LEAD_MINUTES", "60")))
+DIGEST_MAX = 50  # lines per digest; the rest go in the recipient's next one
+MAX_PASSES = 50  # per drain, so one tick cannot hog the scheduler
+# Must match the partial index predicates verbatim (and stay literal, not bound)
+# for SQLite to use them
+PENDING_WHERE = "status = 'pending'"
+
+log = logging.getLogger("app.notifications")
+# Only the smtp transport needs these
+smtplib = LazyModule("smtplib")
+email_message = LazyModule("email.message")
+
+TEMPLATES = {
+    "job_posted": ("Job posted", "Job #{job_id} at {property} is posted for {start}."),
+    "job_claimed": ("Job claimed", "{cleaner} claimed job #{job_id} at {property} ({start})."),
+    "job_completed": ("Job completed", "Job #{job_id} at {property} is complete."),
+    "job_rated": ("New rating", "Job #{job_id} at {property} was rated {stars}/5."),
+    "job_upcoming": ("Upcoming job", "Reminder: job #{job_id} at {property} ends at {end}."),
+}
+
+
+# Writing (inside the caller's transaction)
+
+def _payload(property_name: str, start: datetime, end: datetime, **extra) -> str:
+    return json.dumps({"property": property_name, "start": start.isoformat(), "end": end.isoformat(), **extra})
+
+
+def reminder_due(end: datetime) -> Optional[datetime]:
+    due = end - REMINDER_LEAD
+    return due if due > datetime.utcnow() else None
+
+
+def enqueue(db: Session, recipient_id: int, kind: str, job: models.CleaningJob, property_name: str,
+            due: Optional[datetime] = None, **extra) -> None:
+    """Add one message to ``db``'s transaction; nothing is written unless the caller commits."""
+    now = datetime.utcnow()
+    db.add(models.OutboxMessage(
+        recipient_id=recipient_id, kind=kind, job_id=job.id, created_at=now,
+        payload=_payload(property_name, job.booking_start, job.booking_end, **extra),
+        next_attempt_at=due or now + OUTBOX_COALESCE,
+    ))
+
+
+def enqueue_claims(db: Session, claims: list[tuple[int, int]]) -> int:
+    """Messages for (job_id, cleaner_id) claims made in this transaction: the host
+    hears who claimed, the cleaner gets a reminder. Claims that did not stick
+    (job now held by someone else) are skipped. Returns the claims notified."""
+    J, P, H, C = (m.__table__ for m in (models.CleaningJob, models.Property, models.Host, models.Cleaner))
+    wanted = dict(claims)
+    rows = db.execute(
+        select(J.c.id, J.c.cleaner_id, J.c.booking_start, J.c.booking_end, P.c.name, H.c.user_id, C.c.user_id, C.c.name)
+        .select_from(J.join(P, P.c.id == J.c.property_id).join(H, H.c.id == P.c.host_id).join(C, C.c.id == J.c.cleaner_id))
+        .where(J.c.id.in_(list(wanted)))
+    ).all()
+    now = datetime.utcnow()
+    out = []
+    for job_id, cleaner_id, start, end, prop, host_user, cleaner_user, cleaner_name in rows:
+        if wanted.get(job_id) != cleaner_id:
+            continue
+        out.append({
+            "recipient_id": host_user, "kind": "job_claimed", "job_id": job_id, "created_at": now,
+            "payload": _payload(prop, start, end, cleaner=cleaner_name or f"Cleaner {cleaner_id}"),
+            "next_attempt_at": now + OUTBOX_COALESCE,
+        })
+        due = reminder_due(end)
+        if due:
+            out.append({
+                "recipient_id": cleaner_user, "kind": "job_upcoming", "job_id": job_id, "created_at": now,
+                "payload": _payload(prop, start, end), "next_attempt_at": due,
+            })
+    if out:
+        db.execute(insert(models.OutboxMessage), [{"status": models.OutboxStatus.pending, "attempts": 0, **m} for m in out])
+    return len({m["job_id"] for m in out})
+
+
+# Transports
+
+@dataclass
+class Digest:
+    recipient_id: int
+    to: str
+    subject: str
+    body: str
+    ids: list[int] = field(default_factory=list)
+    created: list[datetime] = field(default_factory=list)
+    attempts: int = 0
+
+
+class Transport(Protocol):
+    def send(self, digest: Digest) -> None:
+        """Deliver or raise; called from worker threads."""
+
+
+class LogTransport:
+    def send(self, digest: Digest) -> None:
+        log.info("notify to=%s subject=%s lines=%d", digest.to, digest.subject, len(digest.ids))
+
+
+class FileTransport:
+    """Local sink: one JSON line per digest, for tests and development."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or os.getenv("OUTBOX_FILE", "outbox.jsonl")
+        self._lock = threading.Lock()
+
+    def send(self, digest: Digest) -> None:
+        line = json.dumps({"to": digest.to, "subject": digest.subject, "body": digest.body, "messages": len(digest.ids)})
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class SMTPTransport:
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, sender: Optional[str] = None) -> None:
+        self.host = host or os.getenv("OUTBOX_SMTP_HOST", "localhost")
+        self.port = port or int(os.getenv("OUTBOX_SMTP_PORT", "25"))
+        self.sender = sender or os.getenv("OUTBOX_FROM", "no-reply@localhost")
+
+    def send(self, digest: Digest) -> None:
+        msg = email_message.EmailMessage()
+        msg["From"], msg["To"], msg["Subject"] = self.sender, digest.to, digest.subject
+        msg.set_content(digest.body)
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.send_message(msg)
+
+
+TRANSPORTS = {"log": LogTransport, "file": FileTransport, "smtp": SMTPTransport}
+_transport: Optional[Transport] = None
+
+
+def get_transport() -> Transport:
+    global _transport
+    if _transport is None:
+        _transport = TRANSPORTS[OUTBOX_TRANSPORT]()
+    return _transport
+
+
+def set_transport(transport: Optional[Transport]) -> None:
+    """Swap the transport (None: back to OUTBOX_TRANSPORT)."""
+    global _transport
+    _transport = transport
+
+
+# Metrics
+
+@dataclass
+class OutboxStats:
+    passes: int = 0
+    delivered: int = 0  # messages
+    digests: int = 0
+    failures: int = 0  # failed digest attempts
+    dead: int = 0
+    skipped: int = 0
+    busy_seconds: float = 0.0
+    last_pass_at: Optional[datetime] = None
+    lags: deque = field(default_factory=lambda: deque(maxlen=2000))  # recent created -> sent, seconds
+
+    def snapshot(self) -> dict:
+        lags = sorted(self.lags)
+        pct = (lambda q: lags[min(len(lags) - 1, int(q * len(lags)))]) if lags else (lambda q: None)
+        return {
+            "passes": self.passes, "delivered": self.delivered, "digests": self.digests, "failures": self.failures,
+            "dead": self.dead, "skipped": self.skipped,
+            "messages_per_second": self.delivered / self.busy_seconds if self.busy_seconds else None,
+            "lag_seconds": {"p50": pct(0.5), "p95": pct(0.95), "max": lags[-1] if lags else None,
+                            "mean": statistics.fmean(lags) if lags else None},
+            "last_pass_at": self.last_pass_at,
+        }
+
+
+STATS = OutboxStats()
+
+
+def outbox_stats(db: Session, now: Optional[datetime] = None) -> dict:
+    """Counters since startup plus the current backlog."""
+    now = now or datetime.utcnow()
+    T = models.OutboxMessage.__table__
+    parts = fan_out(db, lambda s: s.execute(
+        select(func.count(), func.count().filter(T.c.next_attempt_at <= now), func.min(T.c.next_attempt_at))
+        .where(text(PENDING_WHERE))
+    ).one())
+    pending, due = sum(p[0] for p in parts), sum(p[1] for p in parts)
+    oldest_due = min((p[2] for p in parts if p[2] is not None), default=None)
+    behind = (now - oldest_due).total_seconds() if oldest_due and oldest_due <= now else 0.0
+    return {**STATS.snapshot(), "pending": pending, "due": due, "oldest_due_seconds": behind}
+
+
+# Delivery
+
+def _render(kind: str, job_id: Optional[int], payload: str) -> tuple[str, str]:
+    subject, template = TEMPLATES.get(kind, (kind, "{kind} for job #{job_id}"))
+    data = json.loads(payload)
+    try:
+        return subject, template.format(kind=kind, job_id=job_id, **data)
+    except KeyError:
+        return subject, f"{subject} (job #{job_id})"
+
+
+def claim_due(db: Session, now: datetime, batch: int = OUTBOX_BATCH) -> tuple[list[Digest], bool]:
+    """Lease the due messages of the recipients of the ``batch`` oldest due
+    messages and return their digests, and whether more may be due. Reminders
+    for completed jobs are marked skipped."""
+    T = models.OutboxMessage.__table__
+    pending = text(PENDING_WHERE)
+    heads = db.execute(
+        select(T.c.recipient_id).where(pending, T.c.next_attempt_at <= now).order_by(T.c.next_attempt_at).limit(batch)
+    ).scalars().all()
+    recipients = list(dict.fromkeys(heads))
+    db.commit()  # end the read: SQLite cannot upgrade a stale snapshot to a write
+    if not recipients:
+        return [], False
+    # Lease: a conditional UPDATE moves the rows out of everyone else's due
+    # window, so with several workers or replicas each message goes to exactly
+    # one of them. Only the rows this UPDATE returns are ours to send. A crash
+    # before recording leaves them due again once the lease runs out.
+    rows = sorted(db.execute(
+        update(T).where(pending, T.c.recipient_id.in_(recipients), T.c.next_attempt_at <= now)
+        .values(next_attempt_at=now + OUTBOX_LEASE)
+        .returning(T.c.id, T.c.recipient_id, T.c.kind, T.c.job_id, T.c.payload, T.c.attempts, T.c.created_at)
+    ).all(), key=lambda r: (r.recipient_id, r.id))
+    db.commit()
+    if not rows:
+        return [], len(heads) == batch
+    reminder_jobs = {r.job_id for r in rows if r.kind == "job_upcoming"}
+    done = set()
+    if reminder_jobs:
+        J = models.CleaningJob.__table__
+        done = set(db.execute(
+            select(J.c.id).where(J.c.id.in_(reminder_jobs), J.c.status == models.JobStatus.completed)
+        ).scalars())
+    emails = dict(db.execute(select(models.User.id, models.User.email).where(models.User.id.in_(recipients))).all())
+
+    digests: dict[int, Digest] = {}
+    lines: dict[int, list[str]] = {}
+    skipped = []
+    overflow = []
+    for r in rows:
+        if r.kind == "job_upcoming" and r.job_id in done:
+            skipped.append(r.id)
+            continue
+        d = digests.get(r.recipient_id)
+        if d is None:
+            d = digests[r.recipient_id] = Digest(r.recipient_id, emails.get(r.recipient_id, ""), "", "")
+            lines[r.recipient_id] = []
+        if len(d.ids) >= DIGEST_MAX:
+            overflow.append(r.id)
+            continue
+        subject, line = _render(r.kind, r.job_id, r.payload)
+        d.subject = subject
+        d.ids.append(r.id)
+        d.created.append(r.created_at)
+        d.attempts = max(d.attempts, r.attempts)
+        lines[r.recipient_id].append(line)
+    for rid, d in digests.items():
+        if len(d.ids) > 1:
+            d.subject = f"{len(d.ids)} updates on your cleaning jobs"
+        d.body = "\n".join(f"- {line}" for line in lines[rid]) if len(d.ids) > 1 else lines[rid][0]
+    if skipped:
+        db.execute(update(T).where(T.c.id.in_(skipped)).values(status=models.OutboxStatus.skipped, sent_at=now))
+        STATS.skipped += len(skipped)
+    if overflow:
+        # Over DIGEST_MAX: released for the recipient's next digest
+        db.execute(update(T).where(T.c.id.in_(overflow)).values(next_attempt_at=now))
+    db.commit()
+    return [d for d in digests.values() if d.ids], bool(overflow) or len(heads) == batch
+
+
+def backoff(attempts: int) -> timedelta:
+    """Full-jitter exponential backoff after the ``attempts``-th failure."""
+    ceiling = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF * 2 ** (attempts - 1))
+    return timedelta(seconds=random.uniform(ceiling / 2, ceiling))
+
+
+def record_results(db: Session, sent: list[Digest], failed: list[tuple[Digest, str]], now: datetime,
+                   retry_from: Optional[datetime] = None) -> None:
+    """Mark sent digests' messages sent; reschedule (or bury) failed ones."""
+    T = models.OutboxMessage.__table__
+    retry_from = retry_from or now
+    sent_ids = [i for d in sent for i in d.ids]
+    if sent_ids:
+        db.execute(update(T).where(T.c.id.in_(sent_ids)).values(status=models.OutboxStatus.sent, sent_at=now))
+    for d, error in failed:
+        attempts = d.attempts + 1
+        dead = attempts >= OUTBOX_MAX_ATTEMPTS
+        db.execute(update(T).where(T.c.id.in_(d.ids)).values(
+            attempts=T.c.attempts + 1, last_error=error[:500],
+            status=models.OutboxStatus.dead if dead else models.OutboxStatus.pending,
+            next_attempt_at=retry_from + backoff(attempts),
+        ))
+        if dead:
+            STATS.dead += len(d.ids)
+    db.commit()
+
+
+async def _send_all(transport: Transport, digests: list[Digest], concurrency: int):
+    gate = asyncio.Semaphore(max(1, concurrency))
+    sent: list[Digest] = []
+    failed: list[tuple[Digest, str]] = []
+
+    async def one(d: Digest) -> None:
+        async with gate:
+            try:
+                await run_in_threadpool(transport.send, d)
+                sent.append(d)
+            except Exception as exc:
+                log.warning("notification to user %s failed (attempt %d): %s", d.recipient_id, d.attempts + 1, exc)
+                failed.append((d, f"{type(exc).__name__}: {exc}"))
+
+    await asyncio.gather(*(one(d) for d in digests))
+    return sent, failed
+
+
+# One drain at a time per process; across processes the leases keep drains apart
+_lock = asyncio.Lock()
+
+
+async def drain(transport: Optional[Transport] = None, now: Optional[datetime] = None,
+                concurrency: int = OUTBOX_CONCURRENCY, max_passes: int = MAX_PASSES) -> dict:
+    """Deliver due messages in passes until none are left (or ``max_passes``);
+    ``now`` overrides the clock that decides what is due."""
+    transport = transport or get_transport()
+    totals = {"passes": 0, "digests": 0, "delivered": 0, "failed": 0}
+    async with _lock:
+        # Sharded, each shard's outbox drains in turn (digests coalesce per shard)
+        for shard in shard_ids():
+            for _ in range(max_passes):
+                t0 = time.perf_counter()
+                clock = now or datetime.utcnow()
+
+                def _claim():
+                    db = session(shard)
+                    try:
+                        return claim_due(db, clock)
+                    finally:
+                        db.close()
+
+                digests, more = await run_in_threadpool(_claim)
+                if not digests:
+                    if not more:
+                        break
+                    continue
+                sent, failed = await _send_all(transport, digests, concurrency)
+                sent_at = datetime.utcnow()
+
+                def _record():
+                    db = session(shard)
+                    try:
+                        record_results(db, sent, failed, sent_at, max(clock, sent_at))
+                    finally:
+                        db.close()
+
+                await run_in_threadpool(_record)
+                delivered = sum(len(d.ids) for d in sent)
+                STATS.passes += 1
+                STATS.digests += len(sent)
+                STATS.delivered += delivered
+                STATS.failures += len(failed)
+                STATS.busy_seconds += time.perf_counter() - t0
+                STATS.last_pass_at = sent_at
+                STATS.lags.extend((sent_at - c).total_seconds() for d in sent for c in d.created)
+                totals["passes"] += 1
+                totals["digests"] += len(sent)
+                totals["delivered"] += delivered
+                totals["failed"] += len(failed)
+                if not more:
+                    break
+    return totals
@@ -0,0 +1,261 @@
+"""
+Background variants for checklist evidence photos.
+
+Uploads are stored with their pixels untouched and their metadata stripped
+(media_store.py), and marked ``photo_status = pending``. A process pool then
+decodes each photo once and writes a thumbnail and a web-sized JPEG next to
+it. The variants are rotated upright and carry no EXIF at all. The items get
+the variant URLs, the pixel size and ``ready``. Clients show the original
+until then (`ChecklistItemOut`).
+
+The pending rows are the durable queue. The in-memory queue is bounded. When it
+is full an upload is left for the sweep, which re-queues pending photos at
+startup (after a crash or restart) and every PHOTO_SWEEP_INTERVAL seconds.
+Variants are named by the original's digest, so a blob shared by several items
+is rendered once.
+
+Pillow is optional: without it photos stay pending and clients keep using the
+originals.
+"""
+from __future__ import annotations
+import asyncio
+import importlib.util
+import os
+import tempfile
+from collections import Counter
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import SessionLocal
+from ..lazy import LazyModule
+from ..sharding import fan_out
+from .media_store import MEDIA_STORE, STAGING_DIR, MediaStore
+
+
+# Longest edge in pixels -> JPEG quality. Variant URLs are cached as immutable:
+# use a new edge when changing how a variant is encoded.
+PHOTO_VARIANTS = {"thumb": (320, 70), "web": (1600, 82)}
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", str(os.cpu_count() or 1)))
+PHOTO_QUEUE_MAX = int(os.getenv("PHOTO_QUEUE_MAX", "256"))
+PHOTO_SWEEP_INTERVAL = int(os.getenv("PHOTO_SWEEP_SECONDS", "60"))  # 0 disables the periodic sweep
+PHOTO_MAX_PIXELS = int(os.getenv("PHOTO_MAX_PIXELS", str(60_000_000)))  # larger images are refused (decompression bombs)
+PHOTO_MAX_CRASHES = 3  # worker crashes on one photo before it is marked failed
+# Literal, so SQLite can use the partial index ix_checklist_items_photo_pending
+PENDING_WHERE = "photo_status = 'pending'"
+
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+Image = LazyModule("PIL.Image")
+ImageOps = LazyModule("PIL.ImageOps")
+# Imported with the first worker pool, not at app startup
+multiprocessing = LazyModule("multiprocessing")
+futures_process = LazyModule("concurrent.futures.process")
+
+# EXIF orientations that swap width and height
+_TRANSPOSED = {5, 6, 7, 8}
+
+
+def render(src: str, rel: str, root: str = MEDIA_STORE.root) -> dict:
+    """Write every variant of the original at ``root/rel``; runs in a worker process.
+
+    Returns the upright pixel size and the variant paths. Variants already on
+    disk are reused, so re-running after a crash costs one header read.
+    """
+    store = MediaStore(root)
+    targets = {name: (edge, quality, store.variant_relpath(rel, edge)) for name, (edge, quality) in PHOTO_VARIANTS.items()}
+    with Image.open(src) as im:  # reads the header only
+        width, height = im.size
+        if width * height > PHOTO_MAX_PIXELS:
+            raise ValueError(f"{width}x{height} is over PHOTO_MAX_PIXELS")
+        if im.getexif().get(0x0112) in _TRANSPOSED:
+            width, height = height, width
+        todo = {name: t for name, t in targets.items() if not os.path.exists(store.abspath(t[2]))}
+        if todo:
+            # JPEG: decode straight at the smallest 1/2^n scale that still covers
+            # the largest variant (DCT scaling); a no-op for other formats
+            k = max(edge for edge, _, _ in todo.values()) / max(im.size)
+            if k < 1:
+                im.draft("RGB", (int(im.size[0] * k), int(im.size[1] * k)))
+            img = ImageOps.exif_transpose(im)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            # Largest first, each one resized from the previous
+            for name, (edge, quality, vrel) in sorted(todo.items(), key=lambda kv: -kv[1][0]):
+                img = img.copy()
+                img.thumbnail((edge, edge))
+                fd, tmp = tempfile.mkstemp(dir=os.path.join(root, STAGING_DIR))
+                try:
+                    with os.fdopen(fd, "wb") as out:
+                        # No exif= argument: nothing from the original's metadata is written
+                        img.save(out, "JPEG", quality=quality, optimize=True, progressive=edge > 800)
+                    dest = store.abspath(vrel)
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    os.replace(tmp, dest)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+    return {
+        "width": width, "height": height,
+        "thumb": MediaStore.url(targets["thumb"][2]), "web": MediaStore.url(targets["web"][2]),
+    }
+
+
+def record(db: Session, url: str, result: Optional[dict]) -> int:
+    """Mark the pending items showing ``url`` ready (or failed when ``result`` is None), on every shard."""
+    I = models.ChecklistItem
+    if result is None:
+        values = {"photo_status": models.PhotoStatus.failed}
+    else:
+        values = {
+            "photo_status": models.PhotoStatus.ready, "photo_width": result["width"], "photo_height": result["height"],
+            "photo_thumb_path": result["thumb"], "photo_web_path": result["web"],
+        }
+
+    def mark(s: Session) -> int:
+        # Conditional: an item re-uploaded meanwhile points at another url
+        res = s.execute(update(I).where(I.photo_path == url, text(PENDING_WHERE)).values(**values))
+        s.commit()
+        return res.rowcount
+
+    return sum(fan_out(db, mark))
+
+
+def pending_urls(db: Session, limit: int) -> list[str]:
+    I = models.ChecklistItem
+
+    def find(s: Session) -> list[str]:
+        q = s.query(I.photo_path).filter(text(PENDING_WHERE))
+        return [u for (u,) in q.distinct().limit(limit)]
+
+    return list(dict.fromkeys(u for part in fan_out(db, find) for u in part))[:limit]
+
+
+class PhotoPipeline:
+    """Bounded queue of photo urls feeding PHOTO_WORKERS render processes."""
+
+    def __init__(self, workers: int = PHOTO_WORKERS, maxsize: int = PHOTO_QUEUE_MAX) -> None:
+        self.workers = workers
+        self.maxsize = maxsize
+        self.queue: Optional[asyncio.Queue] = None
+        self.queued: set[str] = set()  # queued or rendering
+        self.crashes: Counter = Counter()
+        self.rendered = 0
+        self.failed = 0
+        self._pool: Optional[futures_process.ProcessPoolExecutor] = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def enabled(self) -> bool:
+        return PILLOW_AVAILABLE and self.workers > 0
+
+    def start(self) -> None:
+        if not self.enabled or self._tasks:
+            return
+        self.queue = asyncio.Queue(self.maxsize)
+        self._tasks = [asyncio.get_running_loop().create_task(self._consume()) for _ in range(self.workers)]
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self.queued.clear()
+        self._shutdown_pool()
+
+    def pool(self) -> futures_process.ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: never fork a process that holds threads and DB connections
+            self._pool = futures_process.ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _shutdown_pool(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def submit(self, url: Optional[str]) -> bool:
+        """Queue ``url`` without waiting; False when full (the sweep picks it up later)."""
+        if self.queue is None or not url:
+            return False
+        if url in self.queued:
+            return True
+        try:
+            self.queue.put_nowait(url)
+        except asyncio.QueueFull:
+            return False
+        self.queued.add(url)
+        return True
+
+    async def sweep(self) -> int:
+        """Queue pending photos up to the free queue space; returns how many were added."""
+        if self.queue is None:
+            return 0
+        room = self.maxsize - self.queue.qsize()
+        if room <= 0:
+            return 0
+
+        def _find() -> list[str]:
+            db = SessionLocal()
+            try:
+                return pending_urls(db, room + len(self.queued))
+            finally:
+                db.close()
+
+        urls = [u for u in await run_in_threadpool(_find) if u not in self.queued]
+        return sum(self.submit(u) for u in urls[:room])
+
+    async def _consume(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            url = await self.queue.get()
+            try:
+                await self._process(loop, url)
+            except Exception:  # pragma: no cover – log in real service; the sweep retries
+                pass
+            finally:
+                self.queued.discard(url)
+                self.queue.task_done()
+
+    async def _process(self, loop: asyncio.AbstractEventLoop, url: str) -> None:
+        rel = MediaStore.rel_from_url(url)
+        result = None
+        if rel and os.path.exists(MEDIA_STORE.abspath(rel)):
+            try:
+                result = await loop.run_in_executor(self.pool(), render, MEDIA_STORE.abspath(rel), rel, MEDIA_STORE.root)
+            except futures_process.BrokenProcessPool:
+                # A worker died (e.g. killed mid-decode); the next photo starts a fresh pool
+                self._shutdown_pool()
+                self.crashes[url] += 1
+                if self.crashes[url] < PHOTO_MAX_CRASHES:
+                    return  # still pending: the sweep retries it
+            except Exception:
+                pass  # not a decodable image (or too large): failed, the original stays
+        self.crashes.pop(url, None)
+
+        def _record() -> int:
+            db = SessionLocal()
+            try:
+                return record(db, url, result)
+            finally:
+                db.close()
+
+        await run_in_threadpool(_record)
+        if result is None:
+            self.failed += 1
+        else:
+            self.rendered += 1
+
+
+PHOTOS = PhotoPipeline()
+
+
+def photo_stats(db: Session) -> dict:
+    """Pipeline counters since startup, plus the photos still pending."""
+    I = models.ChecklistItem
+    pending = sum(fan_out(db, lambda s: s.query(I.id).filter(text(PENDING_WHERE)).count()))
+    return {
+        "enabled": PHOTOS.enabled, "workers": PHOTOS.workers, "queued": len(PHOTOS.queued), "queue_max": PHOTOS.maxsize,
+        "rendered": PHOTOS.rendered, "failed": PHOTOS.failed, "pending": pending,
+    }
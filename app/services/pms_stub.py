@@ -23,3 +23,12 @@ def initiate_payment_stub(job_id: int, amount_cents: int) -> str:
     """Placeholder for payments integration."""
     return f"PAYMENT_INTENT_{job_id}_{amount_cents}"
 
+
+def initiate_payout_batch_stub(payouts: List[Dict]) -> Dict[str, str]:
+    """Placeholder for a bulk payouts API: one call for many cleaners.
+
+    Each item has ``idempotency_key``, ``cleaner_id`` and ``amount_cents``; like
+    real payout APIs, resubmitting a key returns the original reference instead
+    of paying twice. Returns references by idempotency key.
+    """
+    return {p["idempotency_key"]: f"PAYOUT_{p['idempotency_key']}_{p['amount_cents']}" for p in payouts}
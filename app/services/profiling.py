@@ -0,0 +1,189 @@
+"""
+On-demand profiling of a single request (admin only, `X-Profile: 1` or `?profile=1`).
+
+A sampler thread walks the stacks of the threads doing this request's work
+(the event loop plus any threadpool worker that runs its SQL) every
+PROFILE_INTERVAL_MS, and every SQL statement is recorded with its timing. A
+worker is sampled only until the call that ran the SQL (dependency or
+endpoint) returns, so later work of other requests on that thread is not
+mixed in. The result is stored as JSON under PROFILE_DIR and downloadable
+from `/admin/profiles/{id}`; stacks are also kept in folded form for flame
+graphs.
+
+Nothing here runs unless a request asks for it.
+"""
+from __future__ import annotations
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from types import FrameType
+from typing import Optional
+
+from ..database import params_shape
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PROFILE_DIR = os.path.abspath(os.getenv("PROFILE_DIR", os.path.join(ROOT_DIR, "profiles")))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+MAX_STATEMENTS = 5000
+_STDLIB_DIR = os.path.dirname(os.__file__)
+# Thread pool machinery below the submitted call in a worker's stack
+_WORKER_FILES = (threading.__file__, os.path.join(_STDLIB_DIR, "concurrent", "futures", "thread.py"))
+
+
+def _is_worker_frame(frame: FrameType) -> bool:
+    filename = frame.f_code.co_filename
+    return filename in _WORKER_FILES or f"{os.sep}anyio{os.sep}" in filename
+
+
+def _work_root(frame: FrameType) -> FrameType:
+    """Outermost frame of the call the current worker thread is running."""
+    root = frame
+    while frame is not None and not _is_worker_frame(frame):
+        root, frame = frame, frame.f_back
+    return root
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(ROOT_DIR):
+        filename = os.path.relpath(filename, ROOT_DIR)
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    elif filename.startswith(_STDLIB_DIR):
+        filename = os.path.relpath(filename, _STDLIB_DIR)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class RequestProfile:
+    def __init__(self, route: str, interval_ms: float = PROFILE_INTERVAL_MS) -> None:
+        self.id = uuid.uuid4().hex[:16]
+        self.route = route
+        self.interval = interval_ms / 1000
+        # Thread ident -> frame whose return ends this request's work there
+        # (None: sampled until the profile stops)
+        self.threads: dict[int, Optional[FrameType]] = {}
+        self._threads_lock = threading.Lock()
+        self.stacks: Counter[tuple] = Counter()
+        self.samples = 0
+        self.statements: list[dict] = []
+        self.started_at = datetime.utcnow()
+        self._t0 = 0.0
+        self.duration_ms = 0.0
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def attach_thread(self, root: Optional[FrameType] = None) -> None:
+        with self._threads_lock:
+            self.threads.setdefault(threading.get_ident(), root)
+
+    def detach_thread(self, tid: int, root: FrameType) -> None:
+        with self._threads_lock:
+            if self.threads.get(tid) is root:
+                del self.threads[tid]
+
+    def on_query(self, statement: str, parameters, elapsed_ms: float) -> None:
+        # Runs in whichever thread issued the query, so that thread gets sampled
+        # too, for as long as the call that issued it runs
+        if threading.get_ident() not in self.threads:
+            self.attach_thread(_work_root(sys._getframe(1)))
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append({
+                "sql": " ".join(statement.split()),
+                "params": params_shape(parameters),
+                "ms": round(elapsed_ms, 3),
+            })
+
+    def start(self) -> None:
+        self.attach_thread()
+        self._t0 = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name=f"profile-{self.id}", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self.duration_ms = (time.perf_counter() - self._t0) * 1000
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+        with self._threads_lock:
+            self.threads.clear()  # drops the frames held as roots
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._threads_lock:
+                threads = list(self.threads.items())
+            for tid, root in threads:
+                frame = frames.get(tid)
+                stack = []
+                running = root is None
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    running = running or frame is root
+                    frame = frame.f_back
+                if not running:
+                    # The call returned: the thread is back in the pool
+                    self.detach_thread(tid, root)
+                    continue
+                if stack:
+                    self.stacks[tuple(reversed(stack))] += 1
+                    self.samples += 1
+
+    def report(self) -> dict:
+        self_counts: Counter[str] = Counter()
+        total_counts: Counter[str] = Counter()
+        folded = []
+        for stack, count in self.stacks.most_common():
+            labels = [_frame_label(code) for code in stack]
+            self_counts[labels[-1]] += count
+            for label in set(labels):
+                total_counts[label] += count
+            folded.append(f"{';'.join(labels)} {count}")
+        sql_ms = sum(s["ms"] for s in self.statements)
+        return {
+            "id": self.id,
+            "route": self.route,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "sql": {"count": len(self.statements), "total_ms": round(sql_ms, 3), "statements": self.statements},
+            "top_self": [{"frame": f, "samples": c} for f, c in self_counts.most_common(30)],
+            "top_cumulative": [{"frame": f, "samples": c} for f, c in total_counts.most_common(30)],
+            "folded": folded,
+        }
+
+    def save(self) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = profile_path(self.id)
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=1)
+        _prune()
+        return path
+
+
+def profile_path(profile_id: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.json")
+
+
+def list_profiles() -> list[dict]:
+    try:
+        entries = [e for e in os.scandir(PROFILE_DIR) if e.name.endswith(".json")]
+    except FileNotFoundError:
+        return []
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    return [{"id": e.name[:-5], "size": e.stat().st_size, "created_at": datetime.utcfromtimestamp(e.stat().st_mtime).isoformat()} for e in entries]
+
+
+def _prune() -> None:
+    for stale in list_profiles()[PROFILE_KEEP:]:
+        try:
+            os.unlink(profile_path(stale["id"]))
+        except FileNotFoundError:
+            pass
@@ -1,12 +1,13 @@
 """
-Simple asyncio-based reminder scheduler stub.
+Simple asyncio-based scheduler for periodic background ticks.
 
-Replace with Celery/RQ/Cloud Tasks in production. No external API calls here.
+Replace with Celery/RQ/Cloud Tasks in production. Notifications (including
+job reminders) go through the outbox in notifications.py.
 """
 from __future__ import annotations
 import asyncio
-from datetime import datetime, timedelta
-from typing import Callable, Awaitable, Dict
+from datetime import timedelta
+from typing import Callable, Awaitable
 
 
 class Scheduler:
@@ -43,11 +44,3 @@ class Scheduler:
 
 
 SCHEDULER = Scheduler()
-
-
-async def remind_job_upcoming(job_id: int) -> None:
-    # TODO: integrate email/SMS/Push provider here.
-    # For MVP, we no-op or log.
-    _ = job_id
-    return None
-
@@ -0,0 +1,241 @@
+"""
+StaticFiles with precompressed siblings and long-lived caching for hashed assets.
+
+- Serves `<file>.br` / `<file>.gz` when the client accepts that encoding. Siblings
+  come from `scripts/precompress_static.py` (build step); missing gzip siblings are
+  written by `write_siblings()` in the app's startup hook, never on import or the
+  request path. Only gzip is guaranteed: `brotli` is not in requirements.txt, and
+  `.br` siblings are written only where it is installed.
+- Vite's content-hashed build output (`assets/index-DmYZc8iH.js`) gets
+  `Cache-Control: public, max-age=31536000, immutable`; everything else (index.html)
+  must revalidate, which is cheap thanks to ETag/If-None-Match → 304.
+- Single byte ranges (`Range: bytes=a-b`) are honoured for identity responses.
+"""
+from __future__ import annotations
+import gzip
+import mimetypes
+import os
+import re
+import tempfile
+from typing import Optional
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+try:  # optional dependency
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover – depends on environment
+    brotli = None
+
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+# Vite's build output: assets/<name>-<8-char url-safe hash>.<ext>. Only that
+# directory: elsewhere names like apple-touch-icon.png would pass for hashed.
+HASHED_ASSET = re.compile(r"^assets/[^/]+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+COMPRESSIBLE_EXT = {".html", ".js", ".mjs", ".css", ".json", ".svg", ".txt", ".map", ".xml", ".wasm"}
+MIN_COMPRESS_BYTES = 1024
+# Preference order when the client accepts several encodings
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def is_compressible(path: str, size: int) -> bool:
+    return size >= MIN_COMPRESS_BYTES and os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXT
+
+
+def _write_atomic(dest: str, data: bytes, mtime: float) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # Sibling carries the original's mtime so staleness checks are a stat compare
+        os.utime(tmp, (mtime, mtime))
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def compress_file(path: str, encodings: tuple[str, ...] = ("gzip", "br")) -> list[str]:
+    """Write fresh .gz/.br siblings for ``path``; returns the siblings written."""
+    st = os.stat(path)
+    if not is_compressible(path, st.st_size):
+        return []
+    written = []
+    with open(path, "rb") as f:
+        raw = f.read()
+    for encoding, suffix in ENCODINGS:
+        if encoding not in encodings or (encoding == "br" and brotli is None):
+            continue
+        dest = path + suffix
+        if _is_fresh(dest, st):
+            continue
+        if encoding == "br":
+            data = brotli.compress(raw, quality=11)
+        else:
+            data = gzip.compress(raw, compresslevel=9, mtime=0)
+        if len(data) >= st.st_size:
+            continue
+        _write_atomic(dest, data, st.st_mtime)
+        written.append(dest)
+    return written
+
+
+def precompress_dir(directory: str, encodings: tuple[str, ...] = ("gzip", "br")) -> int:
+    """`compress_file` for every asset under ``directory``; returns the siblings written."""
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith((".gz", ".br")) or name.startswith(".tmp-"):
+                continue
+            total += len(compress_file(os.path.join(root, name), encodings))
+    return total
+
+
+def _is_fresh(sibling: str, original: os.stat_result) -> bool:
+    try:
+        return os.stat(sibling).st_mtime >= original.st_mtime
+    except OSError:
+        return False
+
+
+def _accepted(request_headers: Headers) -> set[str]:
+    accepted = set()
+    for part in request_headers.get("accept-encoding", "").split(","):
+        token, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive (start, end).
+
+    Returns None for anything we do not serve partially (multiple ranges,
+    other units, malformed input); raises ValueError if unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if not (first or last) or not (first.isdigit() or first == "") or not (last.isdigit() or last == ""):
+        return None
+    if first == "":
+        # Suffix range: the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+        if int(last) == 0:
+            raise ValueError("unsatisfiable range")
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+class RangeFileResponse(FileResponse):
+    """206 Partial Content for one byte range of a file."""
+
+    def __init__(self, path: str, start: int, end: int, **kwargs) -> None:
+        super().__init__(path, status_code=206, **kwargs)
+        self.start = start
+        self.end = end
+        size = self.stat_result.st_size if self.stat_result else os.stat(path).st_size
+        self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class CachedStaticFiles(StaticFiles):
+    def __init__(self, *args, precompress: bool = True, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.precompress = precompress
+
+    def write_siblings(self) -> int:
+        """Write missing gzip siblings; the app calls this once at startup."""
+        if not (self.precompress and self.directory):
+            return 0
+        try:
+            return precompress_dir(str(self.directory), encodings=("gzip",))
+        except OSError:  # read-only deploy: serve what is there
+            return 0
+
+    def cache_control(self, full_path: str) -> str:
+        rel = os.path.relpath(full_path, os.path.realpath(self.directory)).replace(os.sep, "/")
+        return IMMUTABLE_CACHE if HASHED_ASSET.match(rel) else REVALIDATE_CACHE
+
+    def _variant(self, full_path: str, stat_result: os.stat_result, request_headers: Headers) -> tuple[Optional[str], str, os.stat_result]:
+        if not is_compressible(full_path, stat_result.st_size):
+            return None, full_path, stat_result
+        accepted = _accepted(request_headers)
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            sibling = full_path + suffix
+            try:
+                sib_stat = os.stat(sibling)
+            except OSError:
+                sib_stat = None
+            if sib_stat is None or sib_stat.st_mtime < stat_result.st_mtime:
+                continue  # missing or stale: identity beats blocking on compression
+            return encoding, sibling, sib_stat
+        return None, full_path, stat_result
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        full_path = str(full_path)
+        request_headers = Headers(scope=scope)
+        encoding, serve_path, serve_stat = self._variant(full_path, stat_result, request_headers)
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        response = FileResponse(serve_path, status_code=status_code, stat_result=serve_stat, media_type=media_type)
+        # ETag comes from the served file's stat, so each encoding gets its own validator
+        response.headers["cache-control"] = self.cache_control(full_path)
+        if is_compressible(full_path, stat_result.st_size):
+            response.headers["vary"] = "Accept-Encoding"
+        if encoding:
+            response.headers["content-encoding"] = encoding
+        else:
+            response.headers["accept-ranges"] = "bytes"
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        range_header = request_headers.get("range")
+        if range_header and not encoding and status_code == 200:
+            # If-Range: only honour the range if the client's copy is current
+            if_range = request_headers.get("if-range")
+            if if_range is None or if_range == response.headers["etag"]:
+                try:
+                    byte_range = parse_range(range_header, serve_stat.st_size)
+                except ValueError:
+                    return Response(status_code=416, headers={"content-range": f"bytes */{serve_stat.st_size}"})
+                if byte_range is not None:
+                    return RangeFileResponse(
+                        serve_path, *byte_range, stat_result=serve_stat, media_type=media_type,
+                        headers={k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")},
+                    )
+        return response
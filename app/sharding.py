@@ -0,0 +1,373 @@
+"""
+Optional per-host sharding (SHARDS > 0).
+
+The catalog is the main database (CLEANING_DB_PATH): users, hosts, cleaners,
+media blobs and payouts always live there. Each host's properties, jobs,
+checklist items, ratings and job notifications live in one shard, recorded in
+``hosts.shard``. Shard 0 is the catalog file itself, so every host created
+before sharding was turned on keeps working untouched; shards 1..SHARDS are
+``<db>.shard<k>.db`` files in SHARD_DIR and new hosts are placed on
+``1 + host_id % SHARDS``.
+
+Every shard connection ATTACHes the catalog. SQLite resolves an unqualified
+table name in the main file first, and shard files only hold the shard
+tables, so existing queries (including joins to users, hosts and cleaners)
+run unchanged against a shard session. A write transaction only locks the
+files it writes, so hosts on different shards no longer queue behind one
+writer.
+
+``get_db`` routes each request: a ``job_id``/``property_id`` path parameter
+goes to the shard holding that row, an authenticated host to its own shard,
+anything else to the catalog. Listings spanning hosts (job board, admin
+lists, a cleaner's schedule) call `fan_out`, which runs the same query on
+every shard concurrently, and merge the results.
+
+Property, job, checklist item and rating ids stay globally unique (they
+appear in URLs and move between shards with their host). In sharded mode they
+come from blocks of ID_BLOCK reserved in a small ``<db>.ids.db`` file that no
+request transaction ever holds.
+
+`move_host` rebalances one host to another shard in a single transaction
+that holds the write lock on the source, target and catalog. Requests that
+were routed to the old shard before the move fail their commit with 503 and
+retry against the new one.
+"""
+from __future__ import annotations
+import contextvars
+import heapq
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Optional, TypeVar
+
+from fastapi import HTTPException, Request
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import models
+from .database import DB_PATH, Base, SessionLocal, engine, instrument
+
+
+SHARDS = int(os.getenv("SHARDS", "0"))  # shard files besides the catalog; 0 disables sharding
+SHARD_DIR = os.path.abspath(os.getenv("SHARD_DIR", os.path.dirname(os.path.abspath(DB_PATH))))
+ID_BLOCK = int(os.getenv("SHARD_ID_BLOCK", "1000"))
+CATALOG = "catalog"  # schema name the catalog is attached under
+
+SHARD_MODELS = (models.Property, models.CleaningJob, models.ChecklistItem, models.Rating, models.OutboxMessage)
+SHARD_TABLES = [m.__table__ for m in SHARD_MODELS]
+# Referenced by id from URLs and other rows; notification ids are not
+GLOBAL_ID_MODELS = SHARD_MODELS[:4]
+# Path parameters that pin a request to the shard holding the row
+ROUTED_PARAMS = {"job_id": models.CleaningJob.__table__, "property_id": models.Property.__table__}
+
+T = TypeVar("T")
+
+
+class HostMoved(HTTPException):
+    """The host's rows moved to another shard while this request was using the old one."""
+
+    def __init__(self, host_id: int) -> None:
+        super().__init__(status_code=503, detail=f"Host {host_id} was moved to another shard, retry", headers={"Retry-After": "1"})
+
+
+def _stem() -> str:
+    return os.path.join(SHARD_DIR, os.path.splitext(os.path.basename(DB_PATH))[0])
+
+
+def shard_path(shard: int) -> str:
+    return os.path.abspath(DB_PATH) if shard == 0 else f"{_stem()}.shard{shard}.db"
+
+
+def shard_ids() -> list[int]:
+    return list(range(SHARDS + 1))
+
+
+def placement(host_id: int) -> int:
+    """Shard for a new host."""
+    return 1 + host_id % SHARDS if SHARDS else 0
+
+
+_engines: dict[int, Engine] = {0: engine}
+_makers: dict[int, sessionmaker] = {0: SessionLocal}
+_engines_lock = threading.Lock()
+
+
+def engine_for(shard: int) -> Engine:
+    if shard not in _engines:
+        if not 0 < shard <= SHARDS:
+            raise ValueError(f"Shard {shard} is not configured (SHARDS={SHARDS})")
+        with _engines_lock:
+            if shard not in _engines:
+                eng = create_engine(f"sqlite:///{shard_path(shard)}", connect_args={"check_same_thread": False})
+                catalog = os.path.abspath(DB_PATH)
+
+                @event.listens_for(eng, "connect")
+                def _attach(dbapi_conn, record):
+                    dbapi_conn.execute(f"ATTACH DATABASE ? AS {CATALOG}", (catalog,))
+
+                instrument(eng)
+                _makers[shard] = sessionmaker(autocommit=False, autoflush=False, bind=eng)
+                _engines[shard] = eng
+    return _engines[shard]
+
+
+def session(shard: int) -> Session:
+    engine_for(shard)
+    s = _makers[shard]()
+    s.info["shard"] = shard
+    return s
+
+
+def init_shards() -> None:
+    """Create missing shard files from the models' shard tables and turn on id
+    allocation. Runs after the catalog migrations."""
+    if not SHARDS:
+        return
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    for shard in range(1, SHARDS + 1):
+        # A plain connection: with the catalog attached, checkfirst would find
+        # the catalog's copies of these tables and skip creating them
+        bare = create_engine(f"sqlite:///{shard_path(shard)}")
+        try:
+            Base.metadata.create_all(bind=bare, tables=SHARD_TABLES)
+            with bare.connect() as conn:
+                conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        finally:
+            bare.dispose()
+    for model in GLOBAL_ID_MODELS:
+        if not event.contains(model, "before_insert", _assign_id):
+            event.listen(model, "before_insert", _assign_id)
+    if not event.contains(Session, "before_commit", _check_placement):
+        event.listen(Session, "before_commit", _check_placement)
+
+
+# Global ids
+
+class IdAllocator:
+    """Hands out ids from blocks reserved in the ids file; safe across threads
+    and processes. Ids are unique, not dense."""
+
+    def __init__(self, block: int = ID_BLOCK) -> None:
+        self.block = block
+        self._lock = threading.Lock()
+        self._ranges: dict[str, tuple[int, int]] = {}
+
+    def next(self, table: str) -> int:
+        with self._lock:
+            nxt, end = self._ranges.get(table, (0, 0))
+            if nxt >= end:
+                nxt, end = self._reserve(table)
+            self._ranges[table] = (nxt + 1, end)
+            return nxt
+
+    def _reserve(self, table: str) -> tuple[int, int]:
+        con = sqlite3.connect(f"{_stem()}.ids.db", timeout=30, isolation_level=None)
+        try:
+            con.execute("CREATE TABLE IF NOT EXISTS id_blocks (name TEXT PRIMARY KEY, next_id INTEGER NOT NULL)")
+            if con.execute("SELECT 1 FROM id_blocks WHERE name = ?", (table,)).fetchone() is None:
+                # First block starts above every existing row (MAX(rowid) is one seek per shard)
+                floor = max(_max_id(shard, table) for shard in shard_ids()) + 1
+                con.execute("INSERT OR IGNORE INTO id_blocks (name, next_id) VALUES (?, ?)", (table, floor))
+            end = con.execute(
+                "UPDATE id_blocks SET next_id = next_id + ? WHERE name = ? RETURNING next_id", (self.block, table)
+            ).fetchone()[0]
+        finally:
+            con.close()
+        return end - self.block, end
+
+
+def _max_id(shard: int, table: str) -> int:
+    with engine_for(shard).connect() as conn:
+        return conn.exec_driver_sql(f"SELECT COALESCE(MAX(id), 0) FROM main.{table}").scalar()
+
+
+IDS = IdAllocator()
+
+
+def _assign_id(mapper, connection, target) -> None:
+    if target.id is None:
+        target.id = IDS.next(mapper.local_table.name)
+
+
+# Routing
+
+def host_shard(db: Session, host_id: int) -> Optional[int]:
+    return db.execute(select(models.Host.shard).where(models.Host.id == host_id)).scalar()
+
+
+def locate(table, row_id: int) -> Optional[tuple[int, int]]:
+    """(shard, host_id) of a property or job row. Primary-key probes are
+    cheaper than a thread hop, so shards are tried in turn."""
+    stmt = select(table.c.host_id).where(table.c.id == row_id)
+    for shard in shard_ids():
+        with engine_for(shard).connect() as conn:
+            host_id = conn.execute(stmt).scalar()
+        if host_id is not None:
+            return shard, host_id
+    return None
+
+
+def _principal_host(request: Request) -> Optional[tuple[int, int]]:
+    """(host_id, shard) of the calling host, from the token subject alone."""
+    from .routers.auth import demo_email, token_subject
+    H, U = models.Host, models.User
+    stmt = select(H.id, H.shard).join(U, U.id == H.user_id)
+    uid = token_subject(request.headers.get("authorization"))
+    if uid is not None:
+        stmt = stmt.where(U.id == uid)
+    else:
+        email = demo_email(request.headers.get("authorization"), request.headers.get("x-demo-role"))
+        if email is None:
+            return None
+        stmt = stmt.where(U.email == email)
+    with engine.connect() as conn:
+        row = conn.execute(stmt).first()
+    return tuple(row) if row else None
+
+
+def request_session(request: Request) -> Session:
+    """The session ``get_db`` hands to this request when sharding is on."""
+    shard, host_id = 0, None
+    for param, table in ROUTED_PARAMS.items():
+        try:
+            row_id = int(request.path_params[param])
+        except (KeyError, ValueError):
+            continue
+        found = locate(table, row_id)
+        if found:
+            shard, host_id = found
+            break
+    else:
+        found = _principal_host(request)
+        if found:
+            host_id, shard = found
+    s = session(shard)
+    if host_id is not None:
+        s.info["host_guard"] = (host_id, shard)
+    return s
+
+
+def _check_placement(s: Session) -> None:
+    guard = s.info.get("host_guard")
+    if guard is None:
+        return
+    # Flush first: once this transaction holds the shard's write lock, a
+    # concurrent move has either finished (and is visible here) or not started
+    s.flush()
+    host_id, shard = guard
+    if host_shard(s, host_id) != shard:
+        raise HostMoved(host_id)
+
+
+# Fan-out
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def fan_out(db: Session, fn: Callable[[Session], T], shards: Optional[Iterable[int]] = None) -> list[T]:
+    """``fn`` on every shard concurrently, each call with its own session;
+    unsharded, just ``[fn(db)]``. Results must not need the session afterwards."""
+    if not SHARDS:
+        return [fn(db)]
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=4 * (SHARDS + 1), thread_name_prefix="shard")
+
+    def one(shard: int) -> T:
+        s = session(shard)
+        try:
+            return fn(s)
+        finally:
+            s.close()
+
+    # A context copy per call keeps slow-query route labels and profiling
+    futures = [_pool.submit(contextvars.copy_context().run, one, k) for k in (shard_ids() if shards is None else shards)]
+    return [f.result() for f in futures]
+
+
+def fan_out_page(db: Session, fetch: Callable[[Session, int, int], list[tuple[object, T]]],
+                 offset: int, limit: int, reverse: bool = False) -> list[T]:
+    """One ``offset``/``limit`` page of a listing across shards.
+    ``fetch(session, offset, limit)`` returns one shard's page as (sort key,
+    item) pairs in key order; sharded, each shard returns its first
+    offset+limit and they are merged by key."""
+    if not SHARDS:
+        return [item for _, item in fetch(db, offset, limit)]
+    parts = fan_out(db, lambda s: fetch(s, 0, offset + limit))
+    merged = heapq.merge(*parts, key=lambda pair: pair[0], reverse=reverse)
+    return [item for _, item in islice(merged, offset, offset + limit)]
+
+
+# Rebalancing
+
+def _copy_columns(table, with_id: bool) -> str:
+    return ", ".join(c.name for c in table.columns if with_id or c.name != "id")
+
+
+def move_host(host_id: int, target: int) -> dict[str, int]:
+    """Move every row of ``host_id`` to shard ``target``; returns rows moved per table.
+
+    One transaction takes the write lock on the source, target and catalog
+    files up front, so no write to the host can land in between. SQLite
+    commits each file atomically but not all three together; if a crash hits
+    the commit itself, run the move again (copies replace by primary key).
+    """
+    if not 0 <= target <= SHARDS:
+        raise ValueError(f"Shard {target} is not configured (SHARDS={SHARDS})")
+    with engine.connect() as conn:
+        source = conn.execute(select(models.Host.shard).where(models.Host.id == host_id)).scalar()
+    if source is None:
+        raise ValueError(f"Host {host_id} not found")
+    if source == target:
+        return {}
+    con = sqlite3.connect(shard_path(target), timeout=30, isolation_level=None)
+    try:
+        cat = "main" if target == 0 else "cat"
+        src = "cat" if source == 0 else "src"
+        if target != 0:
+            con.execute("ATTACH DATABASE ? AS cat", (os.path.abspath(DB_PATH),))
+        if source != 0:
+            con.execute("ATTACH DATABASE ? AS src", (shard_path(source),))
+        jobs = f"SELECT id FROM {src}.cleaning_jobs WHERE host_id = :h"
+        where = {
+            "properties": "host_id = :h", "cleaning_jobs": "host_id = :h",
+            "checklist_items": f"job_id IN ({jobs})", "ratings": f"job_id IN ({jobs})",
+            "notification_outbox": f"job_id IN ({jobs})",
+        }
+        moved = {}
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            for table in SHARD_TABLES:
+                name, keep_id = table.name, table is not models.OutboxMessage.__table__
+                cols = _copy_columns(table, keep_id)
+                if not keep_id:  # re-queued under fresh ids; clear a half-finished earlier attempt
+                    con.execute(f"DELETE FROM main.{name} WHERE {where[name]}", {"h": host_id})
+                moved[name] = con.execute(
+                    f"INSERT OR REPLACE INTO main.{name} ({cols}) SELECT {cols} FROM {src}.{name} WHERE {where[name]}",
+                    {"h": host_id},
+                ).rowcount
+            for table in reversed(SHARD_TABLES):
+                con.execute(f"DELETE FROM {src}.{table.name} WHERE {where[table.name]}", {"h": host_id})
+            con.execute(f"UPDATE {cat}.hosts SET shard = ? WHERE id = ?", (target, host_id))
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+    finally:
+        con.close()
+    return moved
+
+
+def placements() -> dict[int, dict[str, int]]:
+    """Hosts and jobs per shard."""
+    with engine.connect() as conn:
+        hosts = dict(conn.exec_driver_sql("SELECT shard, COUNT(*) FROM hosts GROUP BY shard").all())
+    out = {}
+    for shard in shard_ids():
+        with engine_for(shard).connect() as conn:
+            jobs = conn.exec_driver_sql("SELECT COUNT(*) FROM main.cleaning_jobs").scalar()
+        out[shard] = {"hosts": hosts.get(shard, 0), "jobs": jobs}
+    return out
@@ -1,6 +1,6 @@
 import React, { useEffect, useMemo, useState } from 'react'
 import { Routes, Route } from 'react-router-dom'
-import { api } from './api'
+import { api, apiBatch } from './api'
 import { AuthProvider, Protected, useAuth } from './auth'
 import Layout from './components/Layout'
 
@@ -29,7 +29,10 @@ function Host() {
   const [props,setProps]=useState<any[]>([])
   const [jobs,setJobs]=useState<any[]>([])
   const [start,setStart]=useState(''); const [end,setEnd]=useState(''); const [checklist,setChecklist]=useState('Change linens\nDust surfaces')
-  useEffect(()=>{ loadMine(); loadJobs() },[])
+  useEffect(()=>{ loadAll() },[])
+  // Initial load in one round trip
+  async function loadAll(){ try { const [p,j]=await apiBatch([{ path:'/properties/mine' },{ path:'/jobs/me?limit=20' }]); if(p.status===200) setProps(p.body); if(j.status===200) setJobs(j.body) } catch {}
+  }
   async function createProp(){ const r=await api.post('/properties/',{name, address:addr}); setProp(r.data); await loadMine() }
   async function loadMine(){ try { const r=await api.get('/properties/mine'); setProps(r.data) } catch {}
   }
@@ -71,10 +74,9 @@ function Cleaner(){
   const [open,setOpen]=useState<any[]>([])
   const [mine,setMine]=useState<any[]>([])
   const [claimId,setClaimId]=useState('')
-  useEffect(()=>{ load(); loadMine() },[])
-  async function load(){ const r=await api.get('/jobs/open?limit=20'); setOpen(r.data) }
-  async function loadMine(){ const r=await api.get('/jobs/me?limit=20'); setMine(r.data) }
-  async function claim(){ await api.post(`/jobs/${claimId}/claim`); alert('claimed'); await load(); await loadMine() }
+  useEffect(()=>{ loadAll() },[])
+  async function loadAll(){ const [o,m]=await apiBatch([{ path:'/jobs/open?limit=20' },{ path:'/jobs/me?limit=20' }]); if(o.status===200) setOpen(o.body); if(m.status===200) setMine(m.body) }
+  async function claim(){ await api.post(`/jobs/${claimId}/claim`); alert('claimed'); await loadAll() }
   return (
     <div>
       <h2>Cleaner</h2>
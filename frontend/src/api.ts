@@ -45,3 +45,11 @@ export async function apiRefresh(token?: string) {
   const r = await api.post('/auth/refresh', token ? { token } : undefined)
   return r.data as { token: string }
 }
+
+export type BatchResponse = { id?: string, status: number, body: any }
+
+// Several GET reads in one round trip, e.g. apiBatch([{ id: 'props', path: '/properties/mine' }, { path: '/jobs/me' }])
+export async function apiBatch(requests: { id?: string, path: string }[]) {
+  const r = await api.post('/batch', { requests })
+  return (r.data as { responses: BatchResponse[] }).responses
+}
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latency of well-behaved clients while one abusive client hammers
+/jobs/open, with admission control on vs off.
+
+The server runs as a separate uvicorn process so the abusive client's own CPU
+does not count against the server.
+
+    python scripts/bench_admission.py [--seconds 5] [--abusers 32]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+os.environ.setdefault("CLEANING_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench_admission.db"))
+# Shared with the server subprocess so tokens minted here validate there
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+
+import httpx  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app import models  # noqa: E402
+from app.routers.auth import create_access_token  # noqa: E402
+
+
+def seed(n_good: int) -> tuple[str, list[str]]:
+    init_db()
+    db = SessionLocal()
+    try:
+        tokens = []
+        for i in range(n_good + 1):
+            u = models.User(email=f"bench{i}-{time.time_ns()}@local", password_hash="x", role=models.UserRole.cleaner)
+            db.add(u); db.flush()
+            db.add(models.Cleaner(user_id=u.id, name=f"Bench {i}"))
+            tokens.append(create_access_token({"sub": str(u.id), "role": u.role.value}))
+        hu = models.User(email=f"benchhost-{time.time_ns()}@local", password_hash="x", role=models.UserRole.host)
+        db.add(hu); db.flush()
+        host = models.Host(user_id=hu.id, name="Bench Host")
+        db.add(host); db.flush()
+        prop = models.Property(host_id=host.id, name="Bench", address="1 Bench St")
+        db.add(prop); db.flush()
+        start = datetime.utcnow() + timedelta(days=1)
+        for i in range(500):
+            db.add(models.CleaningJob(property_id=prop.id, booking_start=start + timedelta(hours=i),
+                                      booking_end=start + timedelta(hours=i + 3), status=models.JobStatus.open))
+        db.commit()
+        return tokens[0], tokens[1:]
+    finally:
+        db.close()
+
+
+def client_for(base_url: str, ip: str, token: str) -> httpx.AsyncClient:
+    # Distinct loopback source addresses so per-IP buckets see distinct clients
+    transport = httpx.AsyncHTTPTransport(local_address=ip)
+    return httpx.AsyncClient(transport=transport, base_url=base_url, headers={"Authorization": f"Bearer {token}"}, timeout=30)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(enabled: bool) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = dict(os.environ, ADMISSION_ENABLED="true" if enabled else "false")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base_url}/health", timeout=1)
+            return proc, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+async def abuser(client: httpx.AsyncClient, stop: float, counts: dict) -> None:
+    while time.perf_counter() < stop:
+        r = await client.get("/jobs/open")
+        counts[r.status_code] = counts.get(r.status_code, 0) + 1
+
+
+async def good_client(client: httpx.AsyncClient, stop: float, latencies: list, interval: float) -> None:
+    while time.perf_counter() < stop:
+        t0 = time.perf_counter()
+        r = await client.get("/jobs/open")
+        if r.status_code == 200:
+            latencies.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(interval)
+
+
+async def run_phase(label: str, base_url: str, abuse_token: str, good_tokens: list[str], seconds: float, abusers: int) -> None:
+    stop = time.perf_counter() + seconds
+    latencies: list[float] = []
+    counts: dict[int, int] = {}
+    bad = client_for(base_url, "127.0.0.2", abuse_token)
+    goods = [client_for(base_url, f"127.0.1.{i + 1}", t) for i, t in enumerate(good_tokens)]
+    try:
+        await asyncio.gather(
+            *(abuser(bad, stop, counts) for _ in range(abusers)),
+            *(good_client(c, stop, latencies, 0.1) for c in goods),
+        )
+    finally:
+        await bad.aclose()
+        for c in goods:
+            await c.aclose()
+    latencies.sort()
+    p50 = statistics.median(latencies) if latencies else float("nan")
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else float("nan")
+    print(f"{label:<16} good reqs={len(latencies):5d}  p50={p50:7.1f}ms  p99={p99:7.1f}ms  "
+          f"abusive status counts={dict(sorted(counts.items()))}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--abusers", type=int, default=32, help="concurrent request loops for the abusive client")
+    ap.add_argument("--good", type=int, default=5, help="number of well-behaved clients")
+    args = ap.parse_args()
+    abuse_token, good_tokens = seed(args.good)
+    phases = [("no abuser", True, 0), ("admission=off", False, args.abusers), ("admission=on", True, args.abusers)]
+    for label, enabled, abusers in phases:
+        proc, base_url = start_server(enabled)
+        try:
+            asyncio.run(run_phase(label, base_url, abuse_token, good_tokens, args.seconds, abusers))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
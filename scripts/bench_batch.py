@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Benchmark: host dashboard load with and without POST /batch.
+
+The dashboard is what the host screen needs: /properties/mine and /jobs/me,
+then /properties/{id} and /properties/{id}/bookings for each property and
+/jobs/{id} for the first --details jobs. It is loaded three ways against a
+separate uvicorn process:
+
+- one request after another;
+- each stage's requests in parallel over 6 connections (a browser's limit);
+- two batches, one per stage.
+
+--rtt-ms is added to every round trip on the client (the network), and
+--pms-ms to every booking lookup on the server (the PMS API the stub stands
+in for). Prints the median dashboard time, round trips and SQL statements.
+
+    python scripts/bench_batch.py [--properties 10] [--details 10] [--rtt-ms 40] [--pms-ms 30]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CLEANING_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench_batch.db"))
+# Shared with the server subprocess so tokens minted here validate there
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+os.environ.update(ADMISSION_ENABLED="false", OUTBOX_INTERVAL_SECONDS="0", DISPATCH_INTERVAL_SECONDS="0")
+
+import httpx  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app import models  # noqa: E402
+from app.routers.auth import create_access_token  # noqa: E402
+
+
+def seed(n_props: int, n_jobs: int) -> str:
+    init_db()
+    db = SessionLocal()
+    try:
+        u = models.User(email=f"benchhost-{time.time_ns()}@local", password_hash="x", role=models.UserRole.host)
+        db.add(u); db.flush()
+        host = models.Host(user_id=u.id, name="Bench Host")
+        db.add(host); db.flush()
+        props = [models.Property(host_id=host.id, name=f"Flat {i}", address=f"{i} Bench St") for i in range(n_props)]
+        db.add_all(props); db.flush()
+        start = datetime.utcnow() + timedelta(days=1)
+        for i in range(n_jobs):
+            job = models.CleaningJob(property_id=props[i % n_props].id, host_id=host.id, status=models.JobStatus.open,
+                                     booking_start=start + timedelta(hours=i), booking_end=start + timedelta(hours=i + 3))
+            db.add(job); db.flush()
+            db.add_all(models.ChecklistItem(job_id=job.id, text=t) for t in ("Beds", "Bathroom", "Kitchen"))
+        db.commit()
+        return create_access_token({"sub": str(u.id), "role": "host"})
+    finally:
+        db.close()
+
+
+def serve(port: int, pms_ms: float) -> None:
+    """Server process: the app with PMS latency on booking lookups and a SQL counter."""
+    from sqlalchemy import event
+    import uvicorn
+    from app.database import engine
+    from app.main import app
+    from app.routers import properties
+    from app.services.pms_stub import get_upcoming_bookings
+
+    def slow_bookings(property_id: int):
+        time.sleep(pms_ms / 1000)
+        return get_upcoming_bookings(property_id)
+
+    properties.get_upcoming_bookings = slow_bookings
+    statements = [0]
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.__setitem__(0, statements[0] + 1))
+
+    @app.get("/_bench/statements")
+    def statement_count():
+        return {"statements": statements[0]}
+
+    uvicorn.run(app, port=port, log_level="warning")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(pms_ms: float) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port), "--pms-ms", str(pms_ms)])
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base_url}/health", timeout=1)
+            return proc, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+class Dashboard:
+    def __init__(self, client: httpx.AsyncClient, rtt: float, details: int) -> None:
+        self.client = client
+        self.rtt = rtt
+        self.details = details
+        self.round_trips = 0
+
+    async def get(self, path: str):
+        await asyncio.sleep(self.rtt)
+        self.round_trips += 1
+        r = await self.client.get(path)
+        assert r.status_code == 200, (path, r.text)
+        return r.json()
+
+    async def batch(self, paths: list[str]) -> list:
+        await asyncio.sleep(self.rtt)
+        self.round_trips += 1
+        r = await self.client.post("/batch", json={"requests": [{"path": p} for p in paths]})
+        assert r.status_code == 200, r.text
+        out = r.json()["responses"]
+        assert all(s["status"] == 200 for s in out), out
+        return [s["body"] for s in out]
+
+    def detail_paths(self, props: list, jobs: list) -> list[str]:
+        paths = []
+        for p in props:
+            paths += [f"/properties/{p['id']}", f"/properties/{p['id']}/bookings"]
+        return paths + [f"/jobs/{j['id']}" for j in jobs[:self.details]]
+
+    async def sequential(self) -> None:
+        props = await self.get("/properties/mine")
+        jobs = await self.get("/jobs/me")
+        for path in self.detail_paths(props, jobs):
+            await self.get(path)
+
+    async def parallel(self) -> None:
+        props, jobs = await asyncio.gather(self.get("/properties/mine"), self.get("/jobs/me"))
+        await asyncio.gather(*(self.get(p) for p in self.detail_paths(props, jobs)))
+
+    async def batched(self) -> None:
+        props, jobs = await self.batch(["/properties/mine", "/jobs/me"])
+        await self.batch(self.detail_paths(props, jobs))
+
+
+async def measure(base_url: str, token: str, mode: str, args) -> tuple[float, int, int]:
+    limits = httpx.Limits(max_connections=6)
+    async with httpx.AsyncClient(base_url=base_url, headers={"Authorization": f"Bearer {token}"}, limits=limits, timeout=30) as client:
+        times, trips = [], 0
+        before = (await client.get("/_bench/statements")).json()["statements"]
+        for _ in range(args.loads):
+            d = Dashboard(client, args.rtt_ms / 1000, args.details)
+            t0 = time.perf_counter()
+            await getattr(d, mode)()
+            times.append(time.perf_counter() - t0)
+            trips = d.round_trips
+        after = (await client.get("/_bench/statements")).json()["statements"]
+    return statistics.median(times), trips, (after - before) // args.loads
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--properties", type=int, default=10)
+    ap.add_argument("--jobs", type=int, default=50, help="jobs of the host (the /jobs/me page)")
+    ap.add_argument("--details", type=int, default=10, help="jobs whose detail the dashboard opens")
+    ap.add_argument("--rtt-ms", type=float, default=40.0, help="client network round trip")
+    ap.add_argument("--pms-ms", type=float, default=30.0, help="PMS latency per booking lookup")
+    ap.add_argument("--loads", type=int, default=10, help="dashboard loads per mode")
+    ap.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.serve:
+        serve(args.serve, args.pms_ms)
+        return
+    token = seed(args.properties, args.jobs)
+    proc, base_url = start_server(args.pms_ms)
+    try:
+        results = {}
+        for mode in ("sequential", "parallel", "batched"):
+            results[mode] = asyncio.run(measure(base_url, token, mode, args))
+    finally:
+        proc.terminate()
+        proc.wait()
+    base = results["sequential"][0]
+    print(f"dashboard: {args.properties} properties, {args.details} job details, rtt={args.rtt_ms:.0f}ms, pms={args.pms_ms:.0f}ms "
+          f"({os.cpu_count()} cores)")
+    for mode, (t, trips, statements) in results.items():
+        print(f"{mode:<11} {t * 1000:8.1f}ms  round trips={trips:3d}  sql statements={statements:4d}  x{base / t:.1f}")
+
+
+if __name__ == "__main__":
+    main()
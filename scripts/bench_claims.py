@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark: POST /jobs/{id}/claim latency for cleaners with long histories.
+
+Each cleaner gets --history completed jobs plus a few dozen upcoming claimed
+ones; every claim then has to prove the new window clears the cleaner's
+schedule. Times the overlap check alone and the full request, first with the
+partial schedule index and again after dropping it (the check then walks the
+cleaner's whole history), printing p50/p95/p99 for each.
+
+    python scripts/bench_claims.py [--cleaners 20] [--history 5000] [--claims 400]
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_tmp = tempfile.mkdtemp()
+os.environ["CLEANING_DB_PATH"] = os.path.join(_tmp, "claims.db")
+os.environ["MEDIA_DIR"] = os.path.join(_tmp, "media")
+os.environ["ADMISSION_ENABLED"] = "false"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.database import DB_PATH, SessionLocal, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.routers.auth import create_access_token  # noqa: E402
+from app.services.claims import find_overlap  # noqa: E402
+
+# Store datetimes the way SQLAlchemy does (always with microseconds)
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" ", timespec="microseconds"))
+
+
+def generate(n_cleaners: int, history: int, n_open: int, seed: int = 5) -> list[int]:
+    init_db()
+    rnd = random.Random(seed)
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    con = sqlite3.connect(DB_PATH)
+    cur = con.cursor()
+    cur.execute("INSERT INTO users (id, email, password_hash, role, created_at) VALUES (1, 'h@local', 'x', 'host', ?)", (now,))
+    cur.execute("INSERT INTO hosts (id, user_id, name) VALUES (1, 1, 'H')")
+    cur.execute("INSERT INTO properties (id, host_id, name, address) VALUES (1, 1, 'P', '1 Main St')")
+    cur.executemany(
+        "INSERT INTO users (id, email, password_hash, role, created_at) VALUES (?, ?, 'x', 'cleaner', ?)",
+        [(1 + i, f"c{i}@local", now) for i in range(1, n_cleaners + 1)],
+    )
+    cur.executemany(
+        "INSERT INTO cleaners (id, user_id, name, avg_rating, ratings_count) VALUES (?, ?, ?, 0, 0)",
+        [(i, 1 + i, f"C{i}") for i in range(1, n_cleaners + 1)],
+    )
+    rows, job_id = [], 0
+    for c in range(1, n_cleaners + 1):
+        for k in range(history):  # one past job per day, going back
+            job_id += 1
+            start = now - timedelta(days=k + 1, hours=rnd.randint(0, 6))
+            rows.append((job_id, 1, 1, start, start + timedelta(hours=3), "completed", c, start - timedelta(days=3)))
+        for d in range(1, 41, 2):  # upcoming claimed jobs every other day
+            job_id += 1
+            start = now + timedelta(days=d, hours=11)
+            rows.append((job_id, 1, 1, start, start + timedelta(hours=3), "claimed", c, now))
+    open_ids = []
+    for _ in range(n_open):
+        job_id += 1
+        start = now + timedelta(days=rnd.randint(1, 40), hours=rnd.randint(8, 16))
+        rows.append((job_id, 1, 1, start, start + timedelta(hours=3), "open", None, now))
+        open_ids.append(job_id)
+    cur.executemany(
+        "INSERT INTO cleaning_jobs (id, property_id, host_id, booking_start, booking_end, status, cleaner_id, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    con.commit()
+    cur.execute("ANALYZE")
+    con.commit()
+    con.close()
+    return open_ids
+
+
+def run_claims(client: TestClient, job_ids: list[int], n_cleaners: int) -> tuple[list[float], dict[int, int]]:
+    tokens = [create_access_token({"sub": str(1 + c), "role": "cleaner"}) for c in range(1, n_cleaners + 1)]
+    timings, codes = [], {}
+    for i, job_id in enumerate(job_ids):
+        headers = {"Authorization": f"Bearer {tokens[i % n_cleaners]}"}
+        t0 = time.perf_counter()
+        r = client.post(f"/jobs/{job_id}/claim", headers=headers)
+        timings.append((time.perf_counter() - t0) * 1000)
+        codes[r.status_code] = codes.get(r.status_code, 0) + 1
+    return timings, codes
+
+
+def time_checks(job_ids: list[int], n_cleaners: int) -> list[float]:
+    con = sqlite3.connect(DB_PATH)
+    windows = dict(((j, (s, e)) for j, s, e in con.execute("SELECT id, booking_start, booking_end FROM cleaning_jobs WHERE status = 'open'")))
+    con.close()
+    db = SessionLocal()
+    timings = []
+    try:
+        for i, job_id in enumerate(job_ids):
+            start, end = (datetime.fromisoformat(v) for v in windows[job_id])
+            t0 = time.perf_counter()
+            find_overlap(db, 1 + i % n_cleaners, start, end)
+            timings.append((time.perf_counter() - t0) * 1000)
+    finally:
+        db.close()
+    return timings
+
+
+def reset_open(job_ids: list[int]) -> None:
+    con = sqlite3.connect(DB_PATH)
+    con.executemany("UPDATE cleaning_jobs SET status = 'open', cleaner_id = NULL WHERE id = ?", [(j,) for j in job_ids])
+    con.commit()
+    con.close()
+
+
+def report(label: str, timings: list[float], codes: dict[int, int] | None = None) -> None:
+    q = statistics.quantiles(timings, n=100)
+    extra = f"  status={dict(sorted(codes.items()))}" if codes else ""
+    print(f"{label:<34} p50={q[49]:7.3f}ms  p95={q[94]:7.3f}ms  p99={q[98]:7.3f}ms{extra}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cleaners", type=int, default=20)
+    ap.add_argument("--history", type=int, default=5000, help="completed jobs per cleaner")
+    ap.add_argument("--claims", type=int, default=400)
+    args = ap.parse_args()
+
+    open_ids = generate(args.cleaners, args.history, args.claims)
+    with TestClient(app) as client:
+        report("overlap check, schedule index", time_checks(open_ids, args.cleaners))
+        report("claim request, schedule index", *run_claims(client, open_ids, args.cleaners))
+        reset_open(open_ids)
+        con = sqlite3.connect(DB_PATH)
+        con.execute("DROP INDEX ix_cleaning_jobs_active_schedule")
+        con.close()
+        report("overlap check, history scan", time_checks(open_ids, args.cleaners))
+        report("claim request, history scan", *run_claims(client, open_ids, args.cleaners))
+
+
+if __name__ == "__main__":
+    main()
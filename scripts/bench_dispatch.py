@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark: batch dispatch of 10k open jobs across 2k cleaners.
+
+Generates a metro-area workload (turnover windows clustered around 11:00-15:00
+over two weeks, a third of cleaners already holding claims, most properties
+and cleaners geolocated), then times:
+
+  * solve      – the solver alone, in-process
+  * pass       – a full `run_dispatch` against a temp database: snapshot,
+                 solve in the worker process, commit through try_claim
+
+and fails if a full pass exceeds --budget-ms.
+
+    python scripts/bench_dispatch.py [--jobs 10000] [--cleaners 2000] [--budget-ms 10000]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_tmp = tempfile.mkdtemp()
+os.environ["CLEANING_DB_PATH"] = os.path.join(_tmp, "dispatch.db")
+
+from app.database import DB_PATH, SessionLocal, init_db  # noqa: E402
+from app.services.dispatch import load_snapshot, run_dispatch, shutdown_solver_pool, solve  # noqa: E402
+
+CENTER = (41.88, -87.63)
+# Store datetimes the way SQLAlchemy does (always with microseconds) so string
+# comparisons on windows that exactly touch agree with the app's own rows
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" ", timespec="microseconds"))
+
+
+def _near(rnd: random.Random, spread: float = 0.25) -> tuple[float, float]:
+    return CENTER[0] + rnd.uniform(-spread, spread), CENTER[1] + rnd.uniform(-spread, spread)
+
+
+def generate(n_jobs: int, n_cleaners: int, seed: int = 11) -> None:
+    init_db()
+    rnd = random.Random(seed)
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    n_hosts, n_props = max(10, n_jobs // 50), max(50, n_jobs // 5)
+    con = sqlite3.connect(DB_PATH)
+    cur = con.cursor()
+    cur.executemany(
+        "INSERT INTO users (id, email, password_hash, role, created_at) VALUES (?, ?, 'x', ?, ?)",
+        [(i, f"b{i}@local", "host" if i <= n_hosts else "cleaner", now) for i in range(1, n_hosts + n_cleaners + 1)],
+    )
+    cur.executemany("INSERT INTO hosts (id, user_id, name) VALUES (?, ?, ?)", [(i, i, f"H{i}") for i in range(1, n_hosts + 1)])
+    cleaners = []
+    for i in range(1, n_cleaners + 1):
+        lat, lng = _near(rnd) if rnd.random() < 0.9 else (None, None)
+        count = rnd.randint(0, 40)
+        cleaners.append((i, n_hosts + i, f"C{i}", rnd.uniform(3, 5) if count else 0, count, lat, lng))
+    cur.executemany(
+        "INSERT INTO cleaners (id, user_id, name, avg_rating, ratings_count, latitude, longitude) VALUES (?, ?, ?, ?, ?, ?, ?)", cleaners)
+    props = []
+    for i in range(1, n_props + 1):
+        lat, lng = _near(rnd) if rnd.random() < 0.9 else (None, None)
+        props.append((i, rnd.randint(1, n_hosts), f"P{i}", f"{i} Main St", lat, lng))
+    cur.executemany("INSERT INTO properties (id, host_id, name, address, latitude, longitude) VALUES (?, ?, ?, ?, ?, ?)", props)
+
+    def window() -> tuple[datetime, datetime]:
+        day = now + timedelta(days=rnd.randint(1, 14))
+        start = day.replace(hour=rnd.choice((10, 11, 11, 12, 13))) + timedelta(minutes=rnd.choice((0, 30)))
+        return start, start + timedelta(hours=rnd.choice((2, 3, 3, 4)))
+
+    jobs = []
+    for j in range(1, n_jobs + 1):
+        prop = props[rnd.randrange(n_props)]
+        start, end = window()
+        jobs.append((j, prop[0], prop[1], start, end, "open", None, now))
+    for k in range(n_cleaners // 3):  # existing commitments
+        prop = props[rnd.randrange(n_props)]
+        start, end = window()
+        jobs.append((n_jobs + k + 1, prop[0], prop[1], start, end, "claimed", rnd.randint(1, n_cleaners), now))
+    cur.executemany(
+        "INSERT INTO cleaning_jobs (id, property_id, host_id, booking_start, booking_end, status, cleaner_id, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", jobs)
+    con.commit()
+    cur.execute("ANALYZE")
+    con.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=10_000)
+    ap.add_argument("--cleaners", type=int, default=2_000)
+    ap.add_argument("--budget-ms", type=float, default=10_000, help="max wall time for a full dispatch pass")
+    args = ap.parse_args()
+
+    generate(args.jobs, args.cleaners)
+    db = SessionLocal()
+    jobs, cleaners = load_snapshot(db)
+    db.close()
+    t0 = time.perf_counter()
+    assignments = solve(jobs, cleaners)
+    solve_ms = (time.perf_counter() - t0) * 1000
+    print(f"solve      {len(jobs)} jobs x {len(cleaners)} cleaners: {solve_ms:8.1f}ms  "
+          f"assigned={len(assignments)} ({len(assignments) / max(1, len(jobs)):.1%})")
+
+    t0 = time.perf_counter()
+    result = asyncio.run(run_dispatch())
+    pass_ms = (time.perf_counter() - t0) * 1000
+    shutdown_solver_pool()
+    print(f"pass       snapshot={result.snapshot_ms:.1f}ms solve={result.solve_ms:.1f}ms (incl. worker start) "
+          f"commit={result.commit_ms:.1f}ms total={pass_ms:.1f}ms claimed={result.claimed} conflicts={result.conflicts}")
+
+    con = sqlite3.connect(DB_PATH)
+    # Pairs involving at least one dispatched job (pre-seeded claims may overlap each other)
+    overlaps = con.execute(
+        "SELECT COUNT(*) FROM cleaning_jobs a JOIN cleaning_jobs b ON a.cleaner_id = b.cleaner_id AND a.id < b.id "
+        "WHERE a.id <= ? AND a.status = 'claimed' AND b.status = 'claimed' "
+        "AND a.booking_start < b.booking_end AND b.booking_start < a.booking_end", (args.jobs,)
+    ).fetchone()[0]
+    con.close()
+    print(f"overlapping dispatched pairs: {overlaps}")
+    assert overlaps == 0, "dispatcher double-booked a cleaner"
+    assert pass_ms <= args.budget_ms, f"dispatch pass {pass_ms:.0f}ms over budget {args.budget_ms:.0f}ms"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET /exports/jobs throughput and server memory.
+
+Generates --jobs jobs (3 checklist items each, ratings on most completed
+ones), starts uvicorn as a subprocess and streams the full export in each
+format, reporting rows/sec, MB/s and the server's RSS before, during and at
+peak (VmHWM) — memory should stay flat however many rows go out.
+
+    python scripts/bench_export.py [--jobs 1000000]
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_tmp = tempfile.mkdtemp()
+os.environ["CLEANING_DB_PATH"] = os.path.join(_tmp, "export.db")
+os.environ["MEDIA_DIR"] = os.path.join(_tmp, "media")
+# Shared with the server subprocess so tokens minted here validate there
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+os.environ["ADMISSION_ENABLED"] = "false"
+
+import httpx  # noqa: E402
+
+from app.database import DB_PATH, init_db  # noqa: E402
+from app.routers.auth import create_access_token  # noqa: E402
+
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" ", timespec="microseconds"))
+EXPORT_READ = 256 * 1024
+
+
+def generate(n_jobs: int, seed: int = 3) -> None:
+    init_db()
+    rnd = random.Random(seed)
+    now = datetime.utcnow()
+    n_hosts, n_cleaners = max(10, n_jobs // 1000), max(10, n_jobs // 200)
+    con = sqlite3.connect(DB_PATH)
+    cur = con.cursor()
+    cur.execute("INSERT INTO users (id, email, password_hash, role, created_at) VALUES (1, 'admin@local', 'x', 'admin', ?)", (now,))
+    cur.executemany("INSERT INTO users (id, email, password_hash, role, created_at) VALUES (?, ?, 'x', 'host', ?)",
+                    ((1 + i, f"h{i}@local", now) for i in range(1, n_hosts + 1)))
+    cur.executemany("INSERT INTO hosts (id, user_id, name) VALUES (?, ?, ?)", ((i, 1 + i, f"H{i}") for i in range(1, n_hosts + 1)))
+    cur.executemany("INSERT INTO properties (id, host_id, name, address) VALUES (?, ?, ?, ?)",
+                    ((i, 1 + i % n_hosts, f"Prop {i}", f"{i} Main St, Springfield") for i in range(1, n_hosts * 10 + 1)))
+
+    def jobs():
+        for j in range(1, n_jobs + 1):
+            start = now - timedelta(hours=rnd.randint(0, 24 * 365 * 2))
+            done = rnd.random() < 0.8
+            yield (j, 1 + j % (n_hosts * 10), 1 + (j % (n_hosts * 10)) % n_hosts, start, start + timedelta(hours=3),
+                   "completed" if done else "open", 1 + j % n_cleaners if done else None, start - timedelta(days=7),
+                   start + timedelta(hours=4) if done else None)
+
+    cur.executemany(
+        "INSERT INTO cleaning_jobs (id, property_id, host_id, booking_start, booking_end, status, cleaner_id, created_at, completed_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", jobs())
+    cur.executemany(
+        "INSERT INTO checklist_items (job_id, text, checked, checked_at, photo_path) VALUES (?, ?, ?, ?, ?)",
+        ((j, text, True, now, f"/media/ab/cd/{j:064x}.jpg" if text == "Mop floors" else None)
+         for j in range(1, n_jobs + 1) for text in ("Change linens", "Dust surfaces", "Mop floors")))
+    cur.executemany(
+        "INSERT INTO ratings (job_id, host_id, cleaner_id, stars, feedback, created_at) VALUES (?, 1, 1, ?, ?, ?)",
+        ((j, rnd.randint(1, 5), "Spotless" if j % 3 else None, now) for j in range(1, n_jobs + 1, 2)))
+    con.commit()
+    cur.execute("ANALYZE")
+    con.commit()
+    con.close()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_kb(pid: int, field: str = "VmRSS") -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def run(base_url: str, pid: int, token: str, query: str) -> dict:
+    before = rss_kb(pid)
+    samples = []
+    rows = nbytes = 0
+    t0 = time.perf_counter()
+    with httpx.stream("GET", f"{base_url}/exports/jobs?{query}", headers={"Authorization": f"Bearer {token}"}, timeout=None) as r:
+        r.raise_for_status()
+        for chunk in r.iter_raw(EXPORT_READ):
+            nbytes += len(chunk)
+            rows += chunk.count(b"\n")
+            if len(samples) < 1000 and nbytes // (16 * 1024 * 1024) > len(samples):
+                samples.append(rss_kb(pid))
+    elapsed = time.perf_counter() - t0
+    return {"query": query, "seconds": elapsed, "bytes": nbytes, "lines": rows, "rss_before": before,
+            "rss_samples": samples, "rss_after": rss_kb(pid), "peak": rss_kb(pid, "VmHWM")}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=1_000_000)
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    generate(args.jobs)
+    print(f"generated {args.jobs} jobs in {time.perf_counter() - t0:.1f}s ({os.path.getsize(DB_PATH) / 1e6:.0f} MB)")
+
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=dict(os.environ),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                if httpx.get(f"{base_url}/health").status_code == 200:
+                    break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        token = create_access_token({"sub": "1", "role": "admin"})
+        for query in ("format=csv", "format=ndjson", "format=csv&gzip=true"):
+            res = run(base_url, proc.pid, token, query)
+            samples = res["rss_samples"] or [res["rss_after"]]
+            # Compressed output is not newline-delimited on the wire; report job rows
+            rows = args.jobs if "gzip" in query else res["lines"] - (1 if "csv" in query else 0)
+            print(
+                f"{query:<22} {rows / res['seconds']:9.0f} rows/s  {res['bytes'] / 1e6 / res['seconds']:6.1f} MB/s  "
+                f"{res['bytes'] / 1e6:7.1f} MB  rss before={res['rss_before'] / 1024:.0f}MB "
+                f"during={min(samples) / 1024:.0f}-{max(samples) / 1024:.0f}MB peak={res['peak'] / 1024:.0f}MB"
+            )
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    main()
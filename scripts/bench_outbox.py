@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark: notification outbox delivery throughput and lag.
+
+Queues --messages notifications spread over --recipients users (a dispatch
+burst: every recipient has a pile of updates at once) and drains them through
+a transport that sleeps --latency-ms per send, like an SMTP round trip. Runs
+one message per email at the configured concurrency, then coalesced digests
+one at a time and at the configured concurrency. Prints emails sent,
+messages/sec and the created-to-sent lag percentiles.
+
+    python scripts/bench_outbox.py [--messages 20000] [--recipients 1000] [--latency-ms 5] [--concurrency 8]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_tmp = tempfile.mkdtemp()
+os.environ["CLEANING_DB_PATH"] = os.path.join(_tmp, "outbox.db")
+os.environ["MEDIA_DIR"] = os.path.join(_tmp, "media")
+
+from app.database import DB_PATH, init_db  # noqa: E402
+from app.services import notifications  # noqa: E402
+from app.services.notifications import Digest, OutboxStats, drain  # noqa: E402
+
+# Store datetimes the way SQLAlchemy does (always with microseconds)
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" ", timespec="microseconds"))
+
+
+class SlowTransport:
+    """Stands in for a mail relay: fixed latency per send."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.sent = 0
+
+    def send(self, digest: Digest) -> None:
+        time.sleep(self.latency)
+        self.sent += 1
+
+
+def generate(n_messages: int, n_recipients: int, seed: int = 11) -> None:
+    init_db()
+    rnd = random.Random(seed)
+    now = datetime.utcnow()
+    con = sqlite3.connect(DB_PATH)
+    cur = con.cursor()
+    cur.executemany(
+        "INSERT INTO users (id, email, password_hash, role, created_at) VALUES (?, ?, 'x', 'cleaner', ?)",
+        [(i, f"c{i}@local", now) for i in range(1, n_recipients + 1)],
+    )
+    kinds = ["job_claimed", "job_upcoming", "job_rated"]
+    cur.executemany(
+        "INSERT INTO notification_outbox (recipient_id, kind, job_id, payload, status, attempts, created_at, next_attempt_at) "
+        "VALUES (?, ?, ?, ?, 'pending', 0, ?, ?)",
+        [(rnd.randint(1, n_recipients), rnd.choice(kinds), i,
+          '{"property": "Prop %d", "start": "2026-01-01T10:00:00", "end": "2026-01-01T13:00:00", "cleaner": "C", "stars": 5}' % i,
+          now, now) for i in range(1, n_messages + 1)],
+    )
+    con.commit()
+    cur.execute("ANALYZE")
+    con.commit()
+    con.close()
+
+
+def reset() -> None:
+    now = datetime.utcnow()
+    con = sqlite3.connect(DB_PATH)
+    con.execute("UPDATE notification_outbox SET status = 'pending', sent_at = NULL, created_at = ?, next_attempt_at = ?", (now, now))
+    con.commit()
+    con.close()
+    notifications.STATS = OutboxStats()
+
+
+def run(label: str, latency: float, concurrency: int, digest_max: int) -> None:
+    reset()
+    notifications.DIGEST_MAX = digest_max
+    transport = SlowTransport(latency)
+    t0 = time.perf_counter()
+    totals = asyncio.run(drain(transport, now=datetime.utcnow() + timedelta(seconds=1), concurrency=concurrency, max_passes=10**6))
+    elapsed = time.perf_counter() - t0
+    con = sqlite3.connect(DB_PATH)
+    lags = sorted(
+        (datetime.fromisoformat(sent) - datetime.fromisoformat(created)).total_seconds()
+        for sent, created in con.execute("SELECT sent_at, created_at FROM notification_outbox WHERE status = 'sent'")
+    )
+    con.close()
+    lag = {"p50": lags[len(lags) // 2], "p95": lags[int(len(lags) * 0.95)], "max": lags[-1]}
+    print(
+        f"{label:<32} emails={transport.sent:6d}  {totals['delivered'] / elapsed:8.0f} msg/s  {elapsed:6.2f}s  "
+        f"lag p50={lag['p50']:.2f}s p95={lag['p95']:.2f}s max={lag['max']:.2f}s"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=20_000)
+    ap.add_argument("--recipients", type=int, default=1_000)
+    ap.add_argument("--latency-ms", type=float, default=5.0)
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+    generate(args.messages, args.recipients)
+    latency = args.latency_ms / 1000
+    digest_max = notifications.DIGEST_MAX
+    run(f"one email per message, x{args.concurrency}", latency, args.concurrency, 1)
+    run("digests, x1", latency, 1, digest_max)
+    run(f"digests, x{args.concurrency}", latency, args.concurrency, digest_max)
+
+
+if __name__ == "__main__":
+    main()
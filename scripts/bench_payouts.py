@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Benchmark: weekly payout computation over --jobs completed jobs.
+
+Generates one pay week of completed jobs (plus older history the period must
+skip), then times:
+
+- the dry run and the ledger write (one set-based INSERT ... SELECT), checked
+  against a per-job Python aggregation of the same rows;
+- recomputing the same period, which returns the existing ledger;
+- paying the ledger through a payment client with --latency-ms per call, one
+  batch at a time and then PAYOUT_CONCURRENCY at a time;
+- an outage that fails every call after the first few batches, followed by a
+  resume that must pay each remaining payout exactly once.
+
+    python scripts/bench_payouts.py [--jobs 1000000] [--latency-ms 50]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_tmp = tempfile.mkdtemp()
+os.environ["CLEANING_DB_PATH"] = os.path.join(_tmp, "payouts.db")
+os.environ["MEDIA_DIR"] = os.path.join(_tmp, "media")
+
+from app.database import DB_PATH, SessionLocal, init_db  # noqa: E402
+from app.services.payouts import (  # noqa: E402
+    PAYOUT_CONCURRENCY, PAYOUT_DEFAULT_RATE_CENTS, PAYOUT_RATING_BONUS, compute, last_week, pay, run_status,
+)
+
+# Store datetimes the way SQLAlchemy does (always with microseconds)
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" ", timespec="microseconds"))
+
+
+def generate(n_jobs: int, start: datetime, end: datetime, seed: int = 13) -> None:
+    init_db()
+    rnd = random.Random(seed)
+    n_cleaners, n_props = max(10, n_jobs // 50), max(10, n_jobs // 20)
+    n_hosts = max(1, n_props // 10)
+    now = datetime.utcnow()
+    con = sqlite3.connect(DB_PATH)
+    cur = con.cursor()
+    cur.executemany(
+        "INSERT INTO users (id, email, password_hash, role, created_at) VALUES (?, ?, 'x', ?, ?)",
+        [(i, f"u{i}@local", "host" if i <= n_hosts else "cleaner", now) for i in range(1, n_hosts + n_cleaners + 1)],
+    )
+    cur.executemany("INSERT INTO hosts (id, user_id, name) VALUES (?, ?, ?)", [(i, i, f"H{i}") for i in range(1, n_hosts + 1)])
+    cur.executemany(
+        "INSERT INTO cleaners (id, user_id, name, avg_rating, ratings_count) VALUES (?, ?, ?, 0, 0)",
+        [(i, n_hosts + i, f"C{i}") for i in range(1, n_cleaners + 1)],
+    )
+    cur.executemany(
+        "INSERT INTO properties (id, host_id, name, address, payout_rate_cents) VALUES (?, ?, ?, ?, ?)",
+        [(i, 1 + i % n_hosts, f"P{i}", f"{i} Main St", rnd.choice([None, 4000, 5500, 7250, 9000]))
+         for i in range(1, n_props + 1)],
+    )
+    span = (end - start).total_seconds()
+
+    def jobs():
+        for j in range(1, n_jobs + n_jobs // 5 + 1):
+            in_period = j <= n_jobs
+            done = start + timedelta(seconds=rnd.random() * span) if in_period else start - timedelta(days=rnd.randint(1, 60))
+            yield (j, rnd.randint(1, n_props), done - timedelta(hours=4), done - timedelta(hours=1), "completed",
+                   rnd.randint(1, n_cleaners), done - timedelta(days=7), done)
+
+    cur.executemany(
+        "INSERT INTO cleaning_jobs (id, property_id, booking_start, booking_end, status, cleaner_id, created_at, completed_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", jobs())
+    cur.execute("UPDATE cleaning_jobs SET host_id = (SELECT host_id FROM properties WHERE properties.id = property_id)")
+    cur.executemany(
+        "INSERT INTO ratings (job_id, host_id, cleaner_id, stars, created_at) VALUES (?, 1, 1, ?, ?)",
+        ((j, rnd.randint(1, 5), now) for j in range(1, n_jobs + n_jobs // 5 + 1) if rnd.random() < 0.6),
+    )
+    con.commit()
+    cur.execute("ANALYZE")
+    con.commit()
+    con.close()
+
+
+def python_totals(start: datetime, end: datetime) -> tuple[dict[int, int], float]:
+    """The per-job way: pull every job row and add it up in Python."""
+    t0 = time.perf_counter()
+    con = sqlite3.connect(DB_PATH)
+    totals: dict[int, int] = defaultdict(int)
+    rows = con.execute(
+        "SELECT j.cleaner_id, p.payout_rate_cents, r.stars FROM cleaning_jobs j JOIN properties p ON p.id = j.property_id "
+        "LEFT JOIN ratings r ON r.job_id = j.id WHERE j.status = 'completed' AND j.completed_at >= ? AND j.completed_at < ?",
+        (start, end),
+    )
+    for cleaner_id, rate, stars in rows:
+        rate = PAYOUT_DEFAULT_RATE_CENTS if rate is None else rate
+        totals[cleaner_id] += rate + rate * PAYOUT_RATING_BONUS.get(stars, 0) // 100
+    con.close()
+    return totals, time.perf_counter() - t0
+
+
+class Provider:
+    """Payment API stand-in: latency per call, idempotent by key, optional outage."""
+
+    def __init__(self, latency: float, fail_after: int | None = None) -> None:
+        self.latency = latency
+        self.fail_after = fail_after
+        self.calls = 0
+        self.refs: dict[str, str] = {}
+        self.submitted: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def __call__(self, items: list[dict]) -> dict[str, str]:
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(self.latency)
+        if self.fail_after is not None and call > self.fail_after:
+            raise ConnectionError("payments API unavailable")
+        with self.lock:
+            for item in items:
+                self.submitted[item["idempotency_key"]] += 1
+                self.refs.setdefault(item["idempotency_key"], f"ref-{item['idempotency_key']}")
+        return {item["idempotency_key"]: self.refs[item["idempotency_key"]] for item in items}
+
+
+def reset_ledger(run_id: int) -> None:
+    con = sqlite3.connect(DB_PATH)
+    con.execute("UPDATE payouts SET status = 'pending', attempts = 0, payment_ref = NULL, paid_at = NULL, last_error = NULL WHERE run_id = ?", (run_id,))
+    con.execute("UPDATE payout_runs SET finished_at = NULL WHERE id = ?", (run_id,))
+    con.commit()
+    con.close()
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=1_000_000, help="completed jobs in the pay week")
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="payment API latency per batch call")
+    args = ap.parse_args()
+    start, end = last_week()
+    t0 = time.perf_counter()
+    generate(args.jobs, start, end)
+    print(f"generated {args.jobs} completed jobs in the week (+{args.jobs // 5} older) in {time.perf_counter() - t0:.1f}s")
+
+    db = SessionLocal()
+    try:
+        dry, t_dry = timed(lambda: compute(db, start, end, dry_run=True))
+        print(f"dry run            {t_dry * 1000:8.0f}ms  cleaners={dry.cleaners} jobs={dry.jobs} total=${dry.amount_cents / 100:,.2f}")
+        summary, t_ledger = timed(lambda: compute(db, start, end))
+        print(f"ledger write       {t_ledger * 1000:8.0f}ms  run={summary.run_id} base=${summary.base_cents / 100:,.2f} bonus=${summary.bonus_cents / 100:,.2f}")
+        again, t_again = timed(lambda: compute(db, start, end))
+        print(f"recompute          {t_again * 1000:8.0f}ms  created={again.created} (existing ledger returned)")
+    finally:
+        db.close()
+
+    expected, t_py = python_totals(start, end)
+    con = sqlite3.connect(DB_PATH)
+    ledger = dict(con.execute("SELECT cleaner_id, amount_cents FROM payouts WHERE run_id = ?", (summary.run_id,)))
+    con.close()
+    assert ledger == expected, "ledger disagrees with per-job aggregation"
+    print(f"per-job python     {t_py * 1000:8.0f}ms  (same totals: ok)")
+
+    latency = args.latency_ms / 1000
+    for concurrency in (1, PAYOUT_CONCURRENCY):
+        reset_ledger(summary.run_id)
+        provider = Provider(latency)
+        progress, t_pay = timed(lambda: asyncio.run(pay(summary.run_id, provider, concurrency=concurrency)))
+        print(f"pay x{concurrency:<13} {t_pay * 1000:8.0f}ms  paid={progress['paid']} in {provider.calls} calls "
+              f"(vs {dry.jobs} per-job initiate_payment_stub calls)")
+
+    reset_ledger(summary.run_id)
+    provider = Provider(latency, fail_after=5)
+    first = asyncio.run(pay(summary.run_id, provider))
+    provider.fail_after = None
+    second, t_resume = timed(lambda: asyncio.run(pay(summary.run_id, provider)))
+    db = SessionLocal()
+    try:
+        status = run_status(db, summary.run_id)
+    finally:
+        db.close()
+    twice = sum(1 for n in provider.submitted.values() if n > 1)
+    assert status["paid"] == summary.cleaners and twice == 0 and status["paid_cents"] == summary.amount_cents, (status, twice)
+    print(f"outage + resume    {t_resume * 1000:8.0f}ms  first pass paid={first['paid']} failed_batches={first['failed_batches']}, "
+          f"resume paid={second['paid']}; submitted twice={twice}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Benchmark: evidence photo variants (thumbnail + web JPEG) per core.
+
+Generates --photos distinct 12MP phone-style JPEGs with GPS and orientation
+EXIF, then:
+
+- times a full decode against the DCT-scaled decode render() uses;
+- renders all photos with 1..--workers processes and prints photos/s overall
+  and per worker (on this machine's cores);
+- uploads them through the API with a small PHOTO_QUEUE_MAX and waits until
+  every item is ready. Uploads never wait for rendering; what does not fit in
+  the queue is picked up by the sweep;
+- checks the variants carry no EXIF and compares the bytes of a 30-photo
+  grid served as originals vs thumbnails.
+
+    python scripts/bench_photos.py [--photos 24] [--workers N]
+"""
+from __future__ import annotations
+import argparse
+import glob
+import io
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_tmp = tempfile.mkdtemp()
+os.environ.update(
+    CLEANING_DB_PATH=os.path.join(_tmp, "photos.db"), MEDIA_DIR=os.path.join(_tmp, "media"),
+    ADMISSION_ENABLED="false", OUTBOX_INTERVAL_SECONDS="0", PHOTO_QUEUE_MAX="4", PHOTO_SWEEP_SECONDS="1",
+)
+
+from app.services.media_store import MEDIA_STORE, MediaStore  # noqa: E402
+from app.services.photos import PILLOW_AVAILABLE, render  # noqa: E402
+
+
+def phone_photo(seed: int) -> bytes:
+    """4032x3024 JPEG with camera-like noise, orientation and a GPS position."""
+    from PIL import Image, ImageFilter
+    rnd = random.Random(seed)
+    # Noise upscaled and blurred: compresses like a photo, not like flat colour or pure noise
+    base = Image.effect_noise((504, 378), 60).convert("RGB").resize((4032, 3024)).filter(ImageFilter.GaussianBlur(2))
+    tint = Image.new("RGB", base.size, (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+    img = Image.blend(base, tint, 0.35)
+    exif = Image.Exif()
+    exif[0x0112] = rnd.choice([1, 6])
+    exif[0x010F] = "BenchCam"
+    exif[0x8825] = {1: "N", 2: (51.0, 30.0, float(seed)), 3: "W", 4: (0.0, 7.0, 0.0)}
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=90, exif=exif)
+    return out.getvalue()
+
+
+def write_originals(photos: list[bytes]) -> list[tuple[str, str]]:
+    """Originals in a scratch store: (abs path, rel)."""
+    store = MediaStore(os.path.join(_tmp, "render"))
+    store.ensure_root()
+    out = []
+    for data in photos:
+        staged = store.stage(io.BytesIO(data))
+        rel = MediaStore.relpath(staged.digest, ".jpg")
+        store.publish(staged, rel)
+        out.append((store.abspath(rel), rel))
+    return out
+
+
+def decode_costs(path: str) -> tuple[float, float, tuple[int, int]]:
+    from PIL import Image
+    t0 = time.perf_counter()
+    with Image.open(path) as im:
+        im.load()
+    full = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    with Image.open(path) as im:
+        im.draft("RGB", (1600, 1200))
+        im.load()
+        scaled = im.size
+    return full, time.perf_counter() - t0, scaled
+
+
+def render_throughput(originals: list[tuple[str, str]], workers: int) -> float:
+    root = os.path.join(_tmp, "render")
+    for p in glob.glob(os.path.join(root, "*", "*", "*-*.jpg")):
+        os.unlink(p)
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        list(pool.map(render, [originals[0][0]] * workers, [originals[0][1]] * workers, [root] * workers))  # warm up
+        for p in glob.glob(os.path.join(root, "*", "*", "*-*.jpg")):
+            os.unlink(p)
+        t0 = time.perf_counter()
+        list(pool.map(render, *zip(*originals), [root] * len(originals)))
+        return time.perf_counter() - t0
+
+
+def end_to_end(photos: list[bytes]) -> None:
+    from fastapi.testclient import TestClient
+    from PIL import Image
+    from app.main import app
+
+    with TestClient(app) as client:
+        def register(email, role):
+            r = client.post("/auth/register", json={"email": email, "password": "secret123", "role": role})
+            assert r.status_code == 200, r.text
+            return {"Authorization": f"Bearer {r.json()['token']}"}
+
+        host, cleaner, admin = register("h@example.com", "host"), register("c@example.com", "cleaner"), register("a@example.com", "admin")
+        prop = client.post("/properties/", json={"name": "Flat", "address": "1 Main St"}, headers=host).json()
+        start = datetime.utcnow() + timedelta(days=1)
+        job = client.post("/jobs/", headers=host, json={
+            "property_id": prop["id"], "booking_start": start.isoformat(), "booking_end": (start + timedelta(hours=3)).isoformat(),
+            "checklist": [{"text": f"Room {i}"} for i in range(len(photos))],
+        }).json()
+        assert client.post(f"/jobs/{job['id']}/claim", headers=cleaner).status_code == 200
+        t0 = time.perf_counter()
+        for item, data in zip(job["checklist_items"], photos):
+            r = client.post(f"/jobs/{job['id']}/checklist/{item['id']}/photo", headers=cleaner,
+                            files={"file": ("photo.jpg", io.BytesIO(data), "image/jpeg")})
+            assert r.status_code == 200, r.text
+        t_upload = time.perf_counter() - t0
+        while client.get("/admin/photos", headers=admin).json()["pending"]:
+            time.sleep(0.05)
+        t_ready = time.perf_counter() - t0
+        stats = client.get("/admin/photos", headers=admin).json()
+        items = client.get(f"/jobs/{job['id']}", headers=host).json()["checklist_items"]
+        assert all(it["photo_status"] == "ready" for it in items), items
+        for it in items:
+            for path in (it["photo_thumb_path"], it["photo_web_path"]):
+                with Image.open(MEDIA_STORE.abspath(MediaStore.rel_from_url(path))) as im:
+                    assert not im.getexif() and max(im.size) <= 1600, (path, dict(im.getexif()))
+        grid = (items * (30 // len(items) + 1))[:30]
+        size = lambda url: os.path.getsize(MEDIA_STORE.abspath(MediaStore.rel_from_url(url)))  # noqa: E731
+        originals, thumbs, webs = (sum(size(it[k]) for it in grid) for k in ("photo_path", "photo_thumb_path", "photo_web_path"))
+        print(f"api                {len(photos)} uploads in {t_upload:.1f}s (queue max 4, {stats['workers']} workers), "
+              f"all ready after {t_ready:.1f}s; rendered={stats['rendered']} failed={stats['failed']}; variants carry no EXIF")
+        print(f"30-photo grid      originals {originals / 1e6:.1f}MB, web {webs / 1e6:.1f}MB, thumbnails {thumbs / 1e6:.2f}MB "
+              f"({originals / thumbs:.0f}x smaller)")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--photos", type=int, default=24)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="largest pool size to try")
+    args = ap.parse_args()
+    if not PILLOW_AVAILABLE:
+        sys.exit("Pillow is not installed (pip install -r requirements.txt)")
+    t0 = time.perf_counter()
+    photos = [phone_photo(i) for i in range(args.photos)]
+    print(f"generated {args.photos} photos, 4032x3024, avg {sum(map(len, photos)) / len(photos) / 1e6:.1f}MB, "
+          f"in {time.perf_counter() - t0:.1f}s")
+    originals = write_originals(photos)
+    full, scaled, size = decode_costs(originals[0][0])
+    print(f"decode             full 12MP {full * 1000:.0f}ms, DCT-scaled to {size[0]}x{size[1]} {scaled * 1000:.0f}ms")
+    for workers in sorted({1, *range(2, args.workers + 1, 2), args.workers}):
+        elapsed = render_throughput(originals, workers)
+        rate = len(originals) / elapsed
+        print(f"render x{workers:<3}        {rate:6.1f} photos/s  {rate / workers:5.1f} photos/s per worker  "
+              f"{elapsed / len(originals) * workers * 1000:5.0f}ms per photo  ({os.cpu_count()} cores)")
+    end_to_end(photos)
+
+
+if __name__ == "__main__":
+    main()
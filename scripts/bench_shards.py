@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Benchmark: write throughput with one database vs --shards shard files.
+
+Runs the same write load twice, each in a fresh database: unsharded (SHARDS=0,
+every host in one file) and sharded. --procs worker processes (like uvicorn
+workers) post jobs for random hosts for --seconds. Each job is one
+transaction with its checklist and outbox rows, on the host's shard session
+with the same placement check a request gets. Prints commits/sec and commit
+latency percentiles.
+
+The sharded run then checks the rest of the mode:
+
+- the job board (GET /jobs/open) merges every shard in booking order;
+- a claim through the API lands on the job's shard;
+- moving a host to another shard keeps every one of its rows;
+- a session still pointing at the old shard cannot commit (503).
+
+    python scripts/bench_shards.py [--shards 4] [--procs 8] [--hosts 64] [--seconds 5]
+"""
+from __future__ import annotations
+import argparse
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def setup(n_hosts: int) -> list[tuple[int, int, int, int, str]]:
+    """Hosts with one property each: (host_id, shard, user_id, property_id, property_name)."""
+    from app import models
+    from app.database import SessionLocal, init_db
+    from app.sharding import placement, session
+    init_db()
+    db = SessionLocal()
+    hosts = []
+    try:
+        for i in range(n_hosts):
+            u = models.User(email=f"h{i}@local", password_hash="x", role=models.UserRole.host)
+            db.add(u)
+            db.flush()
+            h = models.Host(user_id=u.id, name=f"H{i}")
+            db.add(h)
+            db.flush()
+            h.shard = placement(h.id)
+            hosts.append((h.id, h.shard, u.id))
+        db.commit()
+    finally:
+        db.close()
+    out = []
+    for host_id, shard, user_id in hosts:
+        s = session(shard)
+        try:
+            p = models.Property(host_id=host_id, name=f"P{host_id}", address=f"{host_id} Main St")
+            s.add(p)
+            s.commit()
+            out.append((host_id, shard, user_id, p.id, p.name))
+        finally:
+            s.close()
+    return out
+
+
+def write_load(task: tuple[int, list, float]) -> tuple[list[float], int]:
+    """One worker process: post jobs for random hosts until the deadline."""
+    seed, hosts, seconds = task
+    from sqlalchemy.exc import OperationalError
+    from app import models
+    from app.database import init_db
+    from app.services.notifications import enqueue
+    from app.sharding import session
+    init_db()  # a version check; registers the sharded id and placement hooks
+    rnd = random.Random(seed)
+    base = datetime.utcnow() + timedelta(days=1)
+    latencies, busy = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        host_id, shard, user_id, prop_id, prop_name = rnd.choice(hosts)
+        t0 = time.perf_counter()
+        s = session(shard)
+        s.info["host_guard"] = (host_id, shard)
+        try:
+            start = base + timedelta(hours=rnd.randint(0, 24 * 60))
+            job = models.CleaningJob(property_id=prop_id, host_id=host_id, booking_start=start,
+                                     booking_end=start + timedelta(hours=3), status=models.JobStatus.open)
+            s.add(job)
+            s.flush()
+            s.add_all(models.ChecklistItem(job_id=job.id, text=text) for text in ("Beds", "Bathroom", "Kitchen"))
+            enqueue(s, user_id, "job_posted", job, prop_name)
+            s.commit()
+            latencies.append(time.perf_counter() - t0)
+        except OperationalError:  # "database is locked" after the busy timeout
+            s.rollback()
+            busy += 1
+        finally:
+            s.close()
+    return latencies, busy
+
+
+def check_sharded(hosts: list) -> None:
+    from fastapi.testclient import TestClient
+    from app import models
+    from app.main import app
+    from app.sharding import SHARDS, HostMoved, locate, move_host, placements, session
+
+    with TestClient(app) as client:
+        r = client.post("/auth/register", json={"email": "cleaner@example.com", "password": "secret123", "role": "cleaner", "name": "C"})
+        assert r.status_code == 200, r.text
+        auth = {"Authorization": f"Bearer {r.json()['token']}"}
+        board = client.get("/jobs/open?limit=100", headers=auth).json()
+        starts = [j["booking_start"] for j in board]
+        assert len(board) == 100 and starts == sorted(starts), "job board not merged in booking order"
+        shards_seen = {locate(models.CleaningJob.__table__, j["id"])[0] for j in board}
+        claimed = client.post(f"/jobs/{board[0]['id']}/claim", headers=auth)
+        assert claimed.status_code == 200 and claimed.json()["status"] == "claimed", claimed.text
+    print(f"job board          first 100 open jobs come from {len(shards_seen)} shards, in booking order; claim ok")
+
+    before = placements()
+    host_id, source = hosts[0][0], hosts[0][1]
+    target = source % SHARDS + 1
+    stale = session(source)
+    stale.info["host_guard"] = (host_id, source)
+    stale.query(models.Host).first()  # an in-flight request, routed before the move
+    t0 = time.perf_counter()
+    moved = move_host(host_id, target)
+    t_move = time.perf_counter() - t0
+    after = placements()
+    assert sum(p["jobs"] for p in before.values()) == sum(p["jobs"] for p in after.values()), "jobs lost in the move"
+    assert after[target]["jobs"] - before[target]["jobs"] == moved["cleaning_jobs"]
+    assert after[target]["hosts"] == before[target]["hosts"] + 1
+    try:
+        stale.add(models.CleaningJob(property_id=hosts[0][3], host_id=host_id, booking_start=datetime.utcnow(),
+                                     booking_end=datetime.utcnow() + timedelta(hours=1), status=models.JobStatus.open))
+        stale.commit()
+        raise AssertionError("stale shard session committed after the move")
+    except HostMoved:
+        stale.rollback()
+    finally:
+        stale.close()
+    rows = sum(moved.values())
+    print(f"rebalance          host {host_id} shard {source} -> {target}: {rows} rows in {t_move * 1000:.0f}ms; "
+          f"nothing lost, stale session refused (503)")
+
+
+def run(args) -> None:
+    from app.sharding import SHARDS
+    hosts = setup(args.hosts)
+    ctx = multiprocessing.get_context("spawn")
+    t0 = time.perf_counter()
+    with ctx.Pool(args.procs) as pool:
+        results = pool.map(write_load, [(seed, hosts, args.seconds) for seed in range(args.procs)])
+    elapsed = time.perf_counter() - t0  # includes worker start-up
+    latencies = sorted(x for lat, _ in results for x in lat)
+    busy = sum(b for _, b in results)
+    rate = len(latencies) / args.seconds
+    label = "1 database" if not SHARDS else f"{SHARDS} shards + catalog"
+    print(f"{label:<18} {rate:8.0f} commits/s  p50={latencies[len(latencies) // 2] * 1000:.1f}ms "
+          f"p95={latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms "
+          f"locked={busy}  ({len(latencies)} jobs, {args.procs} procs on {os.cpu_count()} cores, {elapsed:.1f}s)")
+    if SHARDS:
+        check_sharded(hosts)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shards", type=int, default=4)
+    ap.add_argument("--procs", type=int, default=8, help="writer processes")
+    ap.add_argument("--hosts", type=int, default=64)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.run:
+        run(args)
+        return
+    for shards in (0, args.shards):
+        tmp = tempfile.mkdtemp()
+        env = dict(
+            os.environ, SHARDS=str(shards), SHARD_DIR=tmp, CLEANING_DB_PATH=os.path.join(tmp, "bench.db"),
+            MEDIA_DIR=os.path.join(tmp, "media"), OUTBOX_INTERVAL_SECONDS="0", ADMISSION_ENABLED="false", SLOW_QUERY_MS="0",
+        )
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--run", *sys.argv[1:]], env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark: replica cold start — import, startup hooks (migrations), first
+/health and first authenticated request — each run in a fresh interpreter.
+
+    python scripts/bench_startup.py [--runs 5]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app.main
+t_import = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.routers.auth import create_access_token
+client = TestClient(app.main.app)
+client.__enter__()  # runs startup hooks
+t_startup = time.perf_counter()
+assert client.get("/health").status_code == 200
+t_health = time.perf_counter()
+token = create_access_token({"sub": "1", "role": "host"})
+client.get("/jobs/open", headers={"Authorization": f"Bearer {token}"})
+t_first = time.perf_counter()
+client.__exit__(None, None, None)
+print(json.dumps({
+    "import": t_import - t0,
+    "startup": t_startup - t_import,
+    "first_health": t_health - t_startup,
+    "first_api": t_first - t_health,
+    "passlib_loaded": "passlib" in sys.modules,
+}))
+"""
+
+
+def run_once(db_path: str) -> dict:
+    env = dict(os.environ, CLEANING_DB_PATH=db_path, MEDIA_DIR=os.path.join(os.path.dirname(db_path), "media"))
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def summarize(label: str, runs: list[dict]) -> None:
+    cols = []
+    for key in ("import", "startup", "first_health", "first_api"):
+        cols.append(f"{key}={statistics.median(r[key] for r in runs) * 1000:7.1f}ms")
+    total = statistics.median(sum(r[k] for k in ("import", "startup", "first_health", "first_api")) for r in runs)
+    print(f"{label:<18} " + "  ".join(cols) + f"  total={total * 1000:7.1f}ms  passlib_loaded={runs[0]['passlib_loaded']}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+    run_once(os.path.join(tempfile.mkdtemp(), "warmup.db"))  # populate .pyc caches
+    fresh = [run_once(os.path.join(tempfile.mkdtemp(), "fresh.db")) for _ in range(args.runs)]
+    migrated_db = os.path.join(tempfile.mkdtemp(), "migrated.db")
+    run_once(migrated_db)
+    warm = [run_once(migrated_db) for _ in range(args.runs)]
+    summarize("fresh database", fresh)
+    summarize("already migrated", warm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bytes transferred and modelled time-to-first-render for the built
+frontend (/app), plain StaticFiles vs CachedStaticFiles.
+
+A page load is index.html followed by the JS/CSS it references (fetched in
+parallel). First render needs all of them, so TTFR ≈ 2 RTT + critical bytes /
+bandwidth + server time. Repeat visits revalidate whatever the browser may not
+reuse without asking (everything for plain StaticFiles, only index.html for
+hashed assets marked immutable).
+
+    python scripts/bench_static.py
+"""
+from __future__ import annotations
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.routing import Mount  # noqa: E402
+from starlette.staticfiles import StaticFiles  # noqa: E402
+
+from app.services.static_assets import CachedStaticFiles  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NETWORKS = {"3G (1.6Mbps, 150ms)": (1.6e6, 0.150), "4G (12Mbps, 50ms)": (12e6, 0.050), "cable (50Mbps, 20ms)": (50e6, 0.020)}
+HEADERS = {"Accept-Encoding": "br, gzip, deflate"}
+
+
+def page_assets(html: str) -> list[str]:
+    return re.findall(r'(?:src|href)="(/app/assets/[^"]+)"', html)
+
+
+def load(client: TestClient, cache: dict) -> tuple[int, int, float, list[str]]:
+    """One page load. ``cache`` maps url -> (etag, cache-control) from earlier loads."""
+    wire = 0
+    requests = 0
+    t0 = time.perf_counter()
+
+    def fetch(url: str):
+        nonlocal wire, requests
+        cached = cache.get(url)
+        if cached and "immutable" in cached[1]:
+            return None
+        headers = dict(HEADERS)
+        if cached:
+            headers["If-None-Match"] = cached[0]
+        r = client.get(url, headers=headers)
+        requests += 1
+        wire += int(r.headers.get("content-length", len(r.content)))
+        if r.status_code == 200:
+            cache[url] = (r.headers.get("etag", ""), r.headers.get("cache-control", ""))
+        return r
+
+    r = fetch("/app/")
+    html = r.text if r is not None and r.status_code == 200 else cache["__html__"]
+    cache["__html__"] = html
+    assets = page_assets(html)
+    for url in assets:
+        fetch(url)
+    return wire, requests, time.perf_counter() - t0, assets
+
+
+def report(label: str, wire: int, requests: int, server_s: float) -> None:
+    cols = []
+    for name, (bps, rtt) in NETWORKS.items():
+        # One round trip for index.html, one more for its assets (in parallel)
+        round_trips = min(requests, 2)
+        ttfr = round_trips * rtt + wire * 8 / bps + server_s
+        cols.append(f"{name}: {ttfr * 1000:6.0f}ms")
+    print(f"{label:<28} requests={requests}  bytes={wire:8d}  server={server_s * 1000:5.1f}ms  " + "  ".join(cols))
+
+
+def main() -> None:
+    dist = os.path.join(ROOT, "frontend", "dist")
+    if not os.path.isdir(dist):
+        raise SystemExit("frontend/dist not built")
+    # Work on a copy so on-demand .gz siblings do not land in the source tree
+    work = tempfile.mkdtemp()
+    shutil.copytree(dist, os.path.join(work, "dist"))
+    for label, cls in (("StaticFiles", StaticFiles), ("CachedStaticFiles", CachedStaticFiles)):
+        static = cls(directory=os.path.join(work, "dist"), html=True)
+        if isinstance(static, CachedStaticFiles):
+            static.write_siblings()  # as the app's startup hook does
+        app = Starlette(routes=[Mount("/app", static)])
+        with TestClient(app) as client:
+            load(client, {})  # warm-up
+            cold = load(client, {})
+            cache: dict = {}
+            load(client, cache)
+            warm = load(client, cache)
+        report(f"{label} cold", *cold[:3])
+        report(f"{label} repeat visit", *warm[:3])
+    shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
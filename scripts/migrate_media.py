@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Move legacy flat media files (`media/job{id}_item{id}_{ts}.ext`) into the
+content-addressed store and repoint `checklist_items.photo_path`.
+
+Idempotent and resumable: items already pointing at the store are skipped.
+
+    python scripts/migrate_media.py [--keep] [--delete-unreferenced] [--batch 500]
+"""
+from __future__ import annotations
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app import models  # noqa: E402
+from app.services.media_store import (  # noqa: E402
+    MEDIA_STORE, MEDIA_URL_PREFIX, ROOT_DIR, SHARDED_PATH, MediaStore, attach_photo, rebuild_refcounts, safe_ext,
+)
+
+# Older builds wrote uploads under app/media by mistake; look there too
+LEGACY_DIRS = [MEDIA_STORE.root, os.path.join(ROOT_DIR, "app", "media")]
+
+
+def find_legacy(rel: str):
+    for d in LEGACY_DIRS:
+        p = os.path.join(d, rel)
+        if os.path.isfile(p):
+            return p
+    return None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--keep", action="store_true", help="keep legacy files after migrating")
+    ap.add_argument("--delete-unreferenced", action="store_true", help="delete legacy flat files no item points at")
+    ap.add_argument("--batch", type=int, default=500)
+    args = ap.parse_args()
+
+    init_db()
+    MEDIA_STORE.ensure_root()
+    db = SessionLocal()
+    migrated = missing = 0
+    migrated_sources: list[str] = []
+    try:
+        last_id = 0
+        while True:
+            items = (
+                db.query(models.ChecklistItem)
+                .filter(models.ChecklistItem.id > last_id, models.ChecklistItem.photo_path.like(MEDIA_URL_PREFIX + "%"))
+                .order_by(models.ChecklistItem.id.asc())
+                .limit(args.batch)
+                .all()
+            )
+            if not items:
+                break
+            for item in items:
+                last_id = item.id
+                rel = MediaStore.rel_from_url(item.photo_path)
+                if SHARDED_PATH.match(rel):
+                    continue
+                src = find_legacy(rel)
+                if src is None:
+                    missing += 1
+                    print(f"missing file for item {item.id}: {item.photo_path}")
+                    continue
+                with open(src, "rb") as f:
+                    staged = MEDIA_STORE.stage(f)
+                new_rel = attach_photo(db, item, staged, safe_ext(src))
+                MEDIA_STORE.publish(staged, new_rel)
+                migrated_sources.append(src)
+                migrated += 1
+            db.commit()
+            if not args.keep:
+                for src in migrated_sources:
+                    os.unlink(src)
+            migrated_sources.clear()
+        rebuild_refcounts(db)
+
+        removed = 0
+        if args.delete_unreferenced:
+            for d in LEGACY_DIRS:
+                if not os.path.isdir(d):
+                    continue
+                for entry in os.scandir(d):
+                    if not entry.is_file() or entry.name.startswith("."):
+                        continue
+                    url = MEDIA_URL_PREFIX + entry.name
+                    if not db.query(models.ChecklistItem.id).filter(models.ChecklistItem.photo_path == url).first():
+                        os.unlink(entry.path)
+                        removed += 1
+        print(f"migrated={migrated} missing={missing} removed_unreferenced={removed}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Write .gz (and .br when the `brotli` package is installed) siblings for static
+assets so the server never compresses on the request path.
+
+    python scripts/precompress_static.py frontend/dist ui
+"""
+from __future__ import annotations
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.static_assets import precompress_dir  # noqa: E402
+
+
+def main(dirs: list[str]) -> None:
+    total = sum(precompress_dir(d) for d in dirs)
+    print(f"Wrote {total} compressed files")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or ["frontend/dist", "ui"])
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Move hosts between shards (SHARDS > 0, see app/sharding.py).
+
+    python scripts/rebalance_shard.py                  # hosts and jobs per shard
+    python scripts/rebalance_shard.py --host 12 --to 3 # move one host
+    python scripts/rebalance_shard.py --drain 2        # move every host off shard 2
+
+Safe while the app is running: each move holds the write lock on the source,
+target and catalog for its copy, and requests still routed to the old shard
+get a 503 and retry. Drain a shard before lowering SHARDS.
+"""
+from __future__ import annotations
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app import models  # noqa: E402
+from app.sharding import SHARDS, move_host, placements  # noqa: E402
+
+
+def show() -> None:
+    for shard, counts in placements().items():
+        print(f"shard {shard}{' (catalog)' if shard == 0 else '':10} hosts={counts['hosts']:6d} jobs={counts['jobs']:9d}")
+
+
+def move(host_id: int, target: int) -> int:
+    """Returns the jobs moved."""
+    t0 = time.perf_counter()
+    try:
+        moved = move_host(host_id, target)
+    except ValueError as exc:
+        sys.exit(str(exc))
+    if not moved:
+        print(f"host {host_id} already on shard {target}")
+        return 0
+    detail = " ".join(f"{table}={n}" for table, n in moved.items())
+    print(f"host {host_id} -> shard {target} in {(time.perf_counter() - t0) * 1000:.0f}ms: {detail}")
+    return moved["cleaning_jobs"]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", type=int)
+    ap.add_argument("--to", type=int, help="target shard")
+    ap.add_argument("--drain", type=int, metavar="SHARD", help="move every host off this shard")
+    args = ap.parse_args()
+    if not SHARDS:
+        sys.exit("Sharding is off (set SHARDS)")
+    init_db()
+    if args.host is not None:
+        if args.to is None:
+            sys.exit("--host needs --to")
+        move(args.host, args.to)
+    elif args.drain is not None:
+        db = SessionLocal()
+        try:
+            hosts = [h for (h,) in db.query(models.Host.id).filter(models.Host.shard == args.drain).order_by(models.Host.id)]
+        finally:
+            db.close()
+        jobs = {k: c["jobs"] for k, c in placements().items() if k not in (0, args.drain)}
+        if not jobs:
+            sys.exit("No other shard to move to")
+        for host_id in hosts:
+            # Refill the emptiest remaining shard each time
+            target = min(jobs, key=jobs.get)
+            jobs[target] += move(host_id, target)
+    show()
+
+
+if __name__ == "__main__":
+    main()
@@ -30,7 +30,7 @@ def main():
         # Job + checklist
         s = datetime.utcnow() + timedelta(days=1)
         e = s + timedelta(hours=3)
-        job = models.CleaningJob(property_id=prop.id, booking_start=s, booking_end=e, status=models.JobStatus.open)
+        job = models.CleaningJob(property_id=prop.id, host_id=prop.host_id, booking_start=s, booking_end=e, status=models.JobStatus.open)
         db.add(job); db.flush()
         for text in ['Change linens','Dust surfaces','Mop floors']:
             db.add(models.ChecklistItem(job_id=job.id, text=text))
@@ -0,0 +1,115 @@
+"""
+Dispatch solver checks on small, deterministic instances.
+
+Covers the invariants a pass must keep whatever the scoring does: no cleaner
+is booked into overlapping jobs, the travel buffer holds against both new
+assignments and existing commitments, and each wave's matching is maximum.
+
+    python tests/dispatch.py [--instances 200]
+"""
+from __future__ import annotations
+import argparse
+import copy
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.services.dispatch import (  # noqa: E402
+    DispatchCleaner, DispatchJob, DispatchParams, _match_wave, merge_windows, solve,
+)
+
+HOUR = 3600.0
+
+
+def max_matching(adj: list[list[tuple[float, int]]]) -> int:
+    """Reference maximum matching size (simple augmenting paths)."""
+    owner: dict[int, int] = {}
+
+    def augment(j: int, seen: set[int]) -> bool:
+        for _, c in adj[j]:
+            if c not in seen:
+                seen.add(c)
+                if c not in owner or augment(owner[c], seen):
+                    owner[c] = j
+                    return True
+        return False
+
+    return sum(augment(j, set()) for j in range(len(adj)))
+
+
+def check_known_instance() -> None:
+    # Greedy by score gives both jobs' favourite (cleaner 0) to job 0 and
+    # leaves job 1 empty; the maximum matching moves job 0 to cleaner 1.
+    assert _match_wave([[(5.0, 0), (1.0, 1)], [(4.0, 0)]]) == [1, 0]
+    # Three jobs, two usable cleaners: two matched, whatever the order
+    got = _match_wave([[(3.0, 0)], [(2.0, 0), (1.0, 1)], [(5.0, 1)]])
+    assert sum(c is not None for c in got) == 2 and len({c for c in got if c is not None}) == 2, got
+
+    # Same shape end to end. X is free for both overlapping jobs, Y only for A
+    # because of a commitment at 12:30; an hour of buffer rules Y out of A too.
+    a = DispatchJob(1, 10 * HOUR, 12 * HOUR)
+    b = DispatchJob(2, 11 * HOUR, 14 * HOUR)
+    x = DispatchCleaner(10, rating=5.0)
+    y = DispatchCleaner(20, rating=2.0)
+    y.add_busy(12.5 * HOUR, 13.5 * HOUR)
+    got = solve([a, b], copy.deepcopy([x, y]), DispatchParams(buffer=0))
+    assert sorted(got) == [(1, 20), (2, 10)], got
+    got = solve([a, b], copy.deepcopy([x, y]), DispatchParams(buffer=HOUR))
+    assert len(got) == 1 and got[0][1] == 10, got
+
+
+def check_random_waves(rng: random.Random, instances: int) -> None:
+    for _ in range(instances):
+        jobs, cleaners = rng.randint(1, 7), rng.randint(1, 6)
+        adj = [[(rng.random(), c) for c in rng.sample(range(cleaners), rng.randint(0, cleaners))] for _ in range(jobs)]
+        got = _match_wave(adj)
+        used = [c for c in got if c is not None]
+        assert len(used) == len(set(used)), (adj, got)
+        assert all(c is None or c in {e for _, e in adj[j]} for j, c in enumerate(got)), (adj, got)
+        assert len(used) == max_matching(adj), (adj, got)
+
+
+def check_random_solves(rng: random.Random, instances: int) -> None:
+    for _ in range(instances):
+        buffer = rng.choice([0.0, 0.5 * HOUR, 1.0 * HOUR])
+        jobs = []
+        for i in range(rng.randint(1, 30)):
+            start = rng.randrange(0, 48) * 0.5 * HOUR
+            jobs.append(DispatchJob(i, start, start + rng.choice([1, 2, 3, 4]) * HOUR))
+        cleaners = []
+        for i in range(rng.randint(1, 8)):
+            starts = [rng.randrange(0, 48) * 0.5 * HOUR for _ in range(rng.randint(0, 3))]
+            busy_starts, busy_ends = merge_windows([(s, s + HOUR) for s in starts])
+            cleaners.append(DispatchCleaner(100 + i, rng.uniform(1, 5), busy_starts=busy_starts, busy_ends=busy_ends))
+        before = {c.id: list(zip(c.busy_starts, c.busy_ends)) for c in cleaners}
+        got = solve(jobs, cleaners, DispatchParams(buffer=buffer))
+
+        by_id = {j.id: j for j in jobs}
+        assert len({j for j, _ in got}) == len(got), got
+        booked: dict[int, list[tuple[float, float]]] = {}
+        for job_id, cleaner_id in got:
+            booked.setdefault(cleaner_id, []).append((by_id[job_id].start, by_id[job_id].end))
+        for cleaner_id, windows in booked.items():
+            windows.sort()
+            for (_, e1), (s2, _) in zip(windows, windows[1:]):
+                assert e1 + buffer <= s2, (cleaner_id, windows, buffer)
+            for s, e in windows:
+                for bs, be in before[cleaner_id]:
+                    assert e + buffer <= bs or be + buffer <= s, (cleaner_id, (s, e), (bs, be), buffer)
+
+
+def run(instances: int = 200, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    check_known_instance()
+    check_random_waves(rng, instances)
+    check_random_solves(rng, instances)
+    return "OK"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--instances", type=int, default=200, help="random instances per check")
+    args = ap.parse_args()
+    print(run(args.instances))
@@ -0,0 +1,254 @@
+"""
+Query-plan regression check.
+
+Runs a scripted workflow against a generated, realistically sized database,
+captures every SQL statement each endpoint issues, runs EXPLAIN QUERY PLAN on
+it and fails if a plan contains a full-table SCAN or a temp B-tree for
+ORDER BY that is not in ALLOWLIST. Prints a per-endpoint report of plans and
+timings (``--report`` also writes it as JSON).
+
+    python tests/query_plans.py [--jobs 100000] [--report plans.json]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from io import BytesIO
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+_tmp = tempfile.mkdtemp()
+os.environ["CLEANING_DB_PATH"] = os.path.join(_tmp, "plans.db")
+os.environ.setdefault("MEDIA_DIR", os.path.join(_tmp, "media"))
+os.environ["ADMISSION_ENABLED"] = "false"
+# Outbox delivery runs only when the workflow asks for it, and everything is due at once
+os.environ["OUTBOX_INTERVAL_SECONDS"] = "0"
+os.environ["OUTBOX_COALESCE_SECONDS"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from starlette.routing import Match  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.database import DB_PATH, engine, init_db, request_scope  # noqa: E402
+from app.routers.auth import create_access_token  # noqa: E402
+
+
+# (endpoint, regex on the plan line) -> why it is acceptable
+ALLOWLIST = {
+    ("GET /jobs/me", r"^SCAN cleaning_jobs USING INDEX ix_cleaning_jobs_created_at$"):
+        "admin listing walks the created_at index newest-first and stops at LIMIT",
+    ("GET /properties/mine", r"^SCAN properties$"):
+        "admin listing has no filter or order; SCAN stops at LIMIT",
+    ("GET /admin/outbox", r"^SCAN notification_outbox USING INDEX ix_notification_outbox_due$"):
+        "backlog count walks the partial index, which holds pending messages only",
+    ("background", r"^SCAN checklist_items USING INDEX ix_checklist_items_photo_pending$"):
+        "photo sweep walks the partial index, which holds pending photos only",
+}
+BAD_PLAN = re.compile(r"^SCAN |USE TEMP B-TREE FOR ORDER BY")
+SKIP_SQL = re.compile(r"^\s*(PRAGMA|BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|CREATE|ANALYZE)\b", re.I)
+
+
+def generate(n_jobs: int, seed: int = 7) -> dict:
+    """Bulk-load a database shaped like production: a long tail of small hosts
+    plus one large host, ~3 checklist items per job, ratings on completed jobs."""
+    init_db()
+    rnd = random.Random(seed)
+    n_hosts, n_cleaners = max(10, n_jobs // 400), max(10, n_jobs // 100)
+    n_props = n_hosts * 10
+    now = datetime.utcnow()
+    con = sqlite3.connect(DB_PATH)
+    cur = con.cursor()
+    cur.executemany(
+        "INSERT INTO users (id, email, password_hash, role, created_at) VALUES (?, ?, 'x', ?, ?)",
+        [(i, f"gen{i}@local", "host" if i <= n_hosts else "cleaner", now) for i in range(1, n_hosts + n_cleaners + 1)],
+    )
+    cur.executemany("INSERT INTO hosts (id, user_id, name) VALUES (?, ?, ?)", [(i, i, f"Host {i}") for i in range(1, n_hosts + 1)])
+    cur.executemany(
+        "INSERT INTO cleaners (id, user_id, name, avg_rating, ratings_count) VALUES (?, ?, ?, 0, 0)",
+        [(i, n_hosts + i, f"Cleaner {i}") for i in range(1, n_cleaners + 1)],
+    )
+    # Host 1 is the "large host": a fifth of all properties
+    big = n_props // 5
+    prop_host = {i: 1 if i <= big else rnd.randint(2, n_hosts) for i in range(1, n_props + 1)}
+    cur.executemany(
+        "INSERT INTO properties (id, host_id, name, address) VALUES (?, ?, ?, ?)",
+        [(i, h, f"Prop {i}", f"{i} Main St") for i, h in prop_host.items()],
+    )
+    jobs, items, ratings = [], [], []
+    statuses = ["open", "claimed", "in_progress", "completed", "completed", "completed"]
+    item_id = 1
+    for j in range(1, n_jobs + 1):
+        start = now + timedelta(hours=rnd.randint(-24 * 365, 24 * 60))
+        status = rnd.choice(statuses)
+        cleaner = None if status == "open" else rnd.randint(1, n_cleaners)
+        created = start - timedelta(days=rnd.randint(1, 30))
+        prop = rnd.randint(1, n_props)
+        jobs.append((j, prop, prop_host[prop], start, start + timedelta(hours=3), status, cleaner, created,
+                     start + timedelta(hours=4) if status == "completed" else None))
+        for t in ("Change linens", "Dust surfaces", "Mop floors"):
+            items.append((item_id, j, t, status == "completed"))
+            item_id += 1
+        if status == "completed" and rnd.random() < 0.7:
+            ratings.append((j, j, 1, cleaner, rnd.randint(1, 5), created))
+    cur.executemany(
+        "INSERT INTO cleaning_jobs (id, property_id, host_id, booking_start, booking_end, status, cleaner_id, created_at, completed_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", jobs)
+    cur.executemany("INSERT INTO checklist_items (id, job_id, text, checked) VALUES (?, ?, ?, ?)", items)
+    cur.executemany("INSERT INTO ratings (id, job_id, host_id, cleaner_id, stars, created_at) VALUES (?, ?, ?, ?, ?, ?)", ratings)
+    con.commit()
+    cur.execute("ANALYZE")
+    con.commit()
+    con.close()
+    return {"large_host_user_id": 1, "cleaner_user_id": n_hosts + 1}
+
+
+class Capture:
+    def __init__(self) -> None:
+        self.endpoint = "startup"
+        self.statements: dict[str, list[tuple[str, tuple]]] = defaultdict(list)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if not SKIP_SQL.match(statement):
+            if executemany and parameters and isinstance(parameters[0], (tuple, list)):
+                parameters = parameters[0]
+            # Scheduler ticks and pipeline workers run outside any request
+            endpoint = self.endpoint if self.endpoint == "startup" or request_scope.get() is not None else "background"
+            self.statements[endpoint].append((statement, tuple(parameters or ())))
+
+
+def endpoint_label(method: str, path: str) -> str:
+    scope = {"type": "http", "path": path.split("?")[0], "method": method}
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{method} {getattr(route, 'path', path)}"
+    return f"{method} {path}"
+
+
+def workflow(client: TestClient, cap: Capture, ids: dict) -> None:
+    def call(method: str, url: str, token: str, **kw):
+        cap.endpoint = endpoint_label(method, url)
+        r = client.request(method, url, headers={"Authorization": f"Bearer {token}"}, **kw)
+        assert r.status_code < 400, (method, url, r.status_code, r.text)
+        return r.json() if r.headers.get("content-type", "").startswith("application/json") else r.text
+
+    ts = int(time.time())
+    cap.endpoint = "POST /auth/register"
+    host = client.post("/auth/register", json={"email": f"qp-host{ts}@example.com", "password": "secret123", "role": "host"}).json()["token"]
+    cleaner = client.post("/auth/register", json={"email": f"qp-cleaner{ts}@example.com", "password": "secret123", "role": "cleaner"}).json()["token"]
+    admin = client.post("/auth/register", json={"email": f"qp-admin{ts}@example.com", "password": "secret123", "role": "admin"}).json()["token"]
+    big_host = create_access_token({"sub": str(ids["large_host_user_id"]), "role": "host"})
+    busy_cleaner = create_access_token({"sub": str(ids["cleaner_user_id"]), "role": "cleaner"})
+
+    prop = call("POST", "/properties/", host, json={"name": "QP Flat", "address": "1 Plan St"})
+    start = datetime.utcnow() + timedelta(days=2)
+    job = call("POST", "/jobs/", host, json={
+        "property_id": prop["id"], "booking_start": start.isoformat(), "booking_end": (start + timedelta(hours=3)).isoformat(),
+        "checklist": [{"text": "Change linens"}, {"text": "Dust surfaces"}],
+    })
+    call("GET", "/jobs/open", cleaner)
+    call("GET", "/jobs/open?offset=50", cleaner)
+    call("POST", f"/jobs/{job['id']}/claim", cleaner)
+    call("GET", "/jobs/me", cleaner)
+    call("GET", "/jobs/me", busy_cleaner)
+    call("GET", "/cleaners/me/availability", busy_cleaner)
+    call("GET", "/jobs/me", host)
+    call("GET", "/jobs/me", big_host)
+    call("GET", "/jobs/me", admin)
+    call("GET", f"/jobs/{job['id']}", host)
+    item_ids = [it["id"] for it in job["checklist_items"]]
+    call("POST", f"/jobs/{job['id']}/checklist/tick", cleaner, json={"item_ids": item_ids})
+    call("POST", f"/jobs/{job['id']}/checklist/{item_ids[0]}/photo", cleaner,
+         files={"file": ("evidence.png", BytesIO(b"\x89PNG\r\n\x1a\n\x00qp" + str(ts).encode()), "image/png")})
+    call("POST", f"/jobs/{job['id']}/complete", cleaner)
+    call("POST", f"/jobs/{job['id']}/rating", host, json={"stars": 5})
+    call("GET", "/properties/mine", host)
+    call("GET", "/properties/mine", big_host)
+    call("GET", "/properties/mine", admin)
+    call("GET", f"/properties/{prop['id']}", host)
+    call("GET", f"/properties/{prop['id']}/bookings", host)
+    call("POST", "/batch", big_host, json={"requests": [
+        {"path": "/properties/mine"}, {"path": "/properties/1"}, {"path": "/jobs/me"}, {"path": f"/jobs/{job['id']}"},
+    ]})
+    call("GET", "/exports/jobs?after_id=10", big_host)
+    call("GET", f"/exports/jobs?format=ndjson&start={start.date()}", admin)
+    call("POST", "/admin/outbox/drain", admin)
+    call("GET", "/admin/outbox", admin)
+    call("POST", "/admin/payouts?dry_run=true", admin)
+    run_id = call("POST", "/admin/payouts", admin)["run_id"]
+    call("POST", f"/admin/payouts/{run_id}/pay", admin)
+    call("GET", f"/admin/payouts/{run_id}", admin)
+
+
+def explain(con: sqlite3.Connection, statement: str, params: tuple) -> tuple[list[str], float | None]:
+    plan = [row[3] for row in con.execute("EXPLAIN QUERY PLAN " + statement, params)]
+    elapsed = None
+    if statement.lstrip().upper().startswith("SELECT"):
+        samples = []
+        for _ in range(3):
+            t0 = time.perf_counter()
+            con.execute(statement, params).fetchall()
+            samples.append(time.perf_counter() - t0)
+        elapsed = statistics.median(samples)
+    return plan, elapsed
+
+
+def allowed(endpoint: str, line: str) -> bool:
+    return any(ep == endpoint and re.search(rx, line) for ep, rx in ALLOWLIST)
+
+
+def run(n_jobs: int = 100_000, report_path: str | None = None) -> str:
+    ids = generate(n_jobs)
+    cap = Capture()
+    event.listen(engine, "before_cursor_execute", cap)
+    try:
+        with TestClient(app) as client:
+            workflow(client, cap, ids)
+    finally:
+        event.remove(engine, "before_cursor_execute", cap)
+
+    con = sqlite3.connect(DB_PATH)
+    report: dict[str, list[dict]] = {}
+    failures = []
+    for endpoint, statements in cap.statements.items():
+        seen = set()
+        entries = report.setdefault(endpoint, [])
+        for statement, params in statements:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            plan, elapsed = explain(con, statement, params)
+            bad = [line for line in plan if BAD_PLAN.search(line) and not allowed(endpoint, line)]
+            entries.append({"sql": " ".join(statement.split()), "plan": plan, "ms": None if elapsed is None else elapsed * 1000, "violations": bad})
+            failures.extend((endpoint, line, statement) for line in bad)
+    con.close()
+
+    for endpoint, entries in report.items():
+        print(f"== {endpoint}")
+        for e in entries:
+            timing = "   write" if e["ms"] is None else f"{e['ms']:7.2f}ms"
+            print(f"  {timing}  {e['sql'][:110]}")
+            for line in e["plan"]:
+                print(f"             {'!! ' if line in e['violations'] else '   '}{line}")
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+    assert not failures, "Query plan regressions:\n" + "\n".join(f"{ep}: {line}\n    {sql}" for ep, line, sql in failures)
+    return "OK"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=100_000, help="number of generated cleaning jobs")
+    ap.add_argument("--report", help="write the per-endpoint report as JSON")
+    args = ap.parse_args()
+    print(run(args.jobs, args.report))
@@ -1,13 +1,23 @@
 from __future__ import annotations
 from io import BytesIO
 from datetime import datetime, timedelta
+import json
+import logging
+import tempfile
+import time
 
 from fastapi.testclient import TestClient
+from sqlalchemy import text
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+os.environ.setdefault("PROFILE_DIR", tempfile.mkdtemp())
+from app import database
 from app.main import app
-
-
+from app.services.admission import ADMISSION, ConcurrencyLimiter, RateLimiter
+from app.services.notifications import OUTBOX_LEASE, FileTransport, claim_due, drain
+from app.services.photos import PHOTOS
+from app import models
+from app.sharding import SHARDS, locate, move_host, session, shard_ids
 
 
 def auth_headers(token: str):
@@ -17,7 +27,7 @@ def auth_headers(token: str):
 def run():
     with TestClient(app) as client:
         # Register users
-        ts = __import__('time').time()
+        ts = time.time()
         host_email = f"host+{int(ts)}@example.com"
         cleaner_email = f"cleaner+{int(ts)}@example.com"
         r = client.post("/auth/register", json={"email": host_email, "password": "secret123", "role": "host", "name": "Host A"})
@@ -50,6 +60,20 @@ def run():
         assert r.status_code == 200 and len(r.json()) >= 1
         r = client.post(f"/jobs/{job['id']}/claim", headers=auth_headers(cleaner_token))
         assert r.status_code == 200, r.text
+        r = client.post(f"/jobs/{job['id']}/claim", headers=auth_headers(cleaner_token))
+        assert r.status_code == 400, r.text
+
+        # Overlapping second job is rejected; availability skips the claimed window.
+        # Posted as JS toISOString() sends it ("...Z"): stored as the same naive UTC
+        r = client.post("/jobs/", json={"property_id": prop["id"], "booking_start": start + "Z", "booking_end": end + "Z"}, headers=auth_headers(host_token))
+        assert r.status_code == 200 and r.json()["booking_start"] == job["booking_start"], r.text
+        r = client.post(f"/jobs/{r.json()['id']}/claim", headers=auth_headers(cleaner_token))
+        assert r.status_code == 409, r.text
+        r = client.get("/cleaners/me/availability", headers=auth_headers(cleaner_token))
+        assert r.status_code == 200, r.text
+        assert all(not (s["start"] < end and start < s["end"]) for s in r.json()), r.json()
+        r = client.get("/cleaners/me/availability", params={"start": datetime.utcnow().isoformat() + "Z"}, headers=auth_headers(cleaner_token))
+        assert r.status_code == 200 and all(not (s["start"] < end and start < s["end"]) for s in r.json()), r.text
 
         # Tick checklist
         item_ids = [it["id"] for it in job["checklist_items"]]
@@ -61,15 +85,192 @@ def run():
         files = {"file": ("evidence.png", img_bytes, "image/png")}
         r = client.post(f"/jobs/{job['id']}/checklist/{item_ids[0]}/photo", files=files, headers=auth_headers(cleaner_token))
         assert r.status_code == 200, r.text
+        photo_path = r.json()["photo_path"]
 
-        # Mark complete
+        # Identical bytes dedup onto the same content-addressed file
+        files = {"file": ("retry.png", BytesIO(b"\x89PNG\r\n\x1a\n\x00fake"), "image/png")}
+        r = client.post(f"/jobs/{job['id']}/checklist/{item_ids[1]}/photo", files=files, headers=auth_headers(cleaner_token))
+        assert r.status_code == 200 and r.json()["photo_path"] == photo_path, r.text
+        r = client.get(photo_path, headers={"Range": "bytes=0-3"})
+        assert r.status_code == 206 and r.content == b"\x89PNG", r.status_code
+        assert "immutable" in r.headers["cache-control"]
+
+        # Background variants: until rendered, clients fall back to the original
+        if PHOTOS.enabled:
+            from PIL import Image
+            photo = BytesIO()
+            exif = Image.Exif()
+            exif[0x0112] = 6  # rotated 90° on camera
+            exif[0x8825] = {1: "N", 2: (51.0, 30.0, 0.0)}  # GPS
+            Image.new("RGB", (1200, 900), (200, 120, 40)).save(photo, "JPEG", exif=exif)
+            files = {"file": ("phone.jpg", BytesIO(photo.getvalue()), "image/jpeg")}
+            r = client.post(f"/jobs/{job['id']}/checklist/{item_ids[1]}/photo", files=files, headers=auth_headers(cleaner_token))
+            assert r.status_code == 200 and r.json()["photo_thumb_path"] == r.json()["photo_path"], r.text
+            deadline = time.time() + 60
+            while True:
+                items = {it["id"]: it for it in client.get(f"/jobs/{job['id']}", headers=auth_headers(host_token)).json()["checklist_items"]}
+                if items[item_ids[1]]["photo_status"] != "pending" or time.time() > deadline:
+                    break
+                time.sleep(0.25)
+            item = items[item_ids[1]]
+            assert item["photo_status"] == "ready" and (item["photo_width"], item["photo_height"]) == (900, 1200), item
+            # The stored original keeps its pixels and orientation, but not the GPS position
+            original = client.get(item["photo_path"]).content
+            assert item["photo_size"] == len(original) < len(photo.getvalue()), item
+            assert dict(Image.open(BytesIO(original)).getexif()) == {0x0112: 6}
+            assert Image.open(BytesIO(original)).tobytes() == Image.open(photo).tobytes()
+            thumb = Image.open(BytesIO(client.get(item["photo_thumb_path"]).content))
+            assert thumb.size == (240, 320) and not thumb.getexif(), (thumb.size, dict(thumb.getexif()))
+            assert items[item_ids[0]]["photo_status"] == "failed" and items[item_ids[0]]["photo_web_path"] == photo_path, items
+
+        # Mark complete, once: a second complete cannot move it into another pay period
+        before = datetime.utcnow()
         r = client.post(f"/jobs/{job['id']}/complete", headers=auth_headers(cleaner_token))
         assert r.status_code == 200, r.text
+        after = datetime.utcnow()
+        r = client.post(f"/jobs/{job['id']}/complete", headers=auth_headers(cleaner_token))
+        assert r.status_code == 400, r.text
+        r = client.post("/auth/register", json={"email": f"admin+{int(ts)}@example.com", "password": "secret123", "role": "admin"})
+        assert r.status_code == 200, r.text
+        admin_token = r.json()["token"]
+        ledgers = []
+        # The first period in UTC with "Z", as a browser would send it
+        for start_at, end_at in ((before.isoformat() + "Z", after.isoformat() + "Z"), (after.isoformat(), datetime.utcnow().isoformat())):
+            r = client.post("/admin/payouts", params={"start": start_at, "end": end_at}, headers=auth_headers(admin_token))
+            assert r.status_code == 200, r.text
+            ledgers.append(r.json()["jobs"])
+        assert ledgers == [1, 0], ledgers
+        r = client.post("/admin/payouts", params={"start": after.isoformat() + "Z", "end": (after + timedelta(days=7)).isoformat() + "+02:00"}, headers=auth_headers(admin_token))
+        assert r.status_code == 400, r.text
+
+        # Profiling is for admins only; anyone else gets the plain response
+        assert client.get("/admin/profiles", headers=auth_headers(host_token)).status_code == 403
+        r = client.get("/properties/mine?profile=1", headers=auth_headers(host_token))
+        assert r.status_code == 200 and "X-Profile-Id" not in r.headers, r.headers
+        for _ in range(10):  # until the sampler (every PROFILE_INTERVAL_MS) lands a sample
+            r = client.get("/properties/mine", headers={**auth_headers(admin_token), "X-Profile": "1"})
+            assert r.status_code == 200 and r.headers["X-Profile-Url"] == f"/admin/profiles/{r.headers['X-Profile-Id']}", r.headers
+            profile = client.get(r.headers["X-Profile-Url"], headers=auth_headers(admin_token)).json()
+            if profile["samples"]:
+                break
+        assert profile["route"] == "GET /properties/mine" and profile["sql"]["count"] >= 1, profile
+        assert profile["top_cumulative"] and profile["folded"], profile
+        assert profile["id"] in {p["id"] for p in client.get("/admin/profiles", headers=auth_headers(admin_token)).json()}
+
+        # Slow-query log: route label and parameter shapes, never values
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        slow_ms, database.SLOW_QUERY_MS = database.SLOW_QUERY_MS, 1e-9
+        database.slow_query_log.addHandler(handler)
+        try:
+            assert client.get("/properties/mine", headers=auth_headers(host_token)).status_code == 200
+        finally:
+            database.SLOW_QUERY_MS = slow_ms
+            database.slow_query_log.removeHandler(handler)
+        logged = [rec.getMessage() for rec in records]
+        assert any("route=GET /properties/mine" in m and "FROM properties" in m for m in logged), logged
+        assert not any(host_email in m for m in logged), logged
 
         # Host rates
         r = client.post(f"/jobs/{job['id']}/rating", json={"stars": 5, "feedback": "Great work!"}, headers=auth_headers(host_token))
         assert r.status_code == 200, r.text
 
+        # Streaming export, resumed after the first job
+        r = client.get(f"/exports/jobs?format=ndjson&after_id={job['id'] - 1}", headers=auth_headers(host_token))
+        assert r.status_code == 200, r.text
+        first = json.loads(r.text.splitlines()[0])
+        assert first["job_id"] == job["id"] and first["rating_stars"] == 5 and len(first["checklist"]) == 2, first
+
+        # Host dashboard in one round trip; bad sub-requests fail on their own
+        r = client.post("/batch", json={"requests": [
+            {"id": "props", "path": "/properties/mine"},
+            {"id": "prop", "path": f"/properties/{prop['id']}"},
+            {"id": "bookings", "path": f"/properties/{prop['id']}/bookings"},
+            {"id": "jobs", "path": "/jobs/me?limit=10"},
+            {"id": "job", "path": f"/jobs/{job['id']}"},
+            {"id": "missing", "path": "/jobs/999999999"},
+            {"id": "write", "method": "POST", "path": f"/jobs/{job['id']}/complete"},
+        ]}, headers=auth_headers(host_token))
+        assert r.status_code == 200, r.text
+        got = {s["id"]: s for s in r.json()["responses"]}
+        assert got["props"]["body"][0]["id"] == prop["id"] and got["prop"]["body"] == prop, got
+        assert len(got["bookings"]["body"]) == 2 and got["job"]["body"]["status"] == "completed", got
+        assert got["missing"]["status"] == 404 and got["write"]["status"] == 405, got
+
+        # Outbox: the host's four notifications coalesce into one digest
+        sink = os.path.join(tempfile.mkdtemp(), "outbox.jsonl")
+        later = datetime.utcnow() + timedelta(minutes=5)
+        # A claim leases its messages: another drainer (worker or replica) finds
+        # nothing, and if the claimer dies they are sent once the lease runs out
+        for shard in shard_ids():
+            db = session(shard)
+            try:
+                claim_due(db, later)
+                assert claim_due(db, later) == ([], False)
+            finally:
+                db.close()
+        client.portal.call(lambda: drain(FileTransport(sink), later))
+        assert not os.path.exists(sink)
+        client.portal.call(lambda: drain(FileTransport(sink), later + OUTBOX_LEASE))
+        with open(sink) as f:
+            digests = {d["to"]: d for d in map(json.loads, f)}
+        assert digests[host_email]["messages"] == 4, digests[host_email]
+        assert digests[cleaner_email]["subject"] == "New rating", digests[cleaner_email]
+
+        # Admission: a two-token bucket admits two reads, then answers 429 with
+        # Retry-After; a full read pool sheds with 503
+        limiter, concurrency = ADMISSION.user_limiter, ADMISSION.concurrency
+        ADMISSION.user_limiter = RateLimiter(rate=0.5, burst=2)
+        ADMISSION.concurrency = ConcurrencyLimiter(max_reads=1, max_writes=1)
+        try:
+            for _ in range(2):
+                assert client.get("/properties/mine", headers=auth_headers(host_token)).status_code == 200
+            r = client.get("/properties/mine", headers=auth_headers(host_token))
+            assert r.status_code == 429 and int(r.headers["Retry-After"]) >= 1, r.text
+            assert r.json()["error"]["code"] == 429, r.text
+            ADMISSION.user_limiter.reset()
+            assert ADMISSION.concurrency.try_enter(False)
+            try:
+                r = client.get("/properties/mine", headers=auth_headers(host_token))
+                assert r.status_code == 503 and r.headers["Retry-After"] == "1", r.text
+            finally:
+                ADMISSION.concurrency.leave(False)
+            assert client.get("/properties/mine", headers=auth_headers(host_token)).status_code == 200
+            # A cost above the burst is admitted from a full bucket and leaves a
+            # debt: the next request waits for it to refill past one token
+            assert ADMISSION.user_limiter.acquire("user:debt", cost=5) == 0
+            assert -3 <= ADMISSION.user_limiter._buckets["user:debt"].tokens < -2.9
+            assert ADMISSION.user_limiter.acquire("user:debt") > 7.9
+        finally:
+            ADMISSION.user_limiter, ADMISSION.concurrency = limiter, concurrency
+
+        # Rebalancing: every row of the host lands on the target shard and leaves the source
+        if SHARDS:
+            source, host_id = locate(models.Property.__table__, prop["id"])
+            target = source % SHARDS + 1
+            counts = {
+                "properties": "host_id = :h", "cleaning_jobs": "host_id = :h",
+                "checklist_items": "job_id IN (SELECT id FROM cleaning_jobs WHERE host_id = :h)",
+                "ratings": "job_id IN (SELECT id FROM cleaning_jobs WHERE host_id = :h)",
+            }
+
+            def rows(shard):
+                db = session(shard)
+                try:
+                    return {t: db.execute(text(f"SELECT COUNT(*) FROM {t} WHERE {w}"), {"h": host_id}).scalar() for t, w in counts.items()}
+                finally:
+                    db.close()
+
+            before = rows(source)
+            assert before["properties"] == 1 and before["cleaning_jobs"] == 2 and before["ratings"] == 1, before
+            moved = move_host(host_id, target)
+            assert all(moved[t] == n for t, n in before.items()), moved
+            assert rows(target) == before and not any(rows(source).values()), (rows(source), rows(target))
+            assert locate(models.Property.__table__, prop["id"]) == (target, host_id)
+            r = client.get(f"/jobs/{job['id']}", headers=auth_headers(host_token))
+            assert r.status_code == 200 and len(r.json()["checklist_items"]) == 2, r.text
+
         return "OK"
 
 
@@ -0,0 +1,76 @@
+"""
+Static asset serving checks: precompressed gzip negotiation, cache headers for
+hashed and unhashed files, ETag revalidation and byte ranges.
+
+    python tests/static_assets.py
+"""
+from __future__ import annotations
+import gzip
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.routing import Mount  # noqa: E402
+
+from app.services.static_assets import IMMUTABLE_CACHE, REVALIDATE_CACHE, CachedStaticFiles  # noqa: E402
+
+INDEX = b"<!doctype html><title>x</title>" + b"<p>cleaning</p>" * 200
+BUNDLE = b"export const x = 1;\n" * 500
+HASHED = "assets/index-DmYZc8iH.js"
+
+
+def run() -> str:
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, "assets"))
+    for rel, body in (("index.html", INDEX), (HASHED, BUNDLE)):
+        with open(os.path.join(root, rel), "wb") as f:
+            f.write(body)
+
+    static = CachedStaticFiles(directory=root, html=True)
+    assert not os.path.exists(os.path.join(root, "index.html.gz")), "siblings are written at startup, not construction"
+    assert static.write_siblings() == 2
+    assert static.write_siblings() == 0  # fresh siblings are kept
+    with open(os.path.join(root, HASHED + ".gz"), "rb") as f:
+        assert gzip.decompress(f.read()) == BUNDLE
+
+    with TestClient(Starlette(routes=[Mount("/app", static)])) as client:
+        # gzip when accepted, identity otherwise; both vary on Accept-Encoding
+        r = client.get("/app/" + HASHED, headers={"Accept-Encoding": "gzip"})
+        assert r.status_code == 200 and r.headers["content-encoding"] == "gzip", r.headers
+        assert r.content == BUNDLE and r.headers["vary"] == "Accept-Encoding"
+        assert int(r.headers["content-length"]) < len(BUNDLE)
+        r = client.get("/app/" + HASHED, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in r.headers and r.content == BUNDLE, r.headers
+        r = client.get("/app/" + HASHED, headers={"Accept-Encoding": "gzip;q=0"})
+        assert "content-encoding" not in r.headers, r.headers
+
+        # Hashed build output is immutable; index.html revalidates
+        assert r.headers["cache-control"] == IMMUTABLE_CACHE, r.headers
+        r = client.get("/app/", headers={"Accept-Encoding": "gzip"})
+        assert r.status_code == 200 and r.content == INDEX and r.headers["cache-control"] == REVALIDATE_CACHE, r.headers
+
+        # If-None-Match: 304 for the encoding the ETag came from
+        r2 = client.get("/app/", headers={"Accept-Encoding": "gzip", "If-None-Match": r.headers["etag"]})
+        assert r2.status_code == 304 and not r2.content, r2.status_code
+        r2 = client.get("/app/", headers={"Accept-Encoding": "identity", "If-None-Match": r.headers["etag"]})
+        assert r2.status_code == 200, r2.status_code
+
+        # Single byte ranges on identity responses
+        r = client.get("/app/" + HASHED, headers={"Accept-Encoding": "identity", "Range": "bytes=10-29"})
+        assert r.status_code == 206 and r.content == BUNDLE[10:30], r.status_code
+        assert r.headers["content-range"] == f"bytes 10-29/{len(BUNDLE)}", r.headers
+        r = client.get("/app/" + HASHED, headers={"Accept-Encoding": "identity", "Range": "bytes=-5"})
+        assert r.status_code == 206 and r.content == BUNDLE[-5:], r.status_code
+        r = client.get("/app/" + HASHED, headers={"Accept-Encoding": "identity", "Range": f"bytes={len(BUNDLE)}-"})
+        assert r.status_code == 416, r.status_code
+        r = client.get("/app/" + HASHED, headers={"Accept-Encoding": "identity", "Range": "bytes=0-9", "If-Range": '"stale"'})
+        assert r.status_code == 200 and r.content == BUNDLE, r.status_code
+    return "OK"
+
+
+if __name__ == "__main__":
+    print(run())